@@ -3,63 +3,116 @@ ai_single.py – FINAL stable (pandas 3 fix)
 ──────────────────────────────────────────
 - 使用 NumPy 陣列 + 明確 feature_name
 - 關鍵修正：最後一筆收盤/RSI 改用 .iloc[-1]
+- 拆成 compute（下載＋訓練，LRU 快取）與 evaluate（套門檻）兩階段，
+  調整 /model 門檻不必重新訓練
 """
 from __future__ import annotations
 import datetime, logging, warnings
-import lightgbm as lgb, pandas as pd, yfinance as yf
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
+import pandas as pd, yfinance as yf
+
+from cache import TTLCache
+from history import download_bulk
+from feature_store import FEATURES, HORIZON
+from market_clock import tw_session_date, tw_ttl
+from metrics import timed_fetch
+from model_registry import REGISTRY
+from ohlcv_store import normalize_bars
 
 warnings.filterwarnings("ignore", category=UserWarning)
 logging.getLogger("yfinance").setLevel(logging.CRITICAL)
-TODAY = datetime.date.today()
+_COMPUTED = TTLCache(maxsize=512, name="ai_single")
 
 
-def rsi(s: pd.Series, n: int = 14) -> pd.Series:
-    d = s.diff()
-    gain, loss = d.clip(lower=0), -d.clip(upper=0)
-    return 100 - 100 / (1 + gain.rolling(n).mean() / loss.rolling(n).mean())
+FEATS = ["Close", "Volume", "sma5", "sma20", "rsi14"]
 
 
-def analyze_stock(code: str, prob_thr=0.7, rsi_thr: float | None = 30, years=3):
-    start = TODAY - datetime.timedelta(days=365 * years)
-    df = yf.download(f"{code}.TW", start=start, progress=False, threads=False, auto_adjust=False)
-    if df.empty or len(df) < 200:
+def _features(code: str, raw: pd.DataFrame) -> pd.DataFrame | None:
+    """日 K → 特徵與標籤（取自 feature_store，只計算新的 K 棒）；資料太短時 None"""
+    bars = normalize_bars(raw)  # 攤平 yfinance 的多層欄位
+    if len(bars) < 200:
         return None
+    view = FEATURES.window("ml", f"{code}.TW", bars)
+    df = None if view is None else view.frame()
+    return None if df is None or df.empty else df
 
-    df["sma5"] = df["Close"].rolling(5).mean()
-    df["sma20"] = df["Close"].rolling(20).mean()
-    df["rsi14"] = rsi(df["Close"])
-    df["target"] = (df["Close"].shift(-5) > df["Close"]).astype(int)
-    df = df.dropna()
-    if df.empty:
-        return None
 
-    feats = ["Close", "Volume", "sma5", "sma20", "rsi14"]
-    X, y = df[feats], df["target"]
-    Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.2, shuffle=False)
+def load_dataset(code: str, years: int = 3) -> pd.DataFrame | None:
+    """下載日 K 並計算特徵與標籤（/model 與 /backtest 共用）"""
+    start = datetime.date.today() - datetime.timedelta(days=365 * years)  # 呼叫時才取：子行程由預載的 forkserver 分出
+    with timed_fetch("yfinance"):
+        raw = yf.download(f"{code}.TW", start=start, progress=False, threads=False, auto_adjust=False)
+    return _features(code, raw)
 
-    feat_names = [f"f{i}" for i in range(X.shape[1])]
-    model = lgb.LGBMClassifier(objective="binary", n_estimators=120, learning_rate=0.05)
-    model.fit(Xtr.values, ytr, feature_name=feat_names)
 
-    acc = accuracy_score(yte, model.predict(Xte.values))
-    prob = model.predict_proba(X.iloc[[-1]].values)[0][1]
-    rsi_now = df["rsi14"].iloc[-1]        # ← fix
-    close_now = df["Close"].iloc[-1]      # ← fix
+def load_datasets(codes: list[str], years: int = 3) -> dict[str, pd.DataFrame | None]:
+    """多檔一次批次下載（/model 一次查多檔）→ {代碼: 特徵表 或 None}"""
+    start = datetime.date.today() - datetime.timedelta(days=365 * years)  # 呼叫時才取：子行程由預載的 forkserver 分出
+    frames, _ = download_bulk([f"{c}.TW" for c in codes], start, retries=1)
+    return {c: _features(c, frames.get(f"{c}.TW", pd.DataFrame())) for c in codes}
 
-    passed = (prob >= prob_thr) and (rsi_thr is None or rsi_now < rsi_thr)
+
+def fit(code: str, df: pd.DataFrame) -> dict:
+    """模型預測（與門檻無關）；df 為 load_dataset / load_datasets 的結果"""
+    X, y = df[FEATS], df["target"]
+
+    # 與 /top10 共用模型登錄檔：同日重複查詢只需一次 predict
+    acc, prob = REGISTRY.predict(code, FEATS, df.index.values, X.to_numpy(float), y.to_numpy(int))
     return {
         "code": code,
-        "acc": acc,
-        "prob": prob,
-        "rsi": rsi_now,
-        "close": close_now,
+        "acc": float(acc),
+        "prob": float(prob),
+        "rsi": float(df["rsi14"].iloc[-1]),
+        "close": float(df["Close"].iloc[-1]),
+        "date": df.index[-1].date().isoformat(),
+    }
+
+
+def _compute(code: str, years: int = 3) -> dict | None:
+    """耗時階段：下載 + 特徵 + 模型預測（與門檻無關）"""
+    df = load_dataset(code, years)
+    return None if df is None else fit(code, df)
+
+
+def _key(code: str, years: int) -> tuple:
+    return (code.upper(), years, tw_session_date())
+
+
+def cached(code: str, years: int = 3) -> dict | None:
+    """只查快取，不計算"""
+    return _COMPUTED.get(_key(code, years))
+
+
+def remember(code: str, years: int, res: dict | None) -> None:
+    """寫入快取（子行程算出的結果由父行程呼叫，讓後續查詢不必再派工）"""
+    if res is not None:
+        _COMPUTED.set(_key(code, years), res, ttl=tw_ttl())
+
+
+def compute_stock(code: str, years: int = 3) -> dict | None:
+    """_compute 的快取版：以（代碼, 年數, 交易日）為鍵，盤中 5 分鐘、收盤後到下次開盤"""
+    hit = cached(code, years)
+    if hit is not None:
+        return hit
+    res = _compute(code, years)
+    remember(code, years, res)
+    return res
+
+
+def evaluate(res: dict, prob_thr=0.7, rsi_thr: float | None = 30) -> dict:
+    """便宜階段：只套用門檻"""
+    passed = (res["prob"] >= prob_thr) and (rsi_thr is None or res["rsi"] < rsi_thr)
+    return {
+        **res,
         "pass_": passed,
         "msg": "✅ 符合條件" if passed else "❌ 未達門檻",
     }
 
 
+def analyze_stock(code: str, prob_thr=0.7, rsi_thr: float | None = 30, years=3):
+    res = compute_stock(code, years)
+    return None if res is None else evaluate(res, prob_thr, rsi_thr)
+
+
 if __name__ == "__main__":
     import sys, json
     print(json.dumps(analyze_stock(sys.argv[1] if len(sys.argv) > 1 else "2330"), indent=2, ensure_ascii=False))
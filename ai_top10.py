@@ -2,151 +2,512 @@
 ai_top10.py  – 2025-07-24 修正版
 --------------------------------
 批量掃描台股所有上市櫃股票：
-1. 下載近 3 年日 K 線（Yahoo Finance）
-2. 計算技術指標（RSI14‧SMA5‧SMA20）
+1. 以 universe 載入上市櫃代碼，分批下載近 3 年日 K 線（Yahoo Finance）
+2. 計算技術指標（RSI14‧SMA5‧SMA20）：存於 feature_store，收盤後只補算新的一天
 3. 以 LightGBM 預測「5 日內是否上漲」
 4. 以 test-set 準確率 + 今日預測機率 + RSI < 30
    篩出勝率 Top-10
 5. 回傳 pd.DataFrame，欄位：code, acc, prob, rsi, close
+
+iter_market() 為串流版本：逐批／逐檔產出進度事件，呼叫端可隨時關閉
+generator 中止掃描（排隊中的批次取消、子行程立即結束）
+
+訓練一律在子行程（spawn process pool，nice 降低優先權、取消時終止），不佔 bot 行程：
+ticker 模式依 workers 分批派工、pooled 模式由單一子行程訓練；每批只傳代碼與日期區間，
+子行程直接 memmap 特徵倉庫。LightGBM 執行緒總數不超過 threads（/top10 為佔用的 worker 名額），
+每個子行程 n_jobs = threads / workers
+
+mode（預設 $TOP10_MODE 或 "ticker"）：
+- ticker：每檔各自一個模型（約 1,800 次訓練）
+- pooled：全市場（日期, 股票）列疊成一份資料集，特徵改為無尺度的比值／報酬，
+  每個交易日只訓練一個模型，再以一次批次 predict 為全市場打分
+兩種模式的準確率與耗時可並列比較：
+
+    python ai_top10.py --compare --limit 300
 """
 from __future__ import annotations
 
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
 import warnings
 import logging
 import datetime
-from typing import List
+import heapq
+import signal
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Iterator, List
 
 import lightgbm as lgb
 import numpy as np
 import pandas as pd
-import yfinance as yf
-import twstock
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
+
+from history import download_bulk
+from feature_store import FEATURES, FeatureStore, FeatureView
+from indicators import sma
+from job_scheduler import JOB_NICE
+from metrics import TRAIN_SECONDS
+from model_registry import N_ROUNDS, PARAMS, REGISTRY, TEST_SIZE, ModelRegistry, feature_key
+from universe import load_universe, code_of
 
 warnings.filterwarnings("ignore", category=UserWarning)
 logging.getLogger("yfinance").setLevel(logging.CRITICAL)  # 靜音 yfinance
 
-TODAY = datetime.date.today()
-
-
-# ─────────────────── 技術指標 ────────────────────
-def rsi(series: pd.Series, period: int = 14) -> pd.Series:
-    """簡易版 RSI 計算（無 Wilder 平滑）"""
-    delta = series.diff()
-    gain = delta.clip(lower=0)
-    loss = -delta.clip(upper=0)
-    avg_gain = gain.rolling(period).mean()
-    avg_loss = loss.rolling(period).mean()
-    rs = avg_gain / avg_loss
-    return 100 - (100 / (1 + rs))
 
 
 # ─────────────────── 資料準備 & 模型 ────────────────────
-def _prep_dataset(df: pd.DataFrame) -> pd.DataFrame | None:
-    """K 線 DataFrame → 加入技術指標與標籤"""
-    if len(df) < 200:  # 資料不足 200 根日 K 就跳過
+def _prep_dataset(tk: str, df: pd.DataFrame) -> FeatureView | None:
+    """K 線 DataFrame → 特徵倉庫（只計算新的 K 棒）→ 這段 K 線期間的特徵視圖"""
+    if df["Close"].count() < 200:  # 資料不足 200 根日 K 就跳過
         return None
-    df = df.dropna(subset=["Close"]).copy()
-    df["sma5"] = df["Close"].rolling(5).mean()
-    df["sma20"] = df["Close"].rolling(20).mean()
-    df["rsi14"] = rsi(df["Close"], 14)
-    # 預測 5 日後收盤是否大於今日收盤
-    df["target"] = (df["Close"].shift(-5) > df["Close"]).astype(int)
-    df = df.dropna()
-    return df
+    return FEATURES.window("ml", tk, df)
 
 
-def _train_predict(df: pd.DataFrame):
-    feat_cols = ["Close", "Volume", "sma5", "sma20", "rsi14"]
-    X = df[feat_cols]
-    y = df["target"]
+def _prep_features(frames: dict[str, pd.DataFrame]) -> dict[str, FeatureView]:
+    """全市場 {代碼: K 線} → {代碼: 特徵視圖}；指標與標籤（5 日後收盤是否上漲）
+    由 feature_store 計算並保存，收盤後再掃描只需補上新的一天"""
+    out = {}
+    for tk, df in frames.items():
+        try:
+            view = _prep_dataset(tk, df)
+        except Exception as e:
+            logging.warning("features %s failed: %r", tk, e)
+            continue
+        if view is not None and len(view):
+            out[tk] = view
+    return out
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, shuffle=False
-    )
 
-    model = lgb.LGBMClassifier(
-        objective="binary", n_estimators=120, learning_rate=0.05, max_depth=-1
-    )
-    model.fit(X_train, y_train)
+FEAT_COLS = ["Close", "Volume", "sma5", "sma20", "rsi14"]
 
-    acc = accuracy_score(y_test, model.predict(X_test))
 
-    # 取最新一筆資料做今日預測
-    prob_up = model.predict_proba(X.iloc[[-1]])[0][1]
-    latest_rsi = df["rsi14"].iloc[-1]
-    latest_close = df["Close"].iloc[-1]
+def _to_arrays(view: FeatureView) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """特徵視圖 → 精簡陣列（日期 + float32 特徵 + int8 標籤）"""
+    dates, M = view.arrays(FEAT_COLS + ["target"])
+    return dates, M[:, :-1], M[:, -1].astype(np.int8)
 
-    return acc, prob_up, latest_rsi, latest_close
 
+def _fit_arrays(
+    code: str,
+    dates: np.ndarray,
+    X: np.ndarray,
+    y: np.ndarray,
+    n_jobs: int = -1,
+    registry: ModelRegistry = REGISTRY,
+):
+    # 模型登錄檔：同日直接載入、新交易日續訓、定期完整重訓
+    acc, prob_up = registry.predict(code, FEAT_COLS, dates, X, y, horizon=5, n_jobs=n_jobs)
 
-# ─────────────────── 主流程 ────────────────────
-def _get_all_stock_codes() -> List[str]:
-     return ["2330", "2303", "2603"]
+    # 取最新一筆資料做今日預測
+    latest_rsi = float(X[-1, FEAT_COLS.index("rsi14")])
+    latest_close = float(X[-1, FEAT_COLS.index("Close")])
 
+    return acc, prob_up, latest_rsi, latest_close
 
-def analyze_market() -> pd.DataFrame:
-    """掃描全市場 → 回傳 Top-10 DataFrame"""
-    results = []
-    codes = _get_all_stock_codes()
 
-    end = TODAY + datetime.timedelta(days=1)
-    start = TODAY - datetime.timedelta(days=365 * 3)
+def _train_chunk(tasks: list[tuple], n_jobs: int, root: str, models: str) -> list[tuple]:
+    """子行程：一次訓練一批股票（只收代碼，特徵直接 memmap 特徵倉庫），失敗的個股直接略過
 
-    for code in codes:
-        ticker = f"{code}.TW"
+    root / models：特徵倉庫與模型登錄檔的目錄，由父行程指定
+    """
+    store, registry = FeatureStore(root), ModelRegistry(models)
+    out = []
+    for code, tk, start, end in tasks:
         try:
-            df = yf.download(
-                ticker,
-                start=start,
-                end=end,
-                progress=False,
-                auto_adjust=False,
-                threads=False,
-            )
+            view = store.view("ml", tk).between(start, end)
+            out.append((code, *_fit_arrays(code, *_to_arrays(view), n_jobs, registry)))
         except Exception:
-            # yfinance 連線錯誤或被斷線就跳過
-            continue
+            continue  # 模型訓練異常則跳過
+    return out
+
+
+def default_workers() -> int:
+    return int(os.environ.get("TOP10_WORKERS", os.cpu_count() or 1))
+
+
+def _init_worker(pids) -> None:
+    """pool 子行程：降低優先權，並回報 PID 讓父行程提前關閉時可終止"""
+    if hasattr(os, "nice"):
+        os.nice(JOB_NICE)
+    pids.put(os.getpid())
 
-        # 下載失敗 / 資料空白 / 無 timezone → 跳過
-        if df.empty or df.index.tz is None:
-            continue
 
-        ds = _prep_dataset(df)
-        if ds is None:
+def _in_children(fn, jobs: list[tuple], workers: int) -> Iterator:
+    """在 spawn process pool 執行 fn(*job)，依完成順序產出結果
+
+    提前關閉（使用者取消、逾時）：丟棄排隊中的工作，並終止仍在執行的子行程
+    """
+    ctx = mp.get_context("spawn")
+    pids = ctx.SimpleQueue()
+    ex = ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs))), mp_context=ctx,
+                             initializer=_init_worker, initargs=(pids,))
+    finished = False
+    try:
+        futs = [ex.submit(fn, *job) for job in jobs]
+        for fut in as_completed(futs):
+            yield fut.result()
+        finished = True
+    finally:
+        ex.shutdown(wait=finished, cancel_futures=True)
+        if not finished:
+            while not pids.empty():
+                try:
+                    os.kill(pids.get(), signal.SIGTERM)
+                except OSError:
+                    pass  # 已結束
+
+
+def _run_training(
+    tasks: list[tuple],
+    workers: int,
+    task_chunk: int,
+    threads: int | None = None,
+    models: str | None = None,
+):
+    """ticker 模式：分批交給 workers 個子行程訓練；結果依完成順序逐筆產出"""
+    threads = threads or os.cpu_count() or 1
+    chunks = [tasks[i:i + task_chunk] for i in range(0, len(tasks), task_chunk)]
+    if not chunks:
+        return
+    workers = max(1, min(workers, len(chunks)))
+    n_jobs = max(1, threads // workers)  # 避免 workers × LightGBM 執行緒超過 threads
+    jobs = [(ch, n_jobs, FEATURES.root, models or REGISTRY.root) for ch in chunks]
+    for rows in _in_children(_train_chunk, jobs, workers):
+        yield from rows
+
+
+# ─────────────────── pooled 模式：全市場共用模型 ────────────────────
+TOP10_MODES = ("ticker", "pooled")
+HORIZON = 5
+POOL_FEATS = ["ret1", "ret5", "close_sma5", "close_sma20", "sma5_sma20", "rsi14", "vol_ratio"]
+
+
+def _default_mode() -> str:
+    mode = os.environ.get("TOP10_MODE", "ticker")
+    return mode if mode in TOP10_MODES else "ticker"
+
+
+def _lag(a: np.ndarray, n: int) -> np.ndarray:
+    out = np.full_like(a, np.nan)
+    out[n:] = a[:-n]
+    return out
+
+
+def _scale_free(ds: FeatureView) -> np.ndarray:
+    """單檔特徵 → 無尺度特徵（報酬、均線比值、RSI/100、量比），跨股票可比"""
+    close, sma5, sma20 = ds["Close"], ds["sma5"], ds["sma20"]
+    vol = np.log1p(ds["Volume"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cols = [
+            close / _lag(close, 1) - 1,
+            close / _lag(close, 5) - 1,
+            close / sma5 - 1,
+            close / sma20 - 1,
+            sma5 / sma20 - 1,
+            ds["rsi14"] / 100,
+            vol - sma(vol, 20),
+        ]
+    return np.column_stack(cols).astype(np.float32)
+
+
+def _stack(datasets: dict[str, FeatureView]):
+    """{代碼: 特徵視圖} → 疊成一份 (日期, 股票) 資料集
+
+    回傳 tickers、ids（每列屬於第幾檔）、dates、X、y、labeled（標籤已揭曉）、
+    latest（每檔最新一列在疊合陣列中的位置）、rows（同一列在該檔特徵視圖中的位置）
+    每檔最後 HORIZON 列的標籤尚未揭曉，只用來打分、不進訓練
+    """
+    tickers, ids, dates, Xs, ys, labeled, rows = [], [], [], [], [], [], []
+    for tk, ds in datasets.items():
+        X = _scale_free(ds)
+        keep = ~np.isnan(X).any(axis=1)
+        if keep.sum() <= HORIZON:
             continue
+        known = np.zeros(len(ds), dtype=bool)
+        known[:-HORIZON] = True
+        i = len(tickers)
+        tickers.append(tk)
+        ids.append(np.full(keep.sum(), i, dtype=np.int32))
+        dates.append(ds.dates[keep])
+        Xs.append(X[keep])
+        ys.append(ds["target"][keep].astype(np.int8))
+        labeled.append(known[keep])
+        rows.append(int(np.flatnonzero(keep)[-1]))
+    if not tickers:
+        return None
+    ids, dates, X, y, labeled = (np.concatenate(a) for a in (ids, dates, Xs, ys, labeled))
+    latest = np.r_[np.flatnonzero(np.diff(ids)), len(ids) - 1]
+    return tickers, ids, dates, X, y, labeled, latest, rows
+
+
+def _date_split(dates: np.ndarray, labeled: np.ndarray):
+    """依日期切 train / test：最後 TEST_SIZE 比例的交易日為 test，
+    其前 HORIZON 個交易日丟棄（避免訓練標籤看到 test 期的價格）"""
+    days = np.unique(dates[labeled])
+    n_test = int(np.ceil(len(days) * TEST_SIZE))
+    split, embargo = days[-n_test], days[max(0, len(days) - n_test - HORIZON)]
+    return labeled & (dates < embargo), labeled & (dates >= split)
+
+
+def _pooled_model(
+    tickers: list[str],
+    ids, dates, X, y, labeled,
+    n_jobs: int = -1,
+    registry: ModelRegistry = REGISTRY,
+):
+    """（當日已訓練過且涵蓋全部 tickers 則直接載入）→ (booster, 整體 test 準確率, 每檔 test 準確率)
+
+    每檔準確率以代碼存於 meta，依 tickers 的順序取出；有任何一檔不在其中就重訓
+    """
+    fkey = feature_key(POOL_FEATS, HORIZON)
+    day = np.datetime_as_string(dates.max(), "D")
+    n_codes = len(tickers)
+    booster, meta = registry.load_pooled(fkey, day)
+    saved = meta.get("per_code")
+    if booster is not None and isinstance(saved, dict) and all(tk in saved for tk in tickers):
+        return booster, meta["acc"], np.array([saved[tk] for tk in tickers])
+
+    params = {**PARAMS, "num_threads": n_jobs if n_jobs > 0 else 0}
+    train, test = _date_split(dates, labeled)
+    with TRAIN_SECONDS.time(kind="pooled"):
+        held = lgb.train(params, lgb.Dataset(X[train], y[train]), num_boost_round=N_ROUNDS)
+    hit = (held.predict(X[test]) > 0.5) == y[test]
+    acc = float(hit.mean())
+    n = np.bincount(ids[test], minlength=n_codes)
+    per_code = np.where(n > 0, np.bincount(ids[test], weights=hit, minlength=n_codes) / np.maximum(n, 1), acc)
+
+    # 準確率量完後，以全部已揭曉標籤重訓一次作為當日打分模型
+    with TRAIN_SECONDS.time(kind="pooled"):
+        booster = lgb.train(params, lgb.Dataset(X[labeled], y[labeled]), num_boost_round=N_ROUNDS)
+    registry.save_pooled(fkey, day, booster, {"acc": acc, "per_code": dict(zip(tickers, per_code.tolist()))})
+    return booster, acc, per_code
+
+
+def _score_pooled(
+    datasets: dict[str, FeatureView],
+    n_jobs: int,
+    registry: ModelRegistry = REGISTRY,
+) -> list[dict]:
+    """一次訓練 + 一次批次 predict → 逐檔結果列（欄位同 ticker 模式）
+
+    prob、rsi、close 取自同一列：每檔最後一列特徵完整的資料
+    """
+    stacked = _stack(datasets)
+    if stacked is None:
+        return []
+    tickers, ids, dates, X, y, labeled, latest, last = stacked
+    booster, _, per_code = _pooled_model(tickers, ids, dates, X, y, labeled, n_jobs, registry)
+    probs = booster.predict(X[latest])  # 全市場一次批次打分
+    rows = []
+    for i, tk in enumerate(tickers):
+        ds, j = datasets[tk], last[i]
+        rows.append({
+            "code": code_of(tk),
+            "acc": float(per_code[i]),
+            "prob": float(probs[i]),
+            "rsi": float(ds["rsi14"][j]),
+            "close": float(ds["Close"][j]),
+        })
+    return rows
+
+
+def _pooled_chunk(tasks: list[tuple], n_jobs: int, root: str, models: str) -> list[dict]:
+    """子行程：由特徵倉庫重建視圖後做 pooled 打分（只收代碼與日期區間）"""
+    store = FeatureStore(root)
+    datasets = {tk: store.view("ml", tk).between(start, end) for _, tk, start, end in tasks}
+    return _score_pooled(datasets, n_jobs, ModelRegistry(models))
+
+
+def _score(
+    datasets: dict[str, FeatureView],
+    mode: str,
+    workers: int,
+    task_chunk: int,
+    threads: int | None = None,
+    models: str | None = None,
+) -> Iterator[dict]:
+    """依 mode 在子行程訓練，逐檔產出 {code, acc, prob, rsi, close}
+
+    models：模型登錄檔目錄（預設 REGISTRY.root）
+    """
+    tasks = [(code_of(tk), tk, view.dates[0], view.dates[-1]) for tk, view in datasets.items()]
+    if mode == "pooled":
+        if tasks:
+            job = (tasks, threads or os.cpu_count() or 1, FEATURES.root, models or REGISTRY.root)
+            for rows in _in_children(_pooled_chunk, [job], 1):
+                yield from rows
+        return
+    results = _run_training(tasks, workers, task_chunk, threads, models)
+    try:
+        for code, acc, prob, rsi_val, close in results:
+            yield {"code": code, "acc": acc, "prob": prob, "rsi": rsi_val, "close": close}
+    finally:
+        results.close()
+
+
+# ─────────────────── 主流程 ────────────────────
+def _get_all_stock_codes(
+    markets: tuple[str, ...] = ("上市", "上櫃"),
+    types: tuple[str, ...] = ("股票",),
+) -> List[str]:
+    """上市 .TW + 上櫃 .TWO 代碼"""
+    return load_universe(markets, types)
+
+
+def passes(row: dict) -> bool:
+    """篩選條件：模型機率 >= 0.7 且 RSI < 30"""
+    return row["prob"] >= 0.70 and row["rsi"] < 30
+
+
+class Leaderboard:
+    """有界 min-heap：只保留機率（同機率比準確率）最高的 k 檔，同分先到者優先"""
+
+    def __init__(self, k: int = 10):
+        self.k = k
+        self._heap: list[tuple] = []
+        self._seq = 0
+
+    def push(self, row: dict) -> None:
+        item = (row["prob"], row["acc"], -self._seq, row)
+        self._seq += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        else:
+            heapq.heappushpop(self._heap, item)
+
+    def rows(self) -> list[dict]:
+        return [item[-1] for item in sorted(self._heap, reverse=True)]
+
+    def frame(self) -> pd.DataFrame:
+        rows = self.rows()
+        return pd.DataFrame(rows) if rows else pd.DataFrame()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+@dataclass
+class ScanEvent:
+    stage: str               # "download" / "train"
+    done: int
+    total: int
+    row: dict | None = None  # train 階段：該檔結果（未必符合篩選條件）
+
+
+def iter_market(
+    markets: tuple[str, ...] = ("上市", "上櫃"),
+    types: tuple[str, ...] = ("股票",),
+    chunk_size: int = 100,
+    workers: int | None = None,
+    task_chunk: int = 16,
+    mode: str | None = None,
+    threads: int | None = None,
+) -> Iterator[ScanEvent]:
+    """串流掃描：每下載完一批、每訓練完一檔就產出一個事件
+
+    threads：LightGBM 執行緒總數上限（預設 CPU 核心數）
+    """
+    tickers = _get_all_stock_codes(markets, types)
+
+    today = datetime.date.today()  # 每次掃描重新取日期：bot 行程可能已跑了好幾天
+    end = today + datetime.timedelta(days=1)
+    start = today - datetime.timedelta(days=365 * 3)
+
+    # 分批下載；失敗的批次已在 download_bulk 內重試並記錄
+    frames: dict[str, pd.DataFrame] = {}
+    failed = 0
+    for i in range(0, len(tickers), chunk_size):
+        got, reports = download_bulk(tickers[i:i + chunk_size], start, end, chunk_size=chunk_size)
+        frames.update(got)
+        failed += sum(len(r.failed) for r in reports)
+        yield ScanEvent("download", min(i + chunk_size, len(tickers)), len(tickers))
+    logging.info("analyze_market: %d/%d tickers downloaded, %d failed", len(frames), len(tickers), failed)
+
+    datasets = _prep_features(frames)
+    workers = default_workers() if workers is None else workers
+    rows = _score(datasets, mode or _default_mode(), workers, task_chunk, threads)
+    try:
+        for n, row in enumerate(rows, 1):
+            yield ScanEvent("train", n, len(datasets), row)
+    finally:
+        rows.close()
+
+
+def analyze_market(
+    markets: tuple[str, ...] = ("上市", "上櫃"),
+    types: tuple[str, ...] = ("股票",),
+    chunk_size: int = 100,
+    workers: int | None = None,
+    task_chunk: int = 16,
+    mode: str | None = None,
+) -> pd.DataFrame:
+    """掃描全市場 → 回傳 Top-10 DataFrame
+
+    workers：訓練用子行程數（預設 $TOP10_WORKERS 或 CPU 核心數）
+    task_chunk：每個子行程任務包含的股票數
+    mode："ticker"（每檔一個模型）或 "pooled"（全市場一個模型），預設 $TOP10_MODE
+    """
+    board = Leaderboard(10)
+    for ev in iter_market(markets, types, chunk_size, workers, task_chunk, mode):
+        if ev.row is not None and passes(ev.row):
+            board.push(ev.row)
+    return board.frame()
+
+
+# ─────────────────── 模式比較 ────────────────────
+def compare(frames: dict[str, pd.DataFrame], workers: int | None = None) -> pd.DataFrame:
+    """同一批日 K 分別以兩種模式冷啟動（空的模型登錄檔）打分，並列準確率與耗時"""
+    datasets = _prep_features(frames)
+    workers = default_workers() if workers is None else workers
+    tmp = tempfile.mkdtemp(prefix="top10-compare-")  # 暫存的模型登錄檔，不動到正式的 REGISTRY
+    out, tops = [], {}
+    try:
+        for mode in TOP10_MODES:
+            t0 = time.perf_counter()
+            rows = pd.DataFrame(list(_score(datasets, mode, workers, 16, models=tmp)))
+            board = Leaderboard(10)
+            for row in rows.to_dict("records"):
+                if passes(row):
+                    board.push(row)
+            tops[mode] = set(board.frame().get("code", []))
+            out.append({
+                "mode": mode,
+                "tickers": len(rows),
+                "models": len(rows) if mode == "ticker" else 1,
+                "seconds": round(time.perf_counter() - t0, 2),
+                "mean_acc": round(float(rows["acc"].mean()), 4),
+                "passed": int(sum(passes(r) for r in rows.to_dict("records"))),
+            })
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    table = pd.DataFrame(out).set_index("mode")
+    table["top10_overlap"] = len(tops["ticker"] & tops["pooled"])
+    return table
+
+
+def _main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="ai_top10：ticker / pooled 模式比較")
+    ap.add_argument("--compare", action="store_true", help="並列比較兩種模式的準確率與耗時")
+    ap.add_argument("--limit", type=int, default=None, help="--compare 時只取前 N 檔（預設全市場）")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--mode", choices=TOP10_MODES, default=None)
+    args = ap.parse_args(argv)
+
+    tickers = _get_all_stock_codes()[:args.limit]
+    if not args.compare:
+        print(analyze_market(workers=args.workers, mode=args.mode).to_string())
+        return 0
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=365 * 3)
+    frames, _ = download_bulk(tickers, start, today + datetime.timedelta(days=1))
+    print(compare(frames, args.workers).to_string())
+    return 0
 
-        try:
-            acc, prob, rsi_val, close = _train_predict(ds)
-        except Exception:
-            continue  # 模型訓練異常則跳過
 
-        # 篩選條件：模型機率 >0.7 且 RSI < 30
-        if prob >= 0.70 and rsi_val < 30:
-            results.append(
-                {
-                    "code": code,
-                    "acc": acc,
-                    "prob": prob,
-                    "rsi": rsi_val,
-                    "close": close,
-                }
-            )
-
-    if not results:
-        return pd.DataFrame()
-
-    df_res = (
-        pd.DataFrame(results)
-        .sort_values(["prob", "acc"], ascending=[False, False])
-        .head(10)
-        .reset_index(drop=True)
-    )
-    return df_res
-
-
-# 允許獨立測試
 if __name__ == "__main__":
-    df_top10 = analyze_market()
-    print(df_top10.to_string(index=False, float_format="%.3f"))
+    sys.exit(_main())
@@ -0,0 +1,173 @@
+"""
+backtest.py
+-----------
+walk-forward 回測：驗證「預測機率 ≥ 門檻 且 RSI < 門檻 → 收盤買進、持有 N 日」規則
+1. walk_forward()：擴張視窗，每 STEP 根 K 棒重訓一次，只使用當時已揭曉的標籤，
+   產出樣本外的每日上漲機率；結果依（代碼, 最後 K 棒日期）存於磁碟
+2. grid()：一次對（機率門檻 × RSI 門檻 × 持有天數）整個網格向量化計算
+   交易次數、勝率、平均報酬、策略總報酬、最大回撤、持倉比例
+   → 機率序列已快取時，整個網格一檔不到一秒
+"""
+from __future__ import annotations
+
+import os
+import glob
+import logging
+
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+
+from ai_single import FEATS, HORIZON, load_dataset
+from cache import TTLCache
+from market_clock import tw_session_date, tw_ttl
+from model_registry import PARAMS, feature_key
+from utils import CACHE_DIR
+
+BT_DIR = os.path.join(CACHE_DIR, "backtest")
+PROB_GRID = (0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8)
+RSI_GRID = (20, 30, 40, 50, 60, 70, 101)  # 101 = 不限 RSI
+HOLD_GRID = (1, 3, 5, 10, 20)
+MIN_TRAIN = 250     # 第一次訓練至少需要的 K 棒數
+STEP = 20           # 每隔幾根 K 棒重訓
+WF_ROUNDS = 60      # 每次重訓樹數（完整訓練 N_ROUNDS 的一半，換取速度）
+
+_RESULTS = TTLCache(maxsize=64, name="backtest")
+
+
+# ─────────────────── walk-forward ────────────────────
+def walk_forward(X: np.ndarray, y: np.ndarray, horizon: int = HORIZON,
+                 min_train: int = MIN_TRAIN, step: int = STEP, n_jobs: int = -1) -> np.ndarray:
+    """樣本外上漲機率；訓練期之前為 NaN
+
+    在第 t 根預測時，標籤只揭曉到第 t - horizon - 1 根（需要 horizon 日後的收盤）
+    """
+    prob = np.full(len(X), np.nan)
+    params = {**PARAMS, "num_threads": n_jobs if n_jobs > 0 else 0}
+    for t in range(min_train, len(X), step):
+        end = t - horizon
+        booster = lgb.train(params, lgb.Dataset(X[:end], y[:end]), num_boost_round=WF_ROUNDS)
+        prob[t:t + step] = booster.predict(X[t:t + step])
+    return prob
+
+
+def _wf_path(code: str, last: str) -> str:
+    fkey = feature_key(FEATS, HORIZON)
+    return os.path.join(BT_DIR, f"{code.upper()}-{fkey}-m{MIN_TRAIN}s{STEP}-{last}.npy")
+
+
+def cached_walk_forward(code: str, df: pd.DataFrame) -> np.ndarray:
+    """同一檔、同一根最後 K 棒只重訓一次；新的 K 棒進來時清掉舊檔"""
+    last = df.index[-1].date().isoformat()
+    path = _wf_path(code, last)
+    try:
+        prob = np.load(path)
+        if len(prob) == len(df):
+            return prob
+    except (OSError, ValueError):
+        pass
+    prob = walk_forward(df[FEATS].to_numpy(np.float32), df["target"].to_numpy(np.int8))
+    os.makedirs(BT_DIR, exist_ok=True)
+    for old in glob.glob(_wf_path(code, "*")):
+        os.remove(old)
+    np.save(path + ".tmp.npy", prob)
+    os.replace(path + ".tmp.npy", path)
+    return prob
+
+
+# ─────────────────── 向量化網格 ────────────────────
+def grid(
+    close: np.ndarray,
+    rsi: np.ndarray,
+    prob: np.ndarray,
+    prob_thrs=PROB_GRID,
+    rsi_thrs=RSI_GRID,
+    holds=HOLD_GRID,
+) -> pd.DataFrame:
+    """對整個門檻網格回測；只使用 prob 有值（樣本外）的區間
+
+    - 訊號：第 t 日收盤 prob ≥ p 且 RSI < r → 以收盤價買進
+    - 單筆交易：持有 h 日的報酬（勝率、平均報酬）
+    - 策略淨值：訊號後 h 日內持有一單位，重疊訊號視為延長持有、不加碼
+    """
+    start = int(np.argmax(~np.isnan(prob)))
+    close, rsi, prob = (np.asarray(a, float)[start:] for a in (close, rsi, prob))
+    P, R, H = np.asarray(prob_thrs, float), np.asarray(rsi_thrs, float), np.asarray(holds)
+    T = len(close)
+
+    sig = (prob >= P[:, None, None]) & (rsi < R[None, :, None])            # (P, R, T)
+    fwd = np.full((len(H), T), np.nan)                                     # (H, T)
+    for i, h in enumerate(H):
+        fwd[i, :-h] = close[h:] / close[:-h] - 1
+    s4 = sig[:, :, None, :]                                                # (P, R, 1, T)
+    known = s4 & ~np.isnan(fwd)                                            # (P, R, H, T)
+    trades = known.sum(-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hit = (known & (fwd > 0)).sum(-1) / trades
+        avg = np.where(known, fwd, 0.0).sum(-1) / trades
+
+    # 持倉：最近 h 日內（含當日）出現過訊號；收盤決定部位，賺取隔日報酬
+    csum = np.cumsum(sig, axis=-1)
+    held = np.empty(known.shape, dtype=bool)
+    for i, h in enumerate(H):
+        lagged = np.zeros_like(csum)
+        lagged[..., h:] = csum[..., :-h]
+        held[:, :, i, :] = csum - lagged > 0
+    nxt = np.zeros(T)
+    nxt[:-1] = close[1:] / close[:-1] - 1
+    equity = np.cumprod(1 + held * nxt, axis=-1)
+    total = equity[..., -1] - 1
+    mdd = (equity / np.maximum.accumulate(equity, axis=-1) - 1).min(-1)
+
+    pp, rr, hh = np.meshgrid(P, R, H, indexing="ij")
+    return pd.DataFrame({
+        "prob_thr": pp.ravel(),
+        "rsi_thr": rr.ravel(),
+        "hold": hh.ravel(),
+        "trades": trades.ravel(),
+        "hit_rate": hit.ravel(),
+        "avg_ret": avg.ravel(),
+        "total_ret": total.ravel(),
+        "max_dd": mdd.ravel(),
+        "exposure": held.mean(-1).ravel(),
+    })
+
+
+# ─────────────────── 主流程 ────────────────────
+def _compute(code: str, years: int) -> dict | None:
+    df = load_dataset(code, years)
+    if df is None or len(df) <= MIN_TRAIN + HORIZON:
+        return None
+    prob = cached_walk_forward(code, df)
+    close = df["Close"].to_numpy(float)
+    table = grid(close, df["rsi14"].to_numpy(float), prob)
+    oos = ~np.isnan(prob)
+    first = int(np.argmax(oos))
+    return {
+        "code": code,
+        "start": df.index[first].date().isoformat(),
+        "end": df.index[-1].date().isoformat(),
+        "days": int(oos.sum()),
+        "buy_hold": float(close[-1] / close[first] - 1),
+        "grid": table.to_dict("records"),
+    }
+
+
+def cached(code: str, years: int = 5) -> dict | None:
+    return _RESULTS.get((code.upper(), years, tw_session_date()))
+
+
+def remember(code: str, years: int, res: dict | None) -> None:
+    if res is not None:
+        _RESULTS.set((code.upper(), years, tw_session_date()), res, ttl=tw_ttl())
+
+
+def run(code: str, years: int = 5) -> dict | None:
+    """回傳 {code, start, end, days, buy_hold, grid: [...]}；資料不足時 None"""
+    hit = cached(code, years)
+    if hit is None:
+        hit = _compute(code, years)
+        remember(code, years, hit)
+        if hit is not None:
+            logging.info("backtest %s: %d OOS days, %d combos", code, hit["days"], len(hit["grid"]))
+    return hit
@@ -0,0 +1,96 @@
+"""
+backtest_handler.py
+───────────────────
+Telegram 指令 /backtest
+用法：
+  /backtest 2330       → 近 5 年資料 walk-forward 回測
+  /backtest 2330 8     → 指定年數（3~10）
+回傳：買進持有報酬、預設規則（prob≥0.70 & RSI<30、持有 5 日）成績、
+      門檻網格中總報酬最佳的前 5 組
+"""
+import asyncio, logging
+import pandas as pd
+from telegram import Update
+from telegram.ext import ContextTypes
+import backtest
+from job_scheduler import JOBS, RateLimited, run_in_process
+
+BACKTEST_DEADLINE = 120  # 秒
+MIN_TRADES = 5           # 排名時至少要有的交易次數
+DEFAULT_RULE = (0.70, 30, 5)
+
+def _pct(x: float) -> str:
+    return "—" if pd.isna(x) else f"{x * 100:+.1f}%"
+
+def _rsi(x: float) -> str:
+    return "any" if x > 100 else f"<{x:.0f}"
+
+def _format(res: dict) -> str:
+    g = pd.DataFrame(res["grid"])
+    p, r, h = DEFAULT_RULE
+    d = g[(g.prob_thr == p) & (g.rsi_thr == r) & (g.hold == h)].iloc[0]
+    best = (g[g.trades >= MIN_TRADES]
+            .sort_values(["total_ret", "hit_rate"], ascending=False)
+            .head(5))
+    rows = [f"{'prob':<6}{'rsi':<5}{'hold':>4}{'n':>5}{'hit':>6}{'ret':>9}{'mdd':>8}"]
+    for b in best.itertuples():
+        rows.append(f"≥{b.prob_thr:<5.2f}{_rsi(b.rsi_thr):<5}{int(b.hold):>3}d{int(b.trades):>5}"
+                    f"{b.hit_rate * 100:>5.0f}%{_pct(b.total_ret):>9}{_pct(b.max_dd):>8}")
+    table = "\n".join(rows) if len(best) else "（沒有交易次數足夠的組合）"
+    return (
+        f"📊 *{res['code']}* walk-forward 回測\n"
+        f"樣本外 {res['start']} ~ {res['end']}（{res['days']} 日）\n"
+        f"買進持有：{_pct(res['buy_hold'])}\n\n"
+        f"*預設規則* prob≥{p:.2f} & RSI<{r}、持有 {h} 日\n"
+        f"交易 {int(d.trades)} 次｜勝率 {_pct(d.hit_rate).lstrip('+')}｜平均 {_pct(d.avg_ret)}\n"
+        f"總報酬 {_pct(d.total_ret)}｜最大回撤 {_pct(d.max_dd)}\n\n"
+        f"*總報酬前 5 組*（交易 ≥ {MIN_TRADES} 次）\n"
+        f"```\n{table}\n```\n"
+        "⚠️ 歷史回測不代表未來績效"
+    )
+
+async def backtest_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
+    chat_id = u.effective_chat.id
+    if not c.args:
+        await c.bot.send_message(chat_id, "❓ 用法：/backtest <代碼> [年數]，例如：/backtest 2330")
+        return
+    code = c.args[0].upper()
+    try:
+        years = min(max(int(c.args[1]), 3), 10) if len(c.args) >= 2 else 5
+    except ValueError:
+        await c.bot.send_message(chat_id, "❓ 年數需為整數，例如：/backtest 2330 5")
+        return
+
+    waiting = await c.bot.send_message(chat_id, f"⌛ 正在回測 {code}（近 {years} 年）…")
+
+    async def queued(pos: int):
+        await waiting.edit_text(f"⏳ {code} 回測排隊中，前面還有 {pos - 1} 個工作…")
+
+    try:
+        res = backtest.cached(code, years)
+        if res is None:
+            res = await JOBS.submit(
+                ("backtest", code, years),
+                lambda: run_in_process(backtest.run, code, years),
+                user=u.effective_user.id,
+                timeout=BACKTEST_DEADLINE,
+                on_queued=queued,
+            )
+            backtest.remember(code, years, res)
+    except RateLimited as e:
+        await waiting.edit_text(
+            "⏳ 你已有工作在進行中，請等它完成" if e.retry_after is None
+            else f"⏳ 請求太頻繁，請 {e.retry_after:.0f} 秒後再試")
+        return
+    except asyncio.TimeoutError:
+        await waiting.edit_text("⚠️ 回測逾時，請稍後再試")
+        return
+    except Exception as e:
+        logging.error(e)
+        await waiting.edit_text("❌ 回測失敗，請稍後再試")
+        return
+
+    if res is None:
+        await waiting.edit_text(f"⚠️ 無法取得 {code} 資料或歷史太短")
+        return
+    await waiting.edit_text(_format(res), parse_mode="Markdown")
@@ -0,0 +1,272 @@
+"""
+bench.py
+--------
+離線效能基準：不連 Yahoo / TWSE / Google News，可在任何機器重現
+1. yfinance、history._twse_month、feedparser 以確定性的合成 K 線取代
+   （同一代碼、同一 seed → 同一條價格序列；長度與股票數可調）
+2. 量測 analyze_market（ticker / pooled 模式）、analyze_stock、各型態偵測、K 線繪圖、/ta 指標
+3. 結果寫成 JSON；加上 --baseline 可與前一次（例如上一個 commit）逐項比較
+
+用法：
+    python bench.py --tickers 100 --days 750 --out bench.json
+    python bench.py --baseline bench.json --out bench-new.json
+"""
+from __future__ import annotations
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import date, datetime
+from functools import lru_cache
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+
+# ─────────────────── 合成資料 ────────────────────
+class Synthetic:
+    """以代碼雜湊為種子的幾何隨機漫步日 K（僅工作日）"""
+
+    def __init__(self, days: int = 750, seed: int = 0, end: date | None = None):
+        self.days = days
+        self.seed = seed
+        self.end = pd.Timestamp(end or date.today())
+        self.calendar = pd.bdate_range(end=self.end, periods=days, name="Date")
+        self._series = lru_cache(maxsize=None)(self._make)
+
+    def _make(self, tk: str) -> pd.DataFrame:
+        rng = np.random.default_rng(zlib.crc32(tk.upper().encode()) ^ self.seed)
+        n = len(self.calendar)
+        ret = rng.normal(0.0003, 0.02, n)
+        close = 50 * np.exp(np.cumsum(ret)) * rng.uniform(0.5, 4)
+        open_ = close * np.exp(rng.normal(0, 0.006, n))
+        wick = np.abs(rng.normal(0, 0.01, (2, n)))
+        high = np.maximum(open_, close) * (1 + wick[0])
+        low = np.minimum(open_, close) * (1 - wick[1])
+        vol = rng.lognormal(13, 0.6, n).round()
+        return pd.DataFrame(
+            {"Open": open_, "High": high, "Low": low, "Close": close, "Adj Close": close, "Volume": vol},
+            index=self.calendar,
+        )
+
+    def bars(self, tk: str, start=None, end=None, period: str | None = None) -> pd.DataFrame:
+        df = self._series(tk)
+        if period:
+            num, unit = re.fullmatch(r"(\d+)(d|mo|y)", period).groups()
+            days = {"d": 1, "mo": 31, "y": 365}[unit] * int(num)
+            start = self.end - pd.Timedelta(days=days)
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df.index < pd.Timestamp(end)]
+        return df.copy()
+
+    # ---------- yfinance ----------
+    def download(self, tickers, start=None, end=None, period=None, group_by="column", **_kw):
+        tks = tickers.split() if isinstance(tickers, str) else list(tickers)
+        frames = {tk: self.bars(tk, start, end, period) for tk in tks}
+        if len(tks) == 1 and group_by != "ticker":
+            return frames[tks[0]]
+        return pd.concat(frames, axis=1)
+
+    def ticker(self, tk: str):
+        bench = self
+        last = self.bars(tk).iloc[-252:]
+
+        class _Ticker:
+            fast_info = {
+                "lastPrice": float(last["Close"].iloc[-1]),
+                "previousClose": float(last["Close"].iloc[-2]),
+                "marketCap": float(last["Close"].iloc[-1]) * 1e9,
+                "yearHigh": float(last["High"].max()),
+                "yearLow": float(last["Low"].min()),
+            }
+            info = {"trailingPE": 15.0, "priceToBook": 2.0, "trailingEps": 5.0, "dividendYield": 0.03}
+
+            def history(self, period=None, start=None, end=None, **_kw):
+                return bench.bars(tk, start, end, period).drop(columns="Adj Close")
+
+        return _Ticker()
+
+    # ---------- TWSE ----------
+    def twse_month(self, code: str, y: int, m: int) -> pd.DataFrame:
+        df = self.bars(f"{code}.TW", date(y, m, 1))
+        return df[(df.index.year == y) & (df.index.month == m)].drop(columns="Adj Close")
+
+    # ---------- Google News ----------
+    @staticmethod
+    def feed(_content) -> SimpleNamespace:
+        return SimpleNamespace(entries=[
+            SimpleNamespace(title=f"合成新聞 {i}", link=f"https://news.example.com/{i}") for i in range(30)
+        ])
+
+    @staticmethod
+    def http_get(url, **_kw) -> SimpleNamespace:
+        return SimpleNamespace(status_code=200, content=b"", headers={}, raise_for_status=lambda: None)
+
+
+# ─────────────────── 計時 ────────────────────
+def _measure(fn, repeat: int = 1) -> dict:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return {
+        "runs": repeat,
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "mean": statistics.fmean(runs),
+    }
+
+
+def _git_rev() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args: argparse.Namespace, syn: Synthetic) -> dict:
+    # 模組需在 STOCKRADAR_CACHE 設定後才匯入（CACHE_DIR 於匯入時決定）
+    import yfinance as yf
+    import feedparser
+
+    import history
+
+    patches = [
+        mock.patch.object(yf, "download", syn.download),
+        mock.patch.object(yf, "Ticker", syn.ticker),
+        mock.patch.object(history, "_twse_month", syn.twse_month),
+        mock.patch.object(feedparser, "parse", syn.feed),
+    ]
+    for p in patches:
+        p.start()
+
+    import ai_top10
+    import ai_single
+    import chart
+    import news_handler
+    from indicators import rsi, kd
+    from pattern_detector import DETECTORS, detect_all
+
+    tickers = [f"{1000 + i}.TW" for i in range(args.tickers)]
+    one = tickers[0]
+    df = syn.bars(one, period="6mo")
+    only = set(args.only or [])
+    results: dict[str, dict] = {}
+
+    def bench(name: str, fn, repeat: int = 1) -> None:
+        if only and not any(name.startswith(o) for o in only):
+            return
+        results[name] = _measure(fn, repeat)
+        print(f"{name:<28} median {results[name]['median'] * 1000:10.2f} ms", file=sys.stderr)
+
+    with mock.patch.object(ai_top10, "load_universe", lambda *_a: tickers), \
+            mock.patch.object(news_handler._session, "get", syn.http_get):
+        market = lambda: ai_top10.analyze_market(workers=args.workers)
+        bench("analyze_market.cold", market)
+        bench("analyze_market.warm", market)
+        pooled = lambda: ai_top10.analyze_market(workers=args.workers, mode="pooled")
+        bench("analyze_market.pooled.cold", pooled)
+        bench("analyze_market.pooled.warm", pooled)
+
+        def single_cold():
+            ai_single._COMPUTED.clear()
+            ai_single.analyze_stock(ai_top10.code_of(one))
+
+        bench("analyze_stock.registry", single_cold, args.repeat)
+        bench("analyze_stock.cached", lambda: ai_single.analyze_stock(ai_top10.code_of(one)), args.repeat)
+
+        for name, fn in DETECTORS.items():
+            bench(f"detector.{name}", lambda fn=fn: fn(df), args.repeat * 10)
+        bench("detect_all", lambda: detect_all(df), args.repeat * 10)
+
+        chart._init_worker()
+        bench("chart.candle", lambda: chart._candle_buf(df), args.repeat)
+        bench("ta.rsi", lambda: rsi(df["Close"], 14), args.repeat * 10)
+        bench("ta.kd", lambda: kd(df["High"], df["Low"], df["Close"], 9, com=2), args.repeat * 10)
+        bench("ta.rsi_chart", lambda: chart._rsi_buf(df, "RSI"), args.repeat)
+        bench("ta.kd_chart", lambda: chart._kd_buf(df, "KD"), args.repeat)
+
+        def news():
+            news_handler._NEWS.clear()
+            news_handler._fetch_google("台股")
+
+        bench("news.fetch_google", news, args.repeat * 10)
+
+    for p in patches:
+        p.stop()
+    return results
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """印出與 baseline 的中位數比值（>1 代表變慢）"""
+    old = baseline.get("results", {})
+    print(f"{'benchmark':<28} {'old ms':>10} {'new ms':>10} {'ratio':>7}", file=sys.stderr)
+    for name, cur in results.items():
+        if name not in old:
+            continue
+        a, b = old[name]["median"], cur["median"]
+        print(f"{name:<28} {a * 1000:10.2f} {b * 1000:10.2f} {b / a:7.2f}", file=sys.stderr)
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="stockradar 離線效能基準")
+    ap.add_argument("--tickers", type=int, default=100, help="合成全市場股票數")
+    ap.add_argument("--days", type=int, default=750, help="每檔日 K 根數（約 3 年）")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3, help="單檔項目的重複次數")
+    ap.add_argument("--workers", type=int, default=None, help="analyze_market 訓練行程數")
+    ap.add_argument("--only", nargs="*", help="只跑名稱以此開頭的項目")
+    ap.add_argument("--out", default="bench.json")
+    ap.add_argument("--baseline", help="前一次的 JSON 結果，用於比較")
+    ap.add_argument("--keep-cache", action="store_true", help="保留暫存快取目錄")
+    args = ap.parse_args(argv)
+
+    cache = tempfile.mkdtemp(prefix="stockradar-bench-")
+    os.environ["STOCKRADAR_CACHE"] = cache
+    syn = Synthetic(args.days, args.seed)
+    try:
+        results = run(args, syn)
+    finally:
+        if not args.keep_cache:
+            shutil.rmtree(cache, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": _git_rev(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "cpus": os.cpu_count(),
+            "tickers": args.tickers,
+            "days": args.days,
+            "seed": args.seed,
+            "workers": args.workers,
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            compare(results, json.load(fh))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
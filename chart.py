@@ -1,11 +1,36 @@
 import mplfinance as mpf
+import matplotlib
 import matplotlib.pyplot as plt
 import io
 import pandas as pd
 
+from indicators import rsi, kd
+
+_STYLES: dict[bool, dict] = {}
+
+def _style(inherit: bool = True) -> dict:
+    """紅漲綠跌的 yahoo 樣式（建立一次後重複使用）"""
+    if inherit not in _STYLES:
+        mc = mpf.make_marketcolors(up="r", down="g", inherit=inherit)
+        _STYLES[inherit] = mpf.make_mpf_style(base_mpf_style="yahoo", marketcolors=mc)
+    return _STYLES[inherit]
+
+def _init_worker() -> None:
+    """繪圖子行程初始化：無視窗後端、預建樣式、載入字型快取"""
+    matplotlib.use("Agg")
+    from matplotlib import font_manager
+    font_manager.findfont(matplotlib.rcParams["font.sans-serif"][0])
+    _style(True)
+    _style(False)
+
+def _fig_buf(fig) -> io.BytesIO:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    plt.close(fig)
+    buf.seek(0)
+    return buf
+
 def _candle_buf(df: pd.DataFrame, fibo: dict[int, float] | None = None) -> io.BytesIO:
-    mc = mpf.make_marketcolors(up="r", down="g", inherit=True)
-    s = mpf.make_mpf_style(base_mpf_style="yahoo", marketcolors=mc)
     addp = []
     if fibo:
         for v in fibo.values():
@@ -13,14 +38,50 @@ def _candle_buf(df: pd.DataFrame, fibo: dict[int, float] | None = None) -> io.By
     fig, _ = mpf.plot(
         df,
         type="candle",
-        style=s,
+        style=_style(True),
         addplot=addp,
         datetime_format="%Y-%m",
         ylabel="Price",
         returnfig=True
     )
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight")
-    plt.close(fig)
-    buf.seek(0)
-    return buf
+    return _fig_buf(fig)
+
+def _pattern_buf(df: pd.DataFrame, neckline: float | None = None) -> io.BytesIO:
+    ap = []
+    if neckline is not None:
+        ap.append(mpf.make_addplot([neckline] * len(df), color="b"))
+    fig, _ = mpf.plot(df, type="candle", style=_style(False), addplot=ap, returnfig=True)
+    return _fig_buf(fig)
+
+def _rsi_buf(df: pd.DataFrame, title: str) -> io.BytesIO:
+    fig, ax = plt.subplots()
+    vals = df["rsi14"] if "rsi14" in df else rsi(df["Close"], 14)  # 特徵倉庫已算好時直接用
+    pd.Series(vals, index=df.index).plot(ax=ax)
+    ax.set_title(title)
+    ax.set_ylim(0, 100)
+    ax.axhline(70, color="r")
+    ax.axhline(30, color="g")
+    return _fig_buf(fig)
+
+def _kd_buf(df: pd.DataFrame, title: str) -> io.BytesIO:
+    if {"K", "D"} <= set(df.columns):
+        k, d = df["K"], df["D"]
+    else:
+        k, d = kd(df["High"], df["Low"], df["Close"], 9, com=2)
+    fig, ax = plt.subplots()
+    pd.Series(k, index=df.index).plot(ax=ax, label="K")
+    pd.Series(d, index=df.index).plot(ax=ax, label="D")
+    ax.set_title(title)
+    ax.legend()
+    return _fig_buf(fig)
+
+RENDERERS = {
+    "candle": _candle_buf,
+    "pattern": _pattern_buf,
+    "rsi": _rsi_buf,
+    "kd": _kd_buf,
+}
+
+def render_png(kind: str, df: pd.DataFrame, **overlay) -> bytes:
+    """子行程進入點：回傳 PNG bytes"""
+    return RENDERERS[kind](df, **overlay).getvalue()
@@ -0,0 +1,138 @@
+"""
+chart_service.py
+----------------
+圖表渲染服務
+1. mplfinance / matplotlib 在小型 process pool 中繪製，不阻塞 event loop
+   （子行程啟動時即預建樣式、載入字型）
+2. 以內容雜湊為鍵的 PNG 快取：代碼 + 整段 K 棒（含索引與預先算好的指標欄位）
+   + 圖表種類 + 疊加價位 → 記憶體 LRU + 磁碟，同樣輸入不再重繪
+3. 磁碟快取有上限：寫入時（至多每 _PRUNE_EVERY 秒一次）刪掉超過 CHART_DISK_MAX_AGE 天
+   未使用的圖，總量仍超過 CHART_DISK_MAX_MB 時再從最久未使用的開始刪
+"""
+from __future__ import annotations
+
+import os
+import io
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+import chart
+from cache import TTLCache
+from utils import CACHE_DIR
+
+CHART_DIR = os.path.join(CACHE_DIR, "charts")
+_WORKERS = int(os.environ.get("CHART_WORKERS", 2))
+_MEM = TTLCache(maxsize=128, ttl=24 * 3600, name="charts")
+CHART_DISK_MAX_AGE = float(os.environ.get("CHART_DISK_MAX_AGE", 7)) * 86400    # 天 → 秒
+CHART_DISK_MAX_MB = float(os.environ.get("CHART_DISK_MAX_MB", 200))
+_PRUNE_EVERY = 600.0  # 秒
+_pool: ProcessPoolExecutor | None = None
+_last_prune = 0.0
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=_WORKERS,
+            mp_context=mp.get_context("spawn"),
+            initializer=chart._init_worker,
+        )
+    return _pool
+
+
+def chart_key(kind: str, ticker: str, df: pd.DataFrame, **overlay) -> str:
+    """內容位址：同一檔、同一段 K 棒（任一根有變都算不同）、同種類與疊加價位 → 同一張圖"""
+    payload = {"kind": kind, "ticker": ticker.upper(), "columns": list(map(str, df.columns)), "overlay": overlay}
+    h = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _call_render(kind: str, df: pd.DataFrame, overlay: dict) -> bytes:
+    return chart.render_png(kind, df, **overlay)
+
+
+def _disk_path(key: str) -> str:
+    return os.path.join(CHART_DIR, key[:2], f"{key}.png")
+
+
+def _read_disk(key: str) -> bytes | None:
+    path = _disk_path(key)
+    try:
+        with open(path, "rb") as fh:
+            png = fh.read()
+        os.utime(path)  # mtime = 最後使用時間，供淘汰判斷
+        return png
+    except OSError:
+        return None
+
+
+def _prune(now: float) -> int:
+    """刪掉過期的圖；總量仍超過上限時從最久未使用的開始刪 → 刪除張數"""
+    files = []
+    for root, _, names in os.walk(CHART_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    limit = CHART_DISK_MAX_MB * 1024 * 1024
+    removed = 0
+    for mtime, size, path in files:
+        if now - mtime < CHART_DISK_MAX_AGE and total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def _write_disk(key: str, png: bytes) -> None:
+    global _last_prune
+    path = _disk_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as fh:
+        fh.write(png)
+    os.replace(path + ".tmp", path)
+    if time.monotonic() - _last_prune >= _PRUNE_EVERY:
+        _last_prune = time.monotonic()
+        removed = _prune(time.time())
+        if removed:
+            logging.info("chart cache: pruned %d files", removed)
+
+
+async def render(kind: str, ticker: str, df: pd.DataFrame, **overlay) -> io.BytesIO:
+    """回傳 PNG buffer；命中快取時不需繪圖"""
+    global _pool
+    key = chart_key(kind, ticker, df, **overlay)
+    png = _MEM.get(key)
+    if png is None:
+        png = await asyncio.to_thread(_read_disk, key)
+    if png is None:
+        loop = asyncio.get_running_loop()
+        try:
+            png = await loop.run_in_executor(_get_pool(), _call_render, kind, df, overlay)
+        except BrokenProcessPool:
+            logging.warning("chart pool broken, rendering in thread")
+            _pool = None
+            png = await asyncio.to_thread(chart.render_png, kind, df, **overlay)
+        await asyncio.to_thread(_write_disk, key, png)
+    _MEM.set(key, png)
+    return io.BytesIO(png)
+
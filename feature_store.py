@@ -0,0 +1,307 @@
+"""
+feature_store.py
+----------------
+特徵倉庫：每個（命名空間, 代碼）一個 .npy 矩陣（float64，列 = 交易日）
+1. 讀取以 np.load(mmap_mode="r") 對應檔案：bot 與訓練子行程共用同一批 page cache，
+   不必重算、也不必把陣列 pickle 給子行程（只傳代碼）；同一行程內的對應會重複使用
+2. sync()：收盤後只把新的 K 棒算成特徵寫在尾端；SMA20 / RSI14 / KD 等視窗型指標只需
+   往前回看 lookback 列，尚未揭曉的標籤（最後 HORIZON 列）一併重算 → 與整段重算結果相同
+3. 盤中 K 棒被覆蓋時從變動處重寫；日 K 起點更早、資料回溯、回看不足或特徵定義改變時整檔重建
+4. 第 0 列為表頭（列數 n、欄位簽章）；每次寫入都寫成新檔再 os.replace（copy-on-write），
+   已交出的視圖與子行程讀到的舊檔內容永遠不會被改動
+
+命名空間：
+- ml：Close、Volume、sma5、sma20、rsi14、target（/model、/backtest、/top10 共用）
+- ta：Close、rsi14、K、D（/ta 圖表）
+"""
+from __future__ import annotations
+
+import os
+import zlib
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from indicators import sma, rsi, kd, forward_up
+from ohlcv_store import normalize_bars
+from utils import CACHE_DIR
+
+try:  # 跨行程寫入鎖（/model 的子行程也會寫入）；沒有 fcntl 的平台只做行程內鎖
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+HORIZON = 5
+
+
+# ─────────────────── 特徵定義 ────────────────────
+@dataclass(frozen=True)
+class Spec:
+    columns: tuple[str, ...]                                   # 欄位（須含 Close）
+    compute: Callable[[pd.DataFrame], dict[str, np.ndarray]]   # 日 K → 各欄位陣列
+    lookback: int                                              # 計算新列需往前回看的列數
+    revise: int = 0                                            # 新資料進來時需重算的既有尾端列數
+    warmup: int = 0                                            # 從頭計算時前幾列指標尚未有值
+
+    @property
+    def signature(self) -> float:
+        """欄位簽章（寫在表頭）；欄位改變時舊檔會被重建"""
+        return float(zlib.crc32(",".join(self.columns).encode()))
+
+
+def _ml(bars: pd.DataFrame) -> dict[str, np.ndarray]:
+    close = bars["Close"].to_numpy(float)
+    return {
+        "Close": close,
+        "Volume": bars["Volume"].to_numpy(float),
+        "sma5": sma(close, 5),
+        "sma20": sma(close, 20),
+        "rsi14": rsi(close, 14),
+        "target": forward_up(close, HORIZON),
+    }
+
+
+def _ta(bars: pd.DataFrame) -> dict[str, np.ndarray]:
+    close = bars["Close"].to_numpy(float)
+    k, d = kd(bars["High"], bars["Low"], close, 9, com=2)
+    return {"Close": close, "rsi14": rsi(close, 14), "K": k, "D": d}
+
+
+SPECS: dict[str, Spec] = {
+    "ml": Spec(("Close", "Volume", "sma5", "sma20", "rsi14", "target"), _ml, lookback=20, revise=HORIZON, warmup=19),
+    # KD 為 EMA（com=2），回看 60 列時更早資料的權重 < 1e-10；但 EMA 從頭起算沒有明確的
+    # warmup，/ta 圖表也要顯示前段，所以 ta 不略過任何列：前約 60 列的 KD（與前 14 列的 RSI）
+    # 用的是倉庫裡較長的歷史，與只用這段日 K 從頭計算的值不同（較收斂），之後則一致
+    "ta": Spec(("Close", "rsi14", "K", "D"), _ta, lookback=60),
+}
+
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+# ─────────────────── 唯讀視圖 ────────────────────
+class FeatureView:
+    """前 n 列的 memmap 視圖：各欄位為檔案對應的跨步視圖（唯讀、零複製）"""
+
+    def __init__(self, columns: tuple[str, ...], rows: np.ndarray):
+        self.columns = columns
+        self.rows = rows  # (n, 1 + 欄位數)，第 0 欄為日期（1970 起的日數）
+        self.cols = {c: rows[:, j + 1] for j, c in enumerate(columns)}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        return self.cols[col]
+
+    @property
+    def days(self) -> np.ndarray:
+        return self.rows[:, 0]
+
+    @property
+    def dates(self) -> np.ndarray:
+        return _EPOCH + self.rows[:, 0].astype("timedelta64[D]")
+
+    def between(self, start, end=None) -> "FeatureView":
+        """[start, end] 日期區間（含）內的列，仍是零複製視圖"""
+        days = self.days
+        hi = len(days) if end is None else np.searchsorted(days, _day(end), "right")
+        return FeatureView(self.columns, self.rows[np.searchsorted(days, _day(start)):hi])
+
+    def _rows(self, start=None, end=None, dropna: bool = True) -> np.ndarray:
+        """[start, end] 日期區間（含）內的列；dropna 時略過視窗未滿的列"""
+        days = self.days
+        lo = 0 if start is None else np.searchsorted(days, _day(start))
+        hi = len(days) if end is None else np.searchsorted(days, _day(end), "right")
+        if not dropna:
+            return np.arange(lo, hi)
+        ok = ~np.isnan(self.rows[lo:hi]).any(axis=1)
+        return lo + np.flatnonzero(ok)
+
+    def arrays(self, cols: list[str], start=None, end=None, dtype=np.float32) -> tuple[np.ndarray, np.ndarray]:
+        """(日期, 特徵矩陣)：給 LightGBM 用（它本來就會複製成自己的 Dataset）"""
+        idx = self._rows(start, end)
+        return self.dates[idx], np.column_stack([self.cols[c][idx] for c in cols]).astype(dtype)
+
+    def frame(self, start=None, end=None, dropna: bool = True) -> pd.DataFrame:
+        idx = self._rows(start, end, dropna)
+        index = pd.DatetimeIndex(self.dates[idx].astype("datetime64[ns]"), name="Date")
+        return pd.DataFrame({c: a[idx] for c, a in self.cols.items()}, index=index)
+
+
+def _day(ts) -> float:
+    return float((np.datetime64(pd.Timestamp(ts).date(), "D") - _EPOCH).astype(int))
+
+
+def _clean(bars: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+    """去掉無收盤價的列 → (日 K, 日期日數)；索引未排序／重複／有時區時才走 normalize_bars"""
+    idx = bars.index
+    if not isinstance(idx, pd.DatetimeIndex) or idx.tz is not None or not idx.is_monotonic_increasing:
+        bars = normalize_bars(bars)
+    else:
+        close = bars["Close"].to_numpy(float)
+        if np.isnan(close).any():
+            bars = bars[~np.isnan(close)]
+    days = (bars.index.values.astype("datetime64[D]") - _EPOCH).astype(float)
+    if len(days) > 1 and not (np.diff(days) > 0).all():  # 同一天多筆（盤中 K 棒）
+        bars = normalize_bars(bars)
+        days = (bars.index.values.astype("datetime64[D]") - _EPOCH).astype(float)
+    return bars, days
+
+
+# ─────────────────── 倉庫 ────────────────────
+class FeatureStore:
+    def __init__(self, root: str | None = None):
+        self.root = root or os.path.join(CACHE_DIR, "features")
+        self._locks: dict[str, threading.Lock] = {}
+        self._maps: dict[str, tuple[int, np.memmap]] = {}
+        self._guard = threading.Lock()
+
+    # ---------- 內部工具 ----------
+    def _path(self, ns: str, key: str) -> str:
+        return os.path.join(self.root, ns, key.upper().replace("/", "_") + ".npy")
+
+    def _map(self, path: str) -> np.memmap | None:
+        """唯讀對應；檔案被替換（inode 改變）時重新對應"""
+        try:
+            ino = os.stat(path).st_ino
+        except OSError:
+            return None
+        hit = self._maps.get(path)
+        if hit is not None and hit[0] == ino:
+            return hit[1]
+        try:
+            m = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        self._maps[path] = (ino, m)
+        return m
+
+    class _Locked:
+        """行程內 threading.Lock ＋ 跨行程 flock"""
+
+        def __init__(self, lock: threading.Lock, path: str):
+            self.lock, self.path, self.fh = lock, path, None
+
+        def __enter__(self):
+            self.lock.acquire()
+            if fcntl is not None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.fh = open(self.path, "a")
+                fcntl.flock(self.fh, fcntl.LOCK_EX)
+
+        def __exit__(self, *exc):
+            if self.fh is not None:
+                self.fh.close()  # 關檔即釋放 flock
+            self.lock.release()
+
+    def _lock(self, path: str) -> "_Locked":
+        with self._guard:
+            lock = self._locks.setdefault(path, threading.Lock())
+        return self._Locked(lock, path[:-4] + ".lock")
+
+    @staticmethod
+    def _resume(spec: Spec, old: FeatureView | None, days: np.ndarray, close: np.ndarray) -> int | None:
+        """新資料要從既有第幾列開始寫；None = 需整檔重建，len(old) = 只需 append"""
+        if old is None or not len(old) or days[0] < old.days[0]:
+            return None
+        n = len(old)
+        p = int(np.searchsorted(days, old.days[-1]))
+        if p >= len(days) or days[p] != old.days[-1]:
+            return None
+        # 比對重疊的尾端：日期需一致，收盤價不同處（盤中 K 棒被覆蓋）起重寫
+        k = min(n, p + 1, spec.lookback + spec.revise + 1)
+        if not np.array_equal(old.days[n - k:], days[p - k + 1:p + 1]):
+            return None
+        diff = ~np.isclose(old["Close"][n - k:], close[p - k + 1:p + 1], equal_nan=True)
+        if not diff.any():
+            return n
+        j = int(np.argmax(diff))
+        if j == 0 and k < n:  # 差異早於可比對的範圍（例如還原價位移）
+            return None
+        return n - k + j
+
+    def _write(self, path: str, spec: Spec, at: int, rows: np.ndarray) -> None:
+        """保留既有前 at 列、其後換成 rows，寫成新檔再替換（不改動舊檔，讀取者不受影響）"""
+        n = at + len(rows)
+        old = self._map(path) if at else None
+        tmp = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        m = np.lib.format.open_memmap(tmp, mode="w+", dtype="f8", shape=(n + 1, 1 + len(spec.columns)))
+        if at:
+            m[1:at + 1] = old[1:at + 1]
+        m[at + 1:] = rows
+        m[0, :2] = (n, spec.signature)
+        m.flush()
+        del m
+        os.replace(tmp, path)
+
+    # ---------- 公開介面 ----------
+    def view(self, ns: str, key: str) -> FeatureView | None:
+        """唯讀 memmap 視圖；尚無資料或欄位定義已改變時 None"""
+        spec = SPECS[ns]
+        m = self._map(self._path(ns, key))
+        if m is None or m.shape[1] != 1 + len(spec.columns) or m[0, 1] != spec.signature:
+            return None
+        n = int(m[0, 0])
+        return FeatureView(spec.columns, m[1:n + 1]) if n else None
+
+    def sync(self, ns: str, key: str, bars: pd.DataFrame) -> FeatureView | None:
+        """以最新日 K 更新特徵：只計算並寫入新增／變動的尾端列"""
+        spec = SPECS[ns]
+        bars, days = _clean(bars)
+        if bars.empty:
+            return self.view(ns, key)
+        close = bars["Close"].to_numpy(float)
+        old = self.view(ns, key)
+        if (old is not None and days[0] >= old.days[0]
+                and old.days[-1] == days[-1] and old["Close"][-1] == close[-1]):
+            return old  # 快速路徑：起點不早於倉庫且最後一根 K 棒相同，不需加鎖
+
+        path = self._path(ns, key)
+        with self._lock(path):
+            old = self.view(ns, key)
+            at = self._resume(spec, old, days, close)
+            if at is not None:
+                n = len(old)
+                if at == n and days[-1] <= old.days[-1]:
+                    return old  # 沒有新 K 棒
+                at = max(0, at - spec.revise)  # 其後價格有變 → 這幾列的標籤也要重算
+                pos = int(np.searchsorted(days, old.days[-1])) - (n - 1 - at)  # 既有第 at 列在 bars 的位置
+                # 回看不足（日 K 起點太晚）時無法保證與整段重算一致 → 重建
+                if pos < 0 or (pos < spec.lookback and days[0] != old.days[0]):
+                    at = None
+            if at is None:
+                at, pos = 0, 0
+            lo = max(0, pos - spec.lookback)
+            feats = spec.compute(bars.iloc[lo:])
+            rows = np.column_stack([days[lo:], *(np.asarray(feats[c], float) for c in spec.columns)])
+            self._write(path, spec, at, rows[pos - lo:])
+        return self.view(ns, key)
+
+    def window(self, ns: str, key: str, bars: pd.DataFrame) -> FeatureView | None:
+        """sync 後取與 bars 同一段期間的特徵，並略過前 warmup 列
+
+        ml：結果與「只用 bars 從頭計算再 dropna」相同，不受倉庫裡更早的歷史影響
+        ta：前段 KD／RSI 可能用到更早的歷史（見 SPECS 註解）
+        """
+        bars, _ = _clean(bars)
+        warmup = SPECS[ns].warmup
+        view = self.sync(ns, key, bars)
+        if view is None or len(bars) <= warmup:
+            return None
+        return view.between(bars.index[warmup], bars.index[-1])
+
+
+FEATURES = FeatureStore()
+
+
+def with_ta(key: str, bars: pd.DataFrame) -> pd.DataFrame:
+    """/ta 用：日 K 加上 rsi14、K、D 欄位（取自特徵倉庫，只算新的 K 棒）"""
+    bars, _ = _clean(bars)
+    view = FEATURES.window("ta", key, bars)
+    if view is None:
+        return bars
+    return bars.join(view.frame(dropna=False)[["rsi14", "K", "D"]])
@@ -0,0 +1,132 @@
+"""
+fundamentals_cache.py
+---------------------
+/fund 基本面快取（tkr.info 常需數秒，資料一天最多變一次）
+1. 七個欄位（市值、本益比、P/B、EPS、殖利率、52W 高／低）存於磁碟 JSON，TTL 一天
+2. stale-while-revalidate：過期資料立即回傳，背景重抓
+3. 記錄查詢次數（只算抓取成功的代碼，最多保留 MAX_HITS 檔）；
+   JobQueue 定期替最常被查的代碼在過期前預先更新
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import Counter
+from typing import Any
+
+from telegram.ext import Application, ContextTypes
+
+import market_data
+from utils import CACHE_DIR
+
+FUND_FILE = os.path.join(CACHE_DIR, "fundamentals.json")
+DAILY_TTL = 24 * 3600
+WARM_TOP = 30                 # 預熱查詢次數最多的前 N 檔
+WARM_EVERY = 3600             # 每小時檢查一次
+WARM_AHEAD = 2 * 3600         # 剩不到 2 小時就過期者先更新
+MAX_HITS = 500                # 查詢次數表最多保留的代碼數（超過兩倍時修剪）
+
+
+class FundamentalsCache:
+    def __init__(self, path: str = FUND_FILE, ttl: float = DAILY_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._rows: dict[str, dict[str, Any]] = {}
+        self._ts: dict[str, float] = {}
+        self._hits: Counter[str] = Counter()
+        self._refreshing: dict[str, asyncio.Task] = {}
+        self._load()
+
+    # ---------- 磁碟 ----------
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return
+        for tk, ent in data.get("entries", {}).items():
+            self._rows[tk], self._ts[tk] = ent["rows"], ent["ts"]
+        self._hits.update(data.get("hits", {}))
+        self._trim_hits()
+
+    def _dump(self) -> dict:
+        return {
+            "entries": {tk: {"ts": self._ts[tk], "rows": rows} for tk, rows in self._rows.items()},
+            "hits": dict(self._hits.most_common(MAX_HITS)),
+        }
+
+    def _save(self, data: dict) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    # ---------- 抓取 ----------
+    def age(self, tk: str) -> float:
+        return time.time() - self._ts.get(tk, float("-inf"))
+
+    async def _fetch(self, tk: str) -> dict[str, Any]:
+        rows = await market_data.fundamentals(tk)
+        self._rows[tk], self._ts[tk] = rows, time.time()
+        await asyncio.to_thread(self._save, self._dump())
+        return rows
+
+    def refresh(self, tk: str) -> "asyncio.Task[dict[str, Any]]":
+        """背景重抓；同一檔同時只會有一個"""
+        task = self._refreshing.get(tk)
+        if task is None or task.done():
+            task = self._refreshing[tk] = asyncio.ensure_future(self._fetch(tk))
+            task.add_done_callback(lambda t: self._log_failure(tk, t))
+        return task
+
+    def _log_failure(self, tk: str, task: asyncio.Task) -> None:
+        self._refreshing.pop(tk, None)
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning("fundamentals %s refresh failed: %r", tk, task.exception())
+
+    async def get(self, tk: str) -> dict[str, Any]:
+        """有資料就立即回傳（過期則背景更新）；從未抓過才等待"""
+        tk = tk.upper()
+        rows = self._rows.get(tk)
+        if rows is None:
+            rows = await asyncio.shield(self.refresh(tk))  # 抓取失敗（如代碼打錯）不記次數
+        elif self.age(tk) >= self.ttl:
+            self.refresh(tk)
+        self._hits[tk] += 1
+        if len(self._hits) > 2 * MAX_HITS:
+            self._trim_hits()
+        return rows
+
+    def _trim_hits(self) -> None:
+        self._hits = Counter(dict(self._hits.most_common(MAX_HITS)))
+
+    # ---------- 預熱 ----------
+    def popular(self, n: int = WARM_TOP) -> list[str]:
+        return [tk for tk, _ in self._hits.most_common(n)]
+
+    async def warm(self, n: int = WARM_TOP, ahead: float = WARM_AHEAD) -> int:
+        """更新熱門代碼中即將過期者，回傳更新檔數"""
+        due = [tk for tk in self.popular(n) if self.age(tk) >= self.ttl - ahead]
+        await asyncio.gather(*(self.refresh(tk) for tk in due), return_exceptions=True)
+        return len(due)
+
+
+FUNDAMENTALS = FundamentalsCache()
+
+
+async def _warm_job(c: ContextTypes.DEFAULT_TYPE):
+    n = await FUNDAMENTALS.warm()
+    if n:
+        logging.info("fundamentals: warmed %d tickers", n)
+
+
+def schedule_fundamentals(app: Application) -> None:
+    """註冊熱門代碼的基本面預熱；需安裝 python-telegram-bot[job-queue]"""
+    if app.job_queue is None:
+        logging.warning("JobQueue 未啟用，/fund 快取將只在查詢時更新")
+        return
+    app.job_queue.run_repeating(_warm_job, interval=WARM_EVERY, first=60, name="fundamentals")
@@ -1,65 +1,284 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
 from datetime import date, timedelta
 import datetime
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import yfinance as yf
 import twstock
 
+from indicators import to_panel
+from metrics import FETCH_FAILURES, timed_fetch
+from ohlcv_store import STORE, normalize_bars
+from utils import CACHE_DIR
+
+_FRESH_SECS = 15 * 60   # 15 分鐘內檢查過就直接讀本地
+_OVERLAP_DAYS = 10      # 補資料時與本地重疊的天數（用來偵測還原價位移）
+_DRIFT_TOL = 0.005      # 重疊區收盤差異 > 0.5% 視為除權息／分割 → 整檔重建
+
+# TWSE 月資料：共用連線池、全域併發上限（避免被 TWSE 限流封鎖）
+_TWSE_MAX_CONCURRENCY = 3
+_TWSE_SLOTS = threading.BoundedSemaphore(_TWSE_MAX_CONCURRENCY)
+_TWSE_MONTH_DIR = os.path.join(CACHE_DIR, "twse")
+_twse_session = requests.Session()
+_twse_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=_TWSE_MAX_CONCURRENCY))
+
+def _twse_date(s: str) -> datetime.datetime:
+    """'114/07/01'（民國）或 '2025/07/01' → datetime"""
+    y, m, d = (int(x) for x in s.split("/"))
+    return datetime.datetime(y + 1911 if y < 1911 else y, m, d)
+
+def _twse_month_path(code: str, y: int, m: int) -> str:
+    return os.path.join(_TWSE_MONTH_DIR, code, f"{y}{m:02d}.csv")
+
 def _twse_month(code: str, y: int, m: int) -> pd.DataFrame:
+    today = date.today()
+    done = (y, m) < (today.year, today.month)  # 已結束的月份不會再變動
+    path = _twse_month_path(code, y, m)
+    if done and os.path.exists(path):
+        return pd.read_csv(path, index_col="Date", parse_dates=["Date"])
+
     ym = f"{y}{m:02d}01"
     url = (
         "https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=json&date="
         f"{ym}&stockNo={code}"
     )
     try:
-        j = requests.get(url, timeout=10).json()
+        with _TWSE_SLOTS, timed_fetch("twse"):
+            j = _twse_session.get(url, timeout=10).json()
     except Exception:
         return pd.DataFrame()
     if j.get("stat") != "OK":
         return pd.DataFrame()
     rows = []
     for r in j["data"]:
-        dt = datetime.datetime.strptime(r[0], "%Y/%m/%d")
-        rows.append([dt, *[float(x.replace(",", "")) for x in r[3:7]]])
-    return pd.DataFrame(rows, columns=["Date", "Open", "High", "Low", "Close"]).set_index("Date")
+        try:
+            rows.append([_twse_date(r[0]), *[float(x.replace(",", "")) for x in (*r[3:7], r[1])]])
+        except ValueError:
+            continue  # 當日無成交（價格為 "--"）
+    df = pd.DataFrame(rows, columns=["Date", "Open", "High", "Low", "Close", "Volume"]).set_index("Date")
+    if done and not df.empty:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_csv(path + ".tmp")
+        os.replace(path + ".tmp", path)
+    return df
 
 def _twse_history(code: str, months: int = 6) -> pd.DataFrame:
     today = date.today()
-    frames: list[pd.DataFrame] = []
+    yms = []
     for i in range(months):
         y, m = divmod(today.year * 12 + today.month - 1 - i, 12)
-        m += 1
-        frames.append(_twse_month(code, y, m))
+        yms.append((y, m + 1))
+    with ThreadPoolExecutor(max_workers=_TWSE_MAX_CONCURRENCY) as ex:
+        frames = list(ex.map(lambda ym: _twse_month(code, *ym), yms))
     df = pd.concat(frames).sort_index()
     return df.astype(float)
 
-def _yf_history(tk: str, months: int = 6) -> pd.DataFrame:
-    tkr = yf.Ticker(tk)
-    df = tkr.history(period=f"{months}mo", interval="1d", auto_adjust=True)
-    if not df.empty:
-        return df.astype(float)
-    df = yf.download(tk, period=f"{months}mo", interval="1d", auto_adjust=True, progress=False)
+def _yf_history(tk: str, months: int = 6, start: date | None = None) -> pd.DataFrame:
+    span = {"start": start} if start else {"period": f"{months}mo"}
+    with timed_fetch("yfinance"):
+        tkr = yf.Ticker(tk)
+        df = tkr.history(interval="1d", auto_adjust=True, **span)
+        if df.empty:
+            df = yf.download(tk, interval="1d", auto_adjust=True, progress=False, **span)
+    if df.empty:
+        FETCH_FAILURES.inc(source="yfinance")
     return df.astype(float)
 
-def get_history(code: str, months: int = 6) -> pd.DataFrame:
-    def _is_tw(code: str) -> bool:
-        return code.isdigit() or code.upper().endswith(".TW")
-
+def _ticker(code: str) -> str:
     tk = code.upper()
     if not tk.endswith(".TW") and tk.isdigit():
         tk += ".TW"
-    df = _yf_history(tk, months)
+    return tk
+
+def _fetch(tk: str, start: date) -> pd.DataFrame:
+    """依序嘗試 Yahoo → TWSE → twstock，回傳 start 之後的日 K"""
+    def _is_tw(code: str) -> bool:
+        return code.isdigit() or code.upper().endswith(".TW")
+
+    months = (date.today().year - start.year) * 12 + date.today().month - start.month + 1
+    df = _yf_history(tk, months, start=start)
     if not df.empty:
-        return df
+        return normalize_bars(df)
     if _is_tw(tk):
         num = tk.split(".")[0]
         df = _twse_history(num, months)
         if not df.empty:
-            return df
+            return normalize_bars(df[df.index >= pd.Timestamp(start)])
         stock = twstock.Stock(num)
-        start = date.today() - timedelta(days=months * 31)
-        raw = stock.fetch_from(start.year, start.month)
+        with timed_fetch("twstock"):
+            raw = stock.fetch_from(start.year, start.month)
         if raw:
-            rows = [(x.date, x.open, x.high, x.low, x.close) for x in raw]
-            return pd.DataFrame(rows, columns=["Date", "Open", "High", "Low", "Close"]).set_index("Date").astype(float)
-    raise ValueError("無法取得歷史資料，稍後再試 🙏")
+            rows = [(x.date, x.open, x.high, x.low, x.close, x.capacity) for x in raw]
+            df = pd.DataFrame(rows, columns=["Date", "Open", "High", "Low", "Close", "Volume"]).set_index("Date")
+            return normalize_bars(df[df.index >= pd.Timestamp(start)])
+    return normalize_bars(pd.DataFrame())
+
+def _drifted(cached: pd.DataFrame, new: pd.DataFrame) -> bool:
+    """重疊區收盤差異超過 _DRIFT_TOL（除權息／分割後還原價位移）；
+    本地最後一根可能是盤中 K 棒，不納入比較"""
+    overlap = cached.index[:-1].intersection(new.index)
+    if not len(overlap):
+        return False
+    old_c, new_c = cached.loc[overlap, "Close"], new.loc[overlap, "Close"]
+    return bool(((new_c - old_c).abs() / old_c).max() > _DRIFT_TOL)
+
+def _top_up(tk: str, cached: pd.DataFrame, since: date) -> pd.DataFrame:
+    """只抓本地最後一根之後（含少量重疊）的 K 棒；重疊區價位移則整檔重建
+
+    更新成功（或資料源暫時沒資料）時記下 checked；位移但重建失敗時原樣回傳本地資料、
+    不記 checked，下次查詢再重試
+    """
+    start = (cached.index[-1] - pd.Timedelta(days=_OVERLAP_DAYS)).date()
+    new = _fetch(tk, start)
+    if new.empty:
+        STORE.set_meta(tk, checked=time.time())
+        return cached  # 資料源暫時失敗 → 先用本地資料
+    if _drifted(cached, new):
+        full = _fetch(tk, since)
+        if full.empty:
+            return cached  # 不可把新的還原價接在舊價位上
+        STORE.replace(tk, full)
+        STORE.set_meta(tk, checked=time.time())
+        return full
+    STORE.append(tk, new[new.index >= cached.index[-1]])
+    STORE.set_meta(tk, checked=time.time())
+    return STORE.read(tk)
+
+def get_history(code: str, months: int = 6) -> pd.DataFrame:
+    tk = _ticker(code)
+    since = date.today() - timedelta(days=months * 31)
+    meta = STORE.meta(tk)
+    cached = STORE.read(tk)
+    covered = not cached.empty and meta.get("since", "9999-12-31") <= since.isoformat()
+
+    if covered and time.time() - meta.get("checked", 0) < _FRESH_SECS:
+        df = cached
+    elif covered:
+        df = _top_up(tk, cached, date.fromisoformat(meta["since"]))
+    else:
+        df = _fetch(tk, since)
+        if df.empty:
+            raise ValueError("無法取得歷史資料，稍後再試 🙏")
+        STORE.replace(tk, df)
+        STORE.set_meta(tk, since=since.isoformat(), checked=time.time())
+
+    df = df[df.index >= pd.Timestamp(since)]
+    if df.empty:
+        raise ValueError("無法取得歷史資料，稍後再試 🙏")
+    return df
+
+
+# ─────────────────── 多檔批次下載 ────────────────────
+@dataclass
+class ChunkReport:
+    """單一批次的下載紀錄"""
+    index: int
+    tickers: list[str]
+    attempts: int = 0
+    seconds: float = 0.0
+    failed: list[str] = field(default_factory=list)
+    error: str | None = None
+
+
+def _split_wide(wide: pd.DataFrame, tickers: list[str]) -> dict[str, pd.DataFrame]:
+    """yf.download(group_by="ticker") 的寬表 → {代碼: 日 K}"""
+    out: dict[str, pd.DataFrame] = {}
+    if wide is None or wide.empty:
+        return out
+    if not isinstance(wide.columns, pd.MultiIndex):  # 只有一檔時不會分層
+        wide = pd.concat({tickers[0]: wide}, axis=1)
+    for tk in tickers:
+        if tk not in wide.columns.get_level_values(0):
+            continue
+        df = wide[tk].dropna(how="all")
+        if not df.empty:
+            out[tk] = df.astype(float)
+    return out
+
+
+def download_bulk(
+    tickers: list[str],
+    start: date,
+    end: date | None = None,
+    chunk_size: int = 100,
+    retries: int = 2,
+    auto_adjust: bool = False,
+) -> tuple[dict[str, pd.DataFrame], list[ChunkReport]]:
+    """每批 chunk_size 檔一次向 Yahoo 取資料，失敗時整批重試"""
+    frames: dict[str, pd.DataFrame] = {}
+    reports: list[ChunkReport] = []
+    for i in range(0, len(tickers), chunk_size):
+        chunk = tickers[i:i + chunk_size]
+        rep = ChunkReport(index=i // chunk_size, tickers=chunk)
+        t0 = time.perf_counter()
+        got: dict[str, pd.DataFrame] = {}
+        while rep.attempts <= retries:
+            rep.attempts += 1
+            try:
+                with timed_fetch("yfinance"):
+                    wide = yf.download(
+                        chunk, start=start, end=end, interval="1d", group_by="ticker",
+                        auto_adjust=auto_adjust, threads=True, progress=False,
+                    )
+                got = _split_wide(wide, chunk)
+                rep.error = None
+            except Exception as e:  # 連線錯誤 / 被限流
+                rep.error = repr(e)
+            if got or rep.attempts > retries:
+                break  # 最後一次失敗後不必再等
+            time.sleep(min(2 ** rep.attempts, 10))
+        rep.seconds = time.perf_counter() - t0
+        rep.failed = [tk for tk in chunk if tk not in got]
+        frames.update(got)
+        reports.append(rep)
+        logging.info(
+            "bulk chunk %d: %d/%d ok, %d attempt(s), %.1fs",
+            rep.index, len(got), len(chunk), rep.attempts, rep.seconds,
+        )
+    return frames, reports
+
+
+# ─────────────────── 全市場本地面板 ────────────────────
+def warm_store(tickers: list[str], months: int = 6, chunk_size: int = 100) -> int:
+    """以批次下載把多檔日 K 寫入本地倉庫（/patternscan 等全市場功能的資料來源）"""
+    since = date.today() - timedelta(days=months * 31)
+    frames, _ = download_bulk(tickers, since, chunk_size=chunk_size, auto_adjust=True)
+    for tk, raw in frames.items():
+        df = normalize_bars(raw)
+        if df.empty:
+            continue
+        meta = STORE.meta(tk)
+        if meta.get("since", "9999-12-31") <= since.isoformat() and not _drifted(STORE.read(tk), df):
+            STORE.append(tk, df)  # 本地涵蓋更長的歷史且價位一致 → 只覆蓋重疊區
+            STORE.set_meta(tk, checked=time.time())
+        else:  # 尚無資料，或重疊區價位移（除權息）→ 以這次下載的區間整檔重建
+            STORE.replace(tk, df)
+            STORE.set_meta(tk, since=since.isoformat(), checked=time.time())
+    return len(frames)
+
+
+def load_panel(
+    tickers: list[str], months: int = 6, fields: tuple[str, ...] = ("High", "Low", "Close"),
+) -> tuple[pd.DatetimeIndex, list[str], dict[str, np.ndarray]]:
+    """只讀本地倉庫 → (日期, 代碼, {欄位: 日期 × 代碼 陣列})；不碰網路"""
+    since = pd.Timestamp(date.today() - timedelta(days=months * 31))
+    frames = {}
+    for tk in tickers:
+        df = STORE.read(tk)
+        df = df[df.index >= since]
+        if not df.empty:
+            frames[tk] = df
+    if not frames:
+        return pd.DatetimeIndex([]), [], {}
+    panels = {}
+    for f in fields:
+        dates, cols, panels[f] = to_panel(frames, f)
+    return dates, cols, panels
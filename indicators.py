@@ -0,0 +1,135 @@
+"""
+indicators.py
+-------------
+共用技術指標（NumPy 向量化）
+- 輸入可為 1 維（單檔）或 2 維（日期 × 股票）陣列，輸出維度相同
+- 移動平均以累積和計算，Wilder / EMA 以時間軸遞迴、股票軸向量化
+- NaN（停牌、未上市）會在視窗內傳遞：視窗含 NaN → 結果為 NaN，
+  與 pandas rolling(n).mean() 的預設行為一致
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+__all__ = ["sma", "rsi", "ema", "rolling_max", "rolling_min", "kd", "forward_up", "to_panel"]
+
+
+def _as2d(x) -> tuple[np.ndarray, bool]:
+    a = np.asarray(x, dtype=float)
+    return (a[:, None], True) if a.ndim == 1 else (a, False)
+
+
+def _out(a: np.ndarray, was_1d: bool) -> np.ndarray:
+    return a[:, 0] if was_1d else a
+
+
+def _diff(a: np.ndarray) -> np.ndarray:
+    d = np.full_like(a, np.nan)
+    d[1:] = a[1:] - a[:-1]
+    return d
+
+
+# ─────────────────── 移動平均 ────────────────────
+def sma(x, n: int) -> np.ndarray:
+    """簡單移動平均（累積和相減），視窗未滿或含 NaN → NaN"""
+    a, one = _as2d(x)
+    valid = ~np.isnan(a)
+    zero = np.zeros((1, a.shape[1]))
+    csum = np.concatenate([zero, np.cumsum(np.where(valid, a, 0.0), axis=0)])
+    ccnt = np.concatenate([zero, np.cumsum(valid, axis=0)])
+    out = np.full_like(a, np.nan)
+    if len(a) >= n:
+        win_sum = csum[n:] - csum[:-n]
+        win_cnt = ccnt[n:] - ccnt[:-n]
+        out[n - 1:] = np.where(win_cnt == n, win_sum / n, np.nan)
+    return _out(out, one)
+
+
+def ema(x, com: float | None = None, span: float | None = None,
+        alpha: float | None = None) -> np.ndarray:
+    """指數移動平均，等同 pandas ewm(adjust=True, ignore_na=False).mean()"""
+    if alpha is None:
+        alpha = 1 / (1 + com) if com is not None else 2 / (span + 1)
+    a, one = _as2d(x)
+    decay = 1 - alpha
+    out = np.full_like(a, np.nan)
+    num = np.zeros(a.shape[1])
+    den = np.zeros(a.shape[1])
+    for t in range(len(a)):
+        ok = ~np.isnan(a[t])
+        num = decay * num + np.where(ok, a[t], 0.0)
+        den = decay * den + ok
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[t] = np.where(den > 0, num / den, np.nan)
+    return _out(out, one)
+
+
+def _wilder(a: np.ndarray, n: int) -> np.ndarray:
+    """Wilder 平滑：前 n 筆以 SMA 起始，之後 avg = avg + (x - avg) / n"""
+    out = sma(a, n)
+    prev = out[n - 1].copy() if len(a) >= n else np.full(a.shape[1], np.nan)
+    for t in range(n, len(a)):
+        v = a[t]
+        # 若之前尚未起始（前段有 NaN），以該點的 SMA 重新起始
+        prev = np.where(np.isnan(prev), out[t], prev + (v - prev) / n)
+        out[t] = prev
+    return out
+
+
+# ─────────────────── 動能指標 ────────────────────
+def rsi(x, n: int = 14, wilder: bool = False) -> np.ndarray:
+    """RSI；預設為本專案一貫的簡易版（平均漲跌幅取 SMA），wilder=True 為 Wilder 平滑"""
+    a, one = _as2d(x)
+    d = _diff(a)
+    gain = np.where(np.isnan(d), np.nan, np.clip(d, 0, None))
+    loss = np.where(np.isnan(d), np.nan, np.clip(-d, 0, None))
+    if wilder:
+        avg_gain, avg_loss = _wilder(gain, n), _wilder(loss, n)
+    else:
+        avg_gain, avg_loss = sma(gain, n), sma(loss, n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = 100 - 100 / (1 + avg_gain / avg_loss)
+    return _out(out, one)
+
+
+def rolling_max(x, n: int) -> np.ndarray:
+    a, one = _as2d(x)
+    out = np.full_like(a, np.nan)
+    if len(a) >= n:
+        out[n - 1:] = sliding_window_view(a, n, axis=0).max(axis=-1)
+    return _out(out, one)
+
+
+def rolling_min(x, n: int) -> np.ndarray:
+    a, one = _as2d(x)
+    out = np.full_like(a, np.nan)
+    if len(a) >= n:
+        out[n - 1:] = sliding_window_view(a, n, axis=0).min(axis=-1)
+    return _out(out, one)
+
+
+def kd(high, low, close, n: int = 9, com: float = 2) -> tuple[np.ndarray, np.ndarray]:
+    """KD 隨機指標：RSV(n) → K = EMA(RSV)，D = EMA(K)"""
+    lo, hi = rolling_min(low, n), rolling_max(high, n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rsv = (np.asarray(close, dtype=float) - lo) / (hi - lo) * 100
+    k = ema(rsv, com=com)
+    return k, ema(k, com=com)
+
+
+def forward_up(x, horizon: int = 5) -> np.ndarray:
+    """標籤：horizon 日後收盤 > 今日收盤 → 1，未來未知視為 0（同 shift(-h) > x）"""
+    a, one = _as2d(x)
+    fwd = np.full_like(a, np.nan)
+    fwd[:-horizon] = a[horizon:]
+    with np.errstate(invalid="ignore"):
+        return _out((fwd > a).astype(np.int8), one)
+
+
+# ─────────────────── 面板工具 ────────────────────
+def to_panel(frames: dict[str, pd.DataFrame], field: str) -> tuple[pd.DatetimeIndex, list[str], np.ndarray]:
+    """{代碼: K 線} → (日期, 代碼, 日期 × 代碼 陣列)；缺值為 NaN"""
+    wide = pd.concat({tk: df[field] for tk, df in frames.items()}, axis=1).sort_index()
+    return wide.index, list(wide.columns), wide.to_numpy(dtype=float)
@@ -0,0 +1,213 @@
+"""
+job_scheduler.py
+----------------
+重量級工作（/top10 全市場掃描、/model 訓練）的准入控制與排程
+1. 固定 worker 預算：同時最多佔用 HEAVY_WORKERS 個行程名額，其餘依序排隊（可回報排隊位置）；
+   自己再開 process pool 的工作（/top10 訓練）以 weight 佔用多個名額
+2. 每位使用者限流：滑動視窗內最多 RATE_LIMIT 次新工作、同時最多 MAX_PER_USER 個
+3. 相同 key 的進行中工作合併，只算一次
+4. 逾時真的會停：run_in_process() 在子行程執行，逾時或取消時直接 terminate
+   （子行程自 forkserver 分出並預載 ai_single，啟動只需數毫秒；nice 降低優先權，
+    讓 /price 等便宜指令不受影響）
+"""
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import logging
+import multiprocessing as mp
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Hashable
+
+from metrics import register_gauge
+
+HEAVY_WORKERS = int(os.environ.get("HEAVY_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+RATE_LIMIT = int(os.environ.get("HEAVY_RATE_LIMIT", 5))   # 每個視窗內的新工作數
+RATE_WINDOW = 60.0                                          # 秒
+MAX_PER_USER = 2                                            # 同一使用者同時進行中的工作數
+JOB_NICE = 10
+
+if "forkserver" in mp.get_all_start_methods():
+    _CTX = mp.get_context("forkserver")
+    _CTX.set_forkserver_preload(["ai_single"])
+else:
+    _CTX = mp.get_context("spawn")
+
+
+class RateLimited(Exception):
+    """retry_after：幾秒後可再送出；None 代表需等自己進行中的工作結束"""
+
+    def __init__(self, retry_after: float | None):
+        super().__init__("rate limited" if retry_after is None else f"retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+# ─────────────────── 排程器 ────────────────────
+class JobScheduler:
+    def __init__(
+        self,
+        workers: int = HEAVY_WORKERS,
+        rate: int = RATE_LIMIT,
+        window: float = RATE_WINDOW,
+        per_user: int = MAX_PER_USER,
+    ):
+        self.workers = workers
+        self.rate = rate
+        self.window = window
+        self.per_user = per_user
+        self._running = 0
+        self._waiters: deque[tuple[asyncio.Future, int]] = deque()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._history: dict[int, deque[float]] = {}
+        self._active: Counter[int] = Counter()
+
+    def admit(self, user: int) -> None:
+        """限流檢查並記錄一次新工作；超過時拋出 RateLimited"""
+        if self._active[user] >= self.per_user:
+            raise RateLimited(None)
+        now = time.monotonic()
+        hist = self._history.setdefault(user, deque())
+        while hist and now - hist[0] >= self.window:
+            hist.popleft()
+        if len(hist) >= self.rate:
+            raise RateLimited(self.window - (now - hist[0]))
+        hist.append(now)
+
+    def queue_depth(self) -> int:
+        return sum(not f.done() for f, _ in self._waiters)
+
+    def inflight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    # ---------- worker 預算 ----------
+    async def _acquire(self, weight: int, on_queued: Callable[[int], Awaitable[Any]] | None) -> None:
+        if self._running + weight <= self.workers and not self._waiters:
+            self._running += weight
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append((fut, weight))
+        if on_queued is not None:
+            try:
+                await on_queued(self.queue_depth())
+            except Exception as e:
+                logging.warning("queue notice failed: %r", e)
+        try:
+            await fut  # _wake() 已替排頭的等待者佔好名額
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release(weight)
+            else:
+                if (fut, weight) in self._waiters:
+                    self._waiters.remove((fut, weight))
+                self._wake()  # 排頭離開後，後面較小的工作可能已可開始
+            raise
+
+    def _release(self, weight: int) -> None:
+        self._running -= weight
+        self._wake()
+
+    def _wake(self) -> None:
+        """依到達順序把空出的名額交給排隊者；排頭名額不足時後面的也等（不插隊）"""
+        while self._waiters:
+            fut, weight = self._waiters[0]
+            if fut.done():
+                self._waiters.popleft()
+                continue
+            if self._running + weight > self.workers:
+                return
+            self._waiters.popleft()
+            self._running += weight
+            fut.set_result(None)
+
+    async def _run(self, make, timeout, weight, on_queued):
+        await self._acquire(weight, on_queued)
+        try:
+            return await asyncio.wait_for(make(), timeout)
+        finally:
+            self._release(weight)
+
+    # ---------- 對外介面 ----------
+    async def submit(
+        self,
+        key: Hashable,
+        make: Callable[[], Awaitable[Any]],
+        *,
+        user: int | None = None,
+        charge: bool = True,
+        timeout: float | None = None,
+        weight: int = 1,
+        on_queued: Callable[[int], Awaitable[Any]] | None = None,
+    ) -> Any:
+        """執行 make()（同 key 進行中則共用結果）；user=None 為系統工作，不限流
+
+        charge=False：同一指令已准入過的後續工作，只計入 user 進行中的工作數、不再限流檢查
+        weight：make() 會同時使用的行程數（上限為總預算），佔用同樣多個名額
+
+        逾時拋出 asyncio.TimeoutError，make() 建立的 coroutine 會被取消
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            if user is not None:
+                if charge:
+                    self.admit(user)
+                self._active[user] += 1
+            weight = max(1, min(weight, self.workers))
+            task = asyncio.ensure_future(self._run(make, timeout, weight, on_queued))
+            self._inflight[key] = task
+
+            def _done(t: asyncio.Task) -> None:
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+                if user is not None:
+                    self._active[user] -= 1
+                    if self._active[user] <= 0:
+                        del self._active[user]
+
+            task.add_done_callback(_done)
+        # shield：單一等待者離開不影響其他人共用的工作
+        return await asyncio.shield(task)
+
+
+JOBS = JobScheduler()
+register_gauge(JOBS.queue_depth, executor="heavy_jobs")
+
+
+# ─────────────────── 子行程執行 ────────────────────
+def _child(conn, fn: Callable[..., Any], args: tuple) -> None:
+    if hasattr(os, "nice"):
+        os.nice(JOB_NICE)
+    try:
+        result = (True, fn(*args))
+    except Exception as e:
+        result = (False, RuntimeError(repr(e)))
+    try:
+        conn.send(result)
+    finally:
+        conn.close()
+
+
+def _wait(recv):
+    try:
+        return recv.recv()
+    finally:
+        recv.close()  # 取消時也由這個執行緒關閉，避免關閉仍在讀取的 fd
+
+
+async def run_in_process(fn: Callable[..., Any], *args) -> Any:
+    """在獨立子行程執行 fn(*args)；被取消（含逾時）時立即 terminate"""
+    recv, send = _CTX.Pipe(duplex=False)
+    proc = _CTX.Process(target=_child, args=(send, fn, args), daemon=True)
+    proc.start()
+    send.close()
+    try:
+        ok, value = await asyncio.to_thread(_wait, recv)
+    except EOFError:  # 子行程異常結束（被 OOM kill 等）
+        ok, value = False, None
+    finally:
+        if proc.is_alive():
+            proc.terminate()
+        await asyncio.to_thread(proc.join, 1)  # 不在事件迴圈上阻塞等子行程結束
+    if not ok:
+        raise value or RuntimeError(f"job process exited with code {proc.exitcode}")
+    return value
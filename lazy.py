@@ -0,0 +1,123 @@
+"""
+lazy.py
+-------
+延遲載入 handler：縮短冷啟動（Render 閒置喚醒）時間
+1. handler("stock_info_handler", "price_cmd") 回傳輕量 proxy，第一次被呼叫時才
+   在背景執行緒 import 真正的模組（matplotlib / yfinance / lightgbm …）
+2. prewarm()：bot 開始回應後在背景依序載入，並於載入後執行排程註冊
+3. 每個模組的 import 耗時記錄在 LOAD_TIMES；直接執行本檔可比較冷啟動耗時
+
+    python lazy.py
+"""
+from __future__ import annotations
+
+import sys
+import time
+import asyncio
+import logging
+import importlib
+import subprocess
+from typing import Any, Callable, Iterable
+
+LOAD_TIMES: dict[str, float] = {}
+_READY: set[str] = set()
+
+
+def load(module: str):
+    """import 模組並記錄首次載入耗時（可在任意執行緒呼叫）
+
+    另一個執行緒正在 import 同一模組時，import_module 會等它初始化完成，
+    不會拿到只載入一半的模組
+    """
+    fresh = module not in sys.modules
+    t0 = time.perf_counter()
+    mod = importlib.import_module(module)
+    if fresh:
+        LOAD_TIMES.setdefault(module, time.perf_counter() - t0)
+        logging.info("lazy: loaded %s in %.2fs", module, time.perf_counter() - t0)
+    _READY.add(module)
+    return mod
+
+
+async def aload(module: str):
+    """非阻塞版 load：已載入完成直接回傳，否則丟到執行緒 import"""
+    if module in _READY:
+        return sys.modules[module]
+    return await asyncio.to_thread(load, module)
+
+
+def handler(module: str, attr: str) -> Callable[..., Any]:
+    """handler callback 的延遲載入 proxy"""
+    target: Callable[..., Any] | None = None
+
+    async def proxy(update, context):
+        nonlocal target
+        if target is None:
+            target = getattr(await aload(module), attr)
+        return await target(update, context)
+
+    proxy.__name__ = attr
+    proxy.__qualname__ = f"lazy({module}.{attr})"
+    return proxy
+
+
+async def prewarm(
+    modules: Iterable[str],
+    hooks: Iterable[tuple[str, str]] = (),
+    app=None,
+    delay: float = 0.0,
+) -> None:
+    """背景預先載入：先處理 hooks（模組載入後以 app 呼叫，如 schedule_top10），再載入其餘模組"""
+    if delay:
+        await asyncio.sleep(delay)
+    for module, attr in hooks:
+        try:
+            getattr(await aload(module), attr)(app)
+        except Exception as e:
+            logging.error("lazy: %s.%s failed: %r", module, attr, e)
+    for module in modules:
+        try:
+            await aload(module)
+        except Exception as e:
+            logging.error("lazy: preload %s failed: %r", module, e)
+    if LOAD_TIMES:
+        logging.info("lazy: prewarm done, %s", report())
+
+
+def report() -> str:
+    return ", ".join(f"{m} {s:.2f}s" for m, s in sorted(LOAD_TIMES.items(), key=lambda x: -x[1]))
+
+
+# ─────────────────── 冷啟動量測 ────────────────────
+HEAVY = (
+    "stock_info_handler",
+    "pattern_detector",
+    "news_handler",
+    "top10_handler",
+    "model_handler",
+    "fundamentals_cache",
+    "backtest_handler",
+)
+
+
+def _cold_import(stmt: str) -> float:
+    """在全新的直譯器中量測 import 耗時"""
+    code = f"import time; t = time.perf_counter(); {stmt}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _main() -> None:
+    boot = _cold_import("import main")
+    rows = [(m, _cold_import(f"import {m}")) for m in HEAVY]
+    eager = _cold_import("; ".join(f"import {m}" for m in ("main", *HEAVY)))
+    print(f"{'module':<22}{'cold import':>12}")
+    for m, s in sorted(rows, key=lambda r: -r[1]):
+        print(f"{m:<22}{s:>11.2f}s")
+    print(f"\n{'main (lazy handlers)':<22}{boot:>11.2f}s   ← /start、/help 可回應前的等待")
+    print(f"{'main + all handlers':<22}{eager:>11.2f}s   ← 原本全部在 import 時載入")
+    print(f"{'ratio':<22}{boot / eager:>11.0%}")
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,5 +1,5 @@
 from __future__ import annotations
-import os, io, shutil, tempfile, logging, datetime
+import os, io, shutil, tempfile, logging, datetime, asyncio
 from datetime import date, timedelta, timezone
 
 import certifi
@@ -7,11 +7,9 @@ from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler
 
-from stock_info_handler import price_cmd, fund_cmd, ta_cmd, fibo_cmd
-from pattern_detector import pattern_cmd, pattern_help_cmd
-from news_handler import news_cmd
-from top10_handler import top10_cmd
-from model_handler      import model_cmd
+import lazy
+from metrics import instrument_handlers
+from update_processor import ChatOrderedProcessor
 
 # ---------- cert workaround (curl‑77) -----------------------------------
 _tmp_pem = os.path.join(tempfile.gettempdir(), "cacert.pem")
@@ -25,6 +23,46 @@ TOKEN = os.getenv("TG_TOKEN")
 logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO)
 TZ_TAIPEI = timezone(timedelta(hours=8))
 
+# ---------- update 接收模式 ----------------------------------------------
+# 設定 WEBHOOK_URL（對外網址，如 https://xxx.onrender.com）即改用 webhook，
+# 由 web_stub 在同一個 $PORT 上接收；未設定則維持 long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+TG_API_BASE = os.getenv("TG_API_BASE")  # 本機假 Bot API，例如 http://127.0.0.1:8081/bot
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 8))
+PER_CHAT_ORDER = os.getenv("PER_CHAT_ORDER", "1") != "0"  # 同一聊天室依序處理
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+_app = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+# ---------- 延遲載入 handler ---------------------------------------------
+# 指令 → (模組, 函式)；重量級模組（matplotlib / yfinance / lightgbm）在第一次使用
+# 或背景預熱時才載入，冷啟動後 /start、/help 可立即回應
+LAZY_COMMANDS = {
+    "price":       ("stock_info_handler", "price_cmd"),
+    "fund":        ("stock_info_handler", "fund_cmd"),
+    "ta":          ("stock_info_handler", "ta_cmd"),
+    "fibo":        ("stock_info_handler", "fibo_cmd"),
+    "pattern":     ("pattern_detector", "pattern_cmd"),
+    "patternhelp": ("pattern_detector", "pattern_help_cmd"),
+    "patternscan": ("pattern_detector", "patternscan_cmd"),
+    "news":        ("news_handler", "news_cmd"),
+    "top10":       ("top10_handler", "top10_cmd"),
+    "model":       ("model_handler", "model_cmd"),
+    "backtest":    ("backtest_handler", "backtest_cmd"),
+}
+# 模組載入後以 app 呼叫的排程註冊（一律在背景執行）
+SCHEDULERS = (
+    ("top10_handler", "schedule_top10"),
+    ("pattern_detector", "schedule_patternscan"),
+    ("fundamentals_cache", "schedule_fundamentals"),
+)
+PREWARM = os.getenv("PREWARM", "1") != "0"        # 0 = 只載入排程需要的模組
+PREWARM_DELAY = float(os.getenv("PREWARM_DELAY", 0))
+_prewarm: asyncio.Task | None = None
+
 # -------------------- Telegram Texts ------------------------------------
 WELCOME_TEXT = (
     "✨ *嗨嗨！歡迎來到 Stock Radar Bot* 🎯\n\n"
@@ -54,6 +92,7 @@ TA_HELP = (
     "💡 `/pattern` <個股代碼>\n\n"
     "👉  /pattern 2330   🔍 W底 / M頭...\n"
     "👉  /patternhelp     📚 型態教學\n"
+    "👉  /patternscan w   🔭 全市場型態掃描\n"
     "👉  /ta 2303 <RSI/KD>  📐 RSI/KD 指標\n"
     "👉  /fibo 0050    🔮 6M 日 K + 斐波那契\n\n"
     "🔎 支援台股美股 輸入 /patternhelp 快速分析市場！"   
@@ -82,7 +121,9 @@ AI_HELP = (
     "• 低機率 + 高 RSI → 漲多拉回風險高\n\n"
     "範例：\n"
     "`/model 2330` (預設門檻)\n"
-    "`/model 2603 0.6 50`"
+    "`/model 2603 0.6 50`\n\n"
+    "📊 `/backtest <股票代碼> [年數]`\n"
+    "→ walk-forward 回測上述規則：勝率、報酬、最大回撤"
 )
 
 # -------------------- Keyboard Layout -----------------------------------
@@ -150,27 +191,32 @@ async def help_cb(u: Update, c: ContextTypes.DEFAULT_TYPE):
                                   reply_markup=_help_keyboard("ai"))
 
 # -------------------- main ----------------------------------------------
-def run_bot():
+def build_app():
     if not TOKEN:
         raise RuntimeError("請設定環境變數 TG_TOKEN")
 
-    app = ApplicationBuilder().token(TOKEN).build()
+    builder = ApplicationBuilder().token(TOKEN)
+    if TG_API_BASE:
+        builder = builder.base_url(TG_API_BASE)
+    if PER_CHAT_ORDER:
+        builder = builder.concurrent_updates(ChatOrderedProcessor(CONCURRENT_UPDATES))
+    else:
+        builder = builder.concurrent_updates(CONCURRENT_UPDATES)
+    app = builder.post_init(_post_init).build()
 
     # 指令 handlers
     app.add_handler(CommandHandler(["start", "hello"], start_cmd))
     app.add_handler(CommandHandler("help", help_cmd))
-    app.add_handler(CommandHandler("price", price_cmd))
-    app.add_handler(CommandHandler("fund", fund_cmd))
-    app.add_handler(CommandHandler("ta", ta_cmd))
-    app.add_handler(CommandHandler("fibo", fibo_cmd))
-    app.add_handler(CommandHandler("pattern", pattern_cmd))
-    app.add_handler(CommandHandler("patternhelp", pattern_help_cmd))
-    app.add_handler(CommandHandler("news", news_cmd))
-    app.add_handler(CommandHandler("top10", top10_cmd))
-    app.add_handler(CommandHandler("model", model_cmd))
+    for cmd, (module, attr) in LAZY_COMMANDS.items():
+        app.add_handler(CommandHandler(cmd, lazy.handler(module, attr)))
 
     # Callback (inline button) handler
-    app.add_handler(CallbackQueryHandler(help_cb))
+    app.add_handler(CallbackQueryHandler(help_cb, pattern="^help_"))
+    app.add_handler(CallbackQueryHandler(
+        lazy.handler("top10_handler", "top10_cancel_cb"), pattern="^top10_cancel$"))
+
+    # 每個指令的延遲／例外計數（/metrics）
+    instrument_handlers(app)
 
     # 全域錯誤回傳 Telegram
     async def err_handler(update, context):
@@ -185,9 +231,49 @@ def run_bot():
             )
         logging.error(err)
     app.add_error_handler(err_handler)
+    return app
+
+async def _post_init(app) -> None:
+    """bot 開始回應後，背景註冊排程（/top10 收盤後掃描等）並預載 handler 模組"""
+    global _prewarm
+    modules = dict.fromkeys(m for m, _ in LAZY_COMMANDS.values()) if PREWARM else ()
+    _prewarm = asyncio.create_task(lazy.prewarm(modules, SCHEDULERS, app, PREWARM_DELAY))
+
+async def _serve_webhook(app) -> None:
+    """webhook 模式：不自行開 port，update 由 web_stub 經 feed_webhook() 送進來"""
+    global _app, _loop
+    async with app:
+        await app.start()
+        await _post_init(app)
+        await app.bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+        _app, _loop = app, asyncio.get_running_loop()
+        logging.info("Bot started (webhook %s)…", WEBHOOK_PATH)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            _app = None
+            await app.stop()
 
+def feed_webhook(payload: dict) -> bool:
+    """由 HTTP 執行緒呼叫：把 Telegram 推來的 update 放入 bot 佇列；bot 尚未就緒回 False"""
+    app, loop = _app, _loop
+    if app is None or loop is None:
+        return False
+    update = Update.de_json(payload, app.bot)
+    asyncio.run_coroutine_threadsafe(app.update_queue.put(update), loop)
+    return True
+
+def run_bot():
+    app = build_app()
+    if WEBHOOK_URL:
+        asyncio.run(_serve_webhook(app))
+        return
     logging.info("Bot started…")
-    app.run_polling(allowed_updates=["message", "callback_query"])
+    app.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == "__main__":
     run_bot()
@@ -0,0 +1,93 @@
+"""
+market_clock.py
+---------------
+交易時段工具（台股：台北時間；美股：紐約時間）
+判斷是否盤中、下一次開盤、快取 TTL
+註：僅排除週末，未內建國定假日
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+TZ_TAIPEI = timezone(timedelta(hours=8))
+TW_OPEN = time(9, 0)
+TW_CLOSE = time(13, 30)
+TW_SETTLE = time(14, 30)  # 收盤後 Yahoo 仍會修正當日 K 棒，視為盤中
+
+TZ_NY = ZoneInfo("America/New_York")  # 自動處理夏令時間
+US_OPEN = time(9, 30)
+US_CLOSE = time(16, 0)
+
+
+def now_tw() -> datetime:
+    return datetime.now(TZ_TAIPEI)
+
+
+def _is_weekday(d: date) -> bool:
+    return d.weekday() < 5
+
+
+def tw_is_open(now: datetime | None = None) -> bool:
+    now = (now or now_tw()).astimezone(TZ_TAIPEI)
+    return _is_weekday(now.date()) and TW_OPEN <= now.time() < TW_CLOSE
+
+
+def next_tw_open(now: datetime | None = None) -> datetime:
+    now = (now or now_tw()).astimezone(TZ_TAIPEI)
+    d = now.date()
+    if now.time() >= TW_OPEN:
+        d += timedelta(days=1)
+    while not _is_weekday(d):
+        d += timedelta(days=1)
+    return datetime.combine(d, TW_OPEN, TZ_TAIPEI)
+
+
+def tw_session_date(now: datetime | None = None) -> date:
+    """目前最新一根日 K 所屬交易日（開盤前算前一交易日）"""
+    now = (now or now_tw()).astimezone(TZ_TAIPEI)
+    d = now.date()
+    if now.time() < TW_OPEN:
+        d -= timedelta(days=1)
+    while not _is_weekday(d):
+        d -= timedelta(days=1)
+    return d
+
+
+def tw_ttl(now: datetime | None = None, intraday: float = 300.0) -> float:
+    """盤中（含收盤後結算時段）→ intraday 秒；其餘 → 直到下次開盤"""
+    now = (now or now_tw()).astimezone(TZ_TAIPEI)
+    if _is_weekday(now.date()) and TW_OPEN <= now.time() < TW_SETTLE:
+        return intraday
+    return max((next_tw_open(now) - now).total_seconds(), intraday)
+
+
+# ─────────────────── 美股 ────────────────────
+def us_is_open(now: datetime | None = None) -> bool:
+    now = (now or now_tw()).astimezone(TZ_NY)
+    return _is_weekday(now.date()) and US_OPEN <= now.time() < US_CLOSE
+
+
+def next_us_open(now: datetime | None = None) -> datetime:
+    now = (now or now_tw()).astimezone(TZ_NY)
+    d = now.date()
+    if now.time() >= US_OPEN:
+        d += timedelta(days=1)
+    while not _is_weekday(d):
+        d += timedelta(days=1)
+    return datetime.combine(d, US_OPEN, TZ_NY)
+
+
+def is_tw_ticker(tk: str) -> bool:
+    tk = tk.upper()
+    return tk.isdigit() or tk.endswith((".TW", ".TWO"))
+
+
+def quote_ttl(tk: str, now: datetime | None = None, intraday: float = 15.0) -> float:
+    """報價快取秒數：所屬市場盤中 → intraday；休市 → 直到下次開盤"""
+    now = now or now_tw()
+    if is_tw_ticker(tk):
+        return tw_ttl(now, intraday)
+    if us_is_open(now):
+        return intraday
+    return max((next_us_open(now) - now).total_seconds(), intraday)
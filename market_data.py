@@ -0,0 +1,119 @@
+"""
+market_data.py
+--------------
+非同步行情存取層：handler 一律透過這裡呼叫 yfinance / get_history
+1. 阻塞式抓取跑在專用、有上限的 thread pool（不佔用 event loop）
+2. single-flight：相同請求同時只送出一次，其他人等待同一份結果
+   → 開盤時十個人查 2330 只會打一次 Yahoo
+"""
+from __future__ import annotations
+
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable
+
+import pandas as pd
+import yfinance as yf
+
+from history import get_history
+from metrics import register_gauge, timed_fetch
+from utils import _fi
+
+MAX_WORKERS = int(os.environ.get("MARKET_DATA_WORKERS", 8))
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="market-data")
+_queued = 0  # 已送進 _EXECUTOR、尚未開始執行的工作數
+_queued_lock = threading.Lock()
+
+
+def _count_queued(delta: int) -> None:
+    global _queued
+    with _queued_lock:
+        _queued += delta
+
+
+def _started(fn: Callable[[], Any]) -> Any:
+    """worker 執行緒開始執行時扣掉排隊數"""
+    _count_queued(-1)
+    return fn()
+
+
+class SingleFlight:
+    """同 key 的進行中請求共用一個 Future"""
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        fut = self._inflight.get(key)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            _count_queued(1)
+            try:
+                fut = loop.run_in_executor(_EXECUTOR, _started, functools.partial(fn, *args))
+            except RuntimeError:  # executor 已關閉
+                _count_queued(-1)
+                raise
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        # shield：某位使用者逾時取消時，不影響其他等待者
+        return await asyncio.shield(fut)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+_FLIGHTS = SingleFlight()
+
+
+def queue_depth() -> int:
+    """executor 等待中的工作數"""
+    return _queued
+
+
+register_gauge(queue_depth, executor="market_data")
+
+
+async def run(key: Hashable, fn: Callable[..., Any], *args) -> Any:
+    """任意阻塞函式走同一個 executor + single-flight"""
+    return await _FLIGHTS.do(key, fn, *args)
+
+
+# ─────────────────── 阻塞實作 ────────────────────
+def _quote_sync(tk: str) -> tuple[float, float]:
+    with timed_fetch("yfinance"):
+        tkr = yf.Ticker(tk)
+        fi = tkr.fast_info or {}
+        price = _fi(fi, 'lastPrice', 'last_price')
+        prev = _fi(fi, 'previousClose', 'previous_close')
+        if None in (price, prev):
+            hist = tkr.history(period='2d')
+            price, prev = hist['Close'].iloc[-1], hist['Close'].iloc[-2]
+    return float(price), float(prev)
+
+
+def _fundamentals_sync(tk: str) -> dict[str, Any]:
+    with timed_fetch("yfinance"):
+        tkr = yf.Ticker(tk)
+        fi, info = tkr.fast_info or {}, tkr.info or {}
+    g = lambda *k: _fi(fi, *k) or info.get(k[-1])
+    return {
+        "市值": g('marketCap', 'market_cap'),
+        "本益比": g('trailingPE', 'trailing_pe'),
+        "P/B": info.get('priceToBook'),
+        "EPS": info.get('trailingEps'),
+        "殖利率": g('dividendYield', 'dividend_yield'),
+        "52W 高": g('yearHigh', 'year_high', 'fiftyTwoWeekHigh'),
+        "52W 低": g('yearLow', 'year_low', 'fiftyTwoWeekLow'),
+    }
+
+
+# ─────────────────── 非同步介面 ────────────────────
+async def history(code: str, months: int = 6) -> pd.DataFrame:
+    return await run(("history", code.upper(), months), get_history, code, months)
+
+
+async def fundamentals(tk: str) -> dict[str, Any]:
+    return await run(("fund", tk.upper()), _fundamentals_sync, tk)
@@ -0,0 +1,213 @@
+"""
+metrics.py
+----------
+行程內指標（Prometheus 文字格式），由 web_stub 的 /metrics 輸出
+- 指令延遲直方圖：main.run_bot 註冊的每個 CommandHandler
+- 資料源抓取耗時與失敗數：yfinance / twse / twstock / google_news
+- 模型訓練耗時、背景工作耗時
+- 快取命中率（cache.CACHES）、executor 佇列深度（register_gauge）
+註：ai_top10 子行程內的訓練不會回報，只記錄父行程可見的部分
+"""
+from __future__ import annotations
+
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+import cache
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _num(x: float) -> str:
+    return "+Inf" if x == float("inf") else repr(float(x))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(dict(k))} {_num(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: dict[tuple, list] = {}  # labels → [各 bucket 次數, 總和, 次數]
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            items = [(k, list(c), s, n) for k, (c, s, n) in self._values.items()]
+        for key, counts, total, n in items:
+            labels = dict(key)
+            for b, c in zip(self.buckets, counts):
+                out.append(f"{self.name}_bucket{_labels({**labels, 'le': _num(b)})} {c}")
+            out.append(f"{self.name}_sum{_labels(labels)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(labels)} {n}")
+        return out
+
+
+class Gauge(_Metric):
+    """取值時才呼叫 callback 的 gauge"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._fns: dict[tuple, Callable[[], float]] = {}
+
+    def set_function(self, fn: Callable[[], float], **labels) -> None:
+        with self._lock:
+            self._fns[tuple(sorted(labels.items()))] = fn
+
+    def samples(self):
+        with self._lock:
+            items = list(self._fns.items())
+        out = []
+        for key, fn in items:
+            try:
+                out.append(f"{self.name}{_labels(dict(key))} {_num(fn())}")
+            except Exception as e:
+                logging.debug("gauge %s failed: %r", self.name, e)
+        return out
+
+
+class _CacheStats(_Metric):
+    """cache.CACHES 中每個具名 TTLCache 的命中／未命中／筆數"""
+    kind = "counter"
+
+    def render(self) -> list[str]:
+        caches = list(cache.CACHES.items())
+        lines = []
+        for suffix, kind, attr in (("hits_total", "counter", "hits"),
+                                   ("misses_total", "counter", "misses"),
+                                   ("entries", "gauge", None)):
+            name = f"{self.name}_{suffix}"
+            lines += [f"# HELP {name} {self.help} ({suffix})", f"# TYPE {name} {kind}"]
+            for cname, c in caches:
+                value = len(c) if attr is None else getattr(c, attr)
+                lines.append(f"{name}{_labels({'cache': cname})} {_num(value)}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+COMMAND_SECONDS = Histogram("stockradar_command_seconds", "Telegram 指令處理時間（秒）")
+COMMAND_ERRORS = Counter("stockradar_command_errors_total", "指令處理拋出例外次數")
+FETCH_SECONDS = Histogram("stockradar_fetch_seconds", "外部資料源抓取時間（秒）")
+FETCH_FAILURES = Counter("stockradar_fetch_failures_total", "外部資料源抓取失敗次數")
+TRAIN_SECONDS = Histogram("stockradar_model_train_seconds", "LightGBM 訓練時間（秒）")
+JOB_SECONDS = Histogram("stockradar_job_seconds", "背景工作（全市場掃描等）時間（秒）",
+                        buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+GAUGES = Gauge("stockradar_queue_depth", "executor 等待中的工作數")
+CACHE_STATS = _CacheStats("stockradar_cache", "行程內快取")
+
+
+# ─────────────────── 便利介面 ────────────────────
+@contextmanager
+def timed_fetch(source: str):
+    """記錄一次外部抓取的耗時；區塊內拋出例外視為失敗（例外照常往外拋）"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        FETCH_FAILURES.inc(source=source)
+        raise
+    finally:
+        FETCH_SECONDS.observe(time.perf_counter() - t0, source=source)
+
+
+def register_gauge(fn: Callable[[], float], **labels) -> None:
+    GAUGES.set_function(fn, **labels)
+
+
+def instrument(command: str, callback: Callable):
+    """包裝 handler callback：記錄延遲與例外"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        t0 = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except BaseException:
+            COMMAND_ERRORS.inc(command=command)
+            raise
+        finally:
+            COMMAND_SECONDS.observe(time.perf_counter() - t0, command=command)
+    return wrapper
+
+
+def instrument_handlers(app) -> None:
+    """替 app 中所有 CommandHandler 套上 instrument()"""
+    from telegram.ext import CommandHandler
+
+    for handlers in app.handlers.values():
+        for h in handlers:
+            if isinstance(h, CommandHandler):
+                h.callback = instrument(min(h.commands), h.callback)
+
+
+def render() -> bytes:
+    lines: list[str] = []
+    for m in REGISTRY:
+        lines += m.render()
+    return ("\n".join(lines) + "\n").encode()
@@ -3,45 +3,153 @@ model_handler.py
 ────────────────
 Telegram 指令 /model
 用法：
-  /model 2330          → 預設門檻 prob≥0.70 & RSI<30
-  /model 2330 0.6 50   → 自訂門檻
+  /model 2330                → 預設門檻 prob≥0.70 & RSI<30
+  /model 2330 0.6 50         → 自訂門檻
+  /model 2317 0.55 none      → none = 不限 RSI
+  /model 2330 2303 2603      → 一次查多檔（最多 MAX_MODEL_CODES 檔），合併成一張表
+
+模型計算交由 job_scheduler：子行程執行、逾時即終止、同檔合併、每人限流
+多檔時先一次批次下載全部歷史，再每檔各自派工並行訓練／預測，逾時只影響該檔
 """
-import asyncio, logging, functools
+import re, asyncio, logging
 from telegram import Update
 from telegram.ext import ContextTypes
-from ai_single import analyze_stock
+import ai_single
+from job_scheduler import JOBS, RateLimited, run_in_process
+
+MODEL_DEADLINE = 20  # 秒（每檔）
+LOAD_DEADLINE = 30   # 秒（批次下載）
+MAX_MODEL_CODES = 20
+DEFAULT_PROB, DEFAULT_RSI = 0.70, 30
+
+_CODE = re.compile(r"^\d{4,6}[A-Z]?$")  # 2330、0050、00878、00632R
+_NONE = {"NONE", "-", "無"}
 
 logging.basicConfig(level=logging.INFO)
 
 def _pct(x: float) -> str:
     return f"{x * 100:.1f}%"
 
+def _parse(tokens: list[str]) -> tuple[list[str], float, float | None]:
+    """代碼（4~6 碼）＋ 依序的機率門檻、RSI 門檻；none 代表不限 RSI；無法辨識時 ValueError"""
+    codes, nums, no_rsi = [], [], False
+    for tok in tokens:
+        t = tok.upper()
+        if t in _NONE:
+            no_rsi = True
+        elif _CODE.match(t):
+            if t not in codes:
+                codes.append(t)
+        else:
+            nums.append(float(t))
+    if len(nums) > 2 or (no_rsi and len(nums) > 1):
+        raise ValueError("too many thresholds")
+    prob_thr = nums[0] if nums else DEFAULT_PROB
+    if prob_thr > 1:  # 允許 /model 2330 60 表示 60%
+        prob_thr /= 100
+    rsi_thr = None if no_rsi else (nums[1] if len(nums) > 1 else DEFAULT_RSI)
+    return codes, prob_thr, rsi_thr
+
+async def _fit(code: str, df, user: int) -> dict | None:
+    """單檔訓練／預測（各自逾時）；計入使用者進行中的工作，但不另外限流（指令已准入）"""
+    if df is None:
+        return None
+    res = await JOBS.submit(
+        ("model", code),
+        lambda: run_in_process(ai_single.fit, code, df),
+        user=user,
+        charge=False,
+        timeout=MODEL_DEADLINE,
+    )
+    ai_single.remember(code, 3, res)
+    return res
+
+def _single(code: str, data: dict, prob_thr: float, rsi_thr) -> str:
+    return (
+        f"*{code}* 近期模型結果\n"
+        f"> 機率門檻：≥ {_pct(prob_thr)}\n"
+        f"> RSI門檻： < {rsi_thr if rsi_thr is not None else '無'}\n\n"
+        f"預測機率： {_pct(data['prob'])}\n"
+        f"模型準確： {_pct(data['acc'])}\n"
+        f"最新 RSI： {data['rsi']:.1f}\n"
+        f"收盤價格： {float(data['close']):,.2f}\n\n"
+        f"{data['msg']}"
+    )
+
+def _table(codes: list[str], results: dict, prob_thr: float, rsi_thr) -> str:
+    rows = [f"{'code':<7}{'prob':>6}{'acc':>6}{'rsi':>6}{'close':>10}"]
+    passed = []
+    for code in codes:
+        r = results[code]
+        if isinstance(r, dict):
+            mark = "✅" if r["pass_"] else "❌"
+            rows.append(f"{code:<7}{r['prob'] * 100:>5.1f}%{r['acc'] * 100:>5.0f}%"
+                        f"{r['rsi']:>6.1f}{r['close']:>10,.2f} {mark}")
+            if r["pass_"]:
+                passed.append(code)
+        else:
+            rows.append(f"{code:<7}{r:>8}")
+    table = "\n".join(rows)
+    return (
+        f"*{len(codes)} 檔模型結果*\n"
+        f"> 機率門檻：≥ {_pct(prob_thr)}｜RSI門檻： < {rsi_thr if rsi_thr is not None else '無'}\n"
+        f"```\n{table}\n```\n"
+        + (f"✅ 符合條件：{', '.join(passed)}" if passed else "❌ 沒有符合條件的股票")
+    )
+
 async def model_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
     chat_id = u.effective_chat.id
     tokens = u.message.text.strip().split()[1:]
 
-    if not tokens:
+    try:
+        codes, prob_thr, rsi_thr = _parse(tokens)
+    except ValueError:
+        await c.bot.send_message(chat_id, "❓ 無法辨識參數，例如：/model 2330 2303 0.6 50 或 /model 2317 0.55 none")
+        return
+    if not codes:
         await c.bot.send_message(chat_id, "❓ 請輸入股票代碼，例如：/model 2330")
         return
+    if len(codes) > MAX_MODEL_CODES:
+        await c.bot.send_message(chat_id, f"❓ 一次最多 {MAX_MODEL_CODES} 檔")
+        return
 
-    code = tokens[0]
-    prob_thr = float(tokens[1]) if len(tokens) >= 2 else 0.70
-    rsi_thr  = float(tokens[2]) if len(tokens) >= 3 else 30
+    logging.info(f"/model codes={codes} prob>={prob_thr} rsi<{rsi_thr}")
 
-    logging.info(f"/model code={code} prob>={prob_thr} rsi<{rsi_thr}")
+    label = codes[0] if len(codes) == 1 else f"{len(codes)} 檔"
+    waiting = await c.bot.send_message(chat_id, f"⌛ 正在分析 {label}…")
 
-    waiting = await c.bot.send_message(chat_id, f"⌛ 正在分析 {code}…")
+    async def queued(pos: int):
+        await waiting.edit_text(f"⏳ {label} 排隊中，前面還有 {pos - 1} 個分析工作…" if pos > 1
+                                else f"⏳ {label} 排隊中，下一個就輪到你…")
 
-    loop = asyncio.get_event_loop()
+    user = u.effective_user.id
+    results: dict = {code: ai_single.cached(code) for code in codes}
+    missing = [code for code, res in results.items() if res is None]
     try:
-        # 20 s 逾時保護
-        data = await asyncio.wait_for(
-            loop.run_in_executor(
-                None,
-                functools.partial(analyze_stock, code, prob_thr, rsi_thr),
-            ),
-            timeout=20,
-        )
+        if missing:
+            # 一次批次下載全部缺少的歷史（子行程，逾時即終止）；限流檢查在這裡做一次
+            frames = await JOBS.submit(
+                ("model-load", tuple(missing)),
+                lambda: run_in_process(ai_single.load_datasets, missing),
+                user=user,
+                timeout=LOAD_DEADLINE,
+                on_queued=queued,
+            )
+            done = await asyncio.gather(*(_fit(code, frames.get(code), user) for code in missing),
+                                        return_exceptions=True)
+            for code, res in zip(missing, done):
+                if isinstance(res, asyncio.TimeoutError):
+                    results[code] = "逾時"
+                elif isinstance(res, BaseException):
+                    logging.error("/model %s: %r", code, res)
+                    results[code] = "錯誤"
+                else:
+                    results[code] = res
+    except RateLimited as e:
+        await waiting.edit_text(
+            "⏳ 你已有分析在進行中，請等它完成" if e.retry_after is None
+            else f"⏳ 請求太頻繁，請 {e.retry_after:.0f} 秒後再試")
+        return
     except asyncio.TimeoutError:
         await waiting.edit_text("⚠️ 連線或計算逾時，請稍後再試")
         return
@@ -50,18 +158,21 @@ async def model_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
         await waiting.edit_text(f"⚠️ 發生錯誤：{e}")
         raise
 
-    if data is None:
-        await waiting.edit_text(f"⚠️ 無法取得 {code} 資料或資料不足")
-        return
+    for code, res in results.items():
+        if res is None:
+            results[code] = "無資料"
+        elif isinstance(res, dict):
+            results[code] = ai_single.evaluate(res, prob_thr, rsi_thr)
 
-    text = (
-        f"*{code}* 近期模型結果\n"
-        f"> 機率門檻：≥ {_pct(prob_thr)}\n"
-        f"> RSI門檻： < {rsi_thr if rsi_thr is not None else '無'}\n\n"
-        f"預測機率： {_pct(data['prob'])}\n"
-        f"模型準確： {_pct(data['acc'])}\n"
-        f"最新 RSI： {data['rsi']:.1f}\n"
-        f"收盤價格： {float(data['close']):,.2f}\n\n"
-        f"{data['msg']}"
-    )
+    if len(codes) == 1:
+        code, data = codes[0], results[codes[0]]
+        if not isinstance(data, dict):
+            await waiting.edit_text({
+                "逾時": "⚠️ 連線或計算逾時，請稍後再試",
+                "錯誤": f"❌ {code} 分析失敗，請稍後再試",
+            }.get(data, f"⚠️ 無法取得 {code} 資料或資料不足"))
+            return
+        text = _single(code, data, prob_thr, rsi_thr)
+    else:
+        text = _table(codes, results, prob_thr, rsi_thr)
     await waiting.edit_text(text, parse_mode="Markdown", disable_web_page_preview=True)
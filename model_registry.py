@@ -0,0 +1,147 @@
+"""
+model_registry.py
+-----------------
+LightGBM 模型登錄檔：以（代碼, 特徵組, 最後訓練 K 棒日期）為鍵存於磁碟
+1. 同一交易日再次查詢 → 直接載入 booster，只做一次 predict
+2. 新交易日 → 以「原訓練段 ＋ held-out 之後標籤已揭曉的新增列」續訓 INCR_ROUNDS 棵樹
+   （held-out 段永不進訓練，避免準確率偷看答案）
+3. 距上次完整訓練滿 RETRAIN_DAYS 天或樹數超過 MAX_TREES → 從頭重訓
+4. held-out 準確率每次續訓後在同一段 held-out 重新計算
+5. load_pooled / save_pooled：全市場共用模型，以（特徵組, 交易日）為鍵
+"""
+from __future__ import annotations
+
+import os
+import glob
+import json
+import hashlib
+
+import numpy as np
+import lightgbm as lgb
+from sklearn.metrics import accuracy_score
+
+from metrics import TRAIN_SECONDS
+from utils import CACHE_DIR
+
+PARAMS = {"objective": "binary", "learning_rate": 0.05, "verbose": -1}
+N_ROUNDS = 120      # 完整訓練樹數（同原本 n_estimators=120）
+INCR_ROUNDS = 10    # 每個新交易日續訓樹數
+RETRAIN_DAYS = 7    # 完整重訓週期（日曆天）
+MAX_TREES = 240
+TEST_SIZE = 0.2
+
+
+def feature_key(feats: list[str], horizon: int) -> str:
+    return hashlib.sha1(f"{','.join(feats)}|h{horizon}".encode()).hexdigest()[:10]
+
+
+def _day(ts) -> str:
+    return np.datetime_as_string(np.datetime64(ts, "D"))
+
+
+class ModelRegistry:
+    def __init__(self, root: str | None = None):
+        self.root = root or os.path.join(CACHE_DIR, "models")
+
+    def _paths(self, code: str, fkey: str) -> tuple[str, str]:
+        base = os.path.join(self.root, f"{code.upper()}-{fkey}")
+        return base + ".txt", base + ".json"
+
+    def _load(self, code: str, fkey: str) -> tuple[lgb.Booster | None, dict]:
+        model_path, meta_path = self._paths(code, fkey)
+        try:
+            with open(meta_path, encoding="utf-8") as fh:
+                meta = json.load(fh)
+            return lgb.Booster(model_file=model_path), meta
+        except (OSError, ValueError, lgb.basic.LightGBMError):
+            return None, {}
+
+    def _save(self, code: str, fkey: str, booster: lgb.Booster, meta: dict) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        model_path, meta_path = self._paths(code, fkey)
+        pid = os.getpid()
+        booster.save_model(f"{model_path}.{pid}.tmp")
+        with open(f"{meta_path}.{pid}.tmp", "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(f"{model_path}.{pid}.tmp", model_path)
+        os.replace(f"{meta_path}.{pid}.tmp", meta_path)
+
+    # ---------- 訓練 ----------
+    def _full_train(self, X, y, dates, n_jobs: int) -> tuple[lgb.Booster, dict]:
+        n_test = int(np.ceil(len(X) * TEST_SIZE))  # 同 train_test_split(shuffle=False)
+        n_train = len(X) - n_test
+        params = {**PARAMS, "num_threads": n_jobs if n_jobs > 0 else 0}
+        with TRAIN_SECONDS.time(kind="full"):
+            booster = lgb.train(params, lgb.Dataset(X[:n_train], y[:n_train]), num_boost_round=N_ROUNDS)
+        acc = accuracy_score(y[n_train:], booster.predict(X[n_train:]) > 0.5)
+        meta = {
+            "acc": float(acc),
+            "train_end": _day(dates[n_train - 1]),  # 訓練段結尾；(train_end, full_date] 為 held-out
+            "full_date": _day(dates[-1]),
+            "incr_end": _day(dates[-1]),            # 已續訓到的最後一個已揭曉標籤日
+            "last_date": _day(dates[-1]),
+        }
+        return booster, meta
+
+    def predict(
+        self,
+        code: str,
+        feats: list[str],
+        dates: np.ndarray,
+        X: np.ndarray,
+        y: np.ndarray,
+        horizon: int = 5,
+        n_jobs: int = -1,
+    ) -> tuple[float, float]:
+        """回傳 (held-out 準確率, 最新一筆上漲機率)；必要時訓練／續訓並存檔"""
+        fkey = feature_key(feats, horizon)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        last = _day(dates[-1])
+        booster, meta = self._load(code, fkey)
+
+        stale = (
+            booster is None
+            or "incr_end" not in meta  # 舊版 meta（續訓曾用到 held-out 列）
+            or last < meta["last_date"]  # 資料回溯（重建歷史）
+            or np.datetime64(last) - np.datetime64(meta["full_date"]) >= np.timedelta64(RETRAIN_DAYS, "D")
+            or booster.num_trees() >= MAX_TREES
+        )
+        if stale:
+            booster, meta = self._full_train(X, y, dates, n_jobs)
+            self._save(code, fkey, booster, meta)
+        elif last > meta["last_date"]:
+            # 續訓列 = 原訓練段 ＋ held-out 之後、標籤已揭曉（horizon 日前）的列；held-out 段保持未見
+            labeled = dates[:-horizon] if horizon else dates
+            if len(labeled) and labeled[-1] > np.datetime64(meta["incr_end"]):
+                train_end, full_date = np.datetime64(meta["train_end"]), np.datetime64(meta["full_date"])
+                rows = (labeled <= train_end) | (labeled > full_date)
+                params = {**PARAMS, "num_threads": n_jobs if n_jobs > 0 else 0}
+                with TRAIN_SECONDS.time(kind="incremental"):
+                    booster = lgb.train(
+                        params, lgb.Dataset(X[:len(labeled)][rows], y[:len(labeled)][rows]),
+                        num_boost_round=INCR_ROUNDS, init_model=booster,
+                    )
+                held = (dates > train_end) & (dates <= full_date)
+                if held.any():
+                    meta["acc"] = float(accuracy_score(y[held], booster.predict(X[held]) > 0.5))
+                meta["incr_end"] = _day(labeled[-1])
+            meta["last_date"] = last
+            self._save(code, fkey, booster, meta)
+
+        prob = float(booster.predict(X[-1:])[0])
+        return meta["acc"], prob
+
+    # ---------- 全市場共用模型（ai_top10 pooled 模式）----------
+    def load_pooled(self, fkey: str, day: str) -> tuple[lgb.Booster | None, dict]:
+        return self._load("_POOLED", f"{fkey}-{day}")
+
+    def save_pooled(self, fkey: str, day: str, booster: lgb.Booster, meta: dict) -> None:
+        """一天只留一份：存檔後清掉其他交易日的 pooled 模型"""
+        self._save("_POOLED", f"{fkey}-{day}", booster, meta)
+        keep = set(self._paths("_POOLED", f"{fkey}-{day}"))
+        for path in glob.glob(os.path.join(self.root, f"_POOLED-{fkey}-*")):
+            if path not in keep and not path.endswith(".tmp"):
+                os.remove(path)
+
+
+REGISTRY = ModelRegistry()
@@ -1,11 +1,18 @@
-import feedparser, html
+import asyncio, logging
+import feedparser, html, requests
 from urllib.parse import quote_plus, urlparse
 from telegram import Update
 from telegram.ext import ContextTypes
+from cache import TTLCache
+from metrics import timed_fetch
 
 __all__ = ["news_cmd"]
 
 GOOGLE_NEWS = "https://news.google.com/rss/search?q="
+FEED_TIMEOUT = 8                                    # 單一 feed 逾時秒數
+_NEWS = TTLCache(maxsize=256, ttl=300, name="news")              # (關鍵字, 網站, 筆數) → 結果，5 分鐘
+_VALIDATORS = TTLCache(maxsize=256, ttl=24 * 3600, name="news_validators")  # url → (ETag, Last-Modified, entries)
+_session = requests.Session()
 
 # ----------------- helpers -----------------
 
@@ -18,12 +25,47 @@ def _dedup(items: list[tuple[str, str]]) -> list[tuple[str, str]]:
 
 
 def _fetch_google(keyword: str, site: str | None = None, max_items: int = 10):
+    key = (keyword, site, max_items)
+    hit = _NEWS.get(key)
+    if hit is not None:
+        return hit
     q = quote_plus(keyword)
     if site:
         q += f"+site:{site}"
     url = f"{GOOGLE_NEWS}{q}&hl=zh-TW&gl=TW&ceid=TW:zh-Hant"
-    feed = feedparser.parse(url)
-    return [(e.title, e.link) for e in feed.entries[:max_items]]
+
+    # 條件式 GET：feed 未變動時伺服器回 304，直接沿用上次解析結果
+    etag, modified, entries = _VALIDATORS.get(url) or (None, None, None)
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    with timed_fetch("google_news"):
+        resp = _session.get(url, headers=headers, timeout=FEED_TIMEOUT)
+        if resp.status_code != 304 or entries is None:
+            resp.raise_for_status()
+    if resp.status_code == 304 and entries is not None:
+        items = entries
+    else:
+        feed = feedparser.parse(resp.content)
+        items = [(e.title, e.link) for e in feed.entries]
+        _VALIDATORS.set(url, (resp.headers.get("ETag"), resp.headers.get("Last-Modified"), items))
+    items = items[:max_items]
+    _NEWS.set(key, items)
+    return items
+
+
+async def _fetch_many(*specs: tuple) -> list[tuple[str, str]]:
+    """多個 feed 併發抓取（不佔用 event loop），逾時或失敗的 feed 視為無結果"""
+    async def one(spec):
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(_fetch_google, *spec), FEED_TIMEOUT + 2)
+        except Exception as e:
+            logging.warning("news feed %s failed: %r", spec, e)
+            return []
+    results = await asyncio.gather(*(one(s) for s in specs))
+    return [item for r in results for item in r]
 
 
 def _domain(link: str) -> str:
@@ -55,11 +97,11 @@ async def news_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
 
     # -------- industry --------
     if cat == "industry":
-        hits = _dedup(
-            _fetch_google(kw, None, 10) +
-            _fetch_google(kw, "cnn.com", 5) +
-            _fetch_google(kw, "wsj.com", 5)
-        )
+        hits = _dedup(await _fetch_many(
+            (kw, None, 10),
+            (kw, "cnn.com", 5),
+            (kw, "wsj.com", 5),
+        ))
         if not hits:
             return await u.message.reply_text("❌ 未能取得任何新聞結果")
         msg = _format_links(hits[:10], "📰")
@@ -69,10 +111,12 @@ async def news_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
     if cat == "policy":
         base_kw = kw or "央行 升息"
         hits = _dedup(
-            _fetch_google(base_kw, "federalreserve.gov", 5) +
-            _fetch_google(base_kw, "cbc.gov.tw", 5) +
-            _fetch_google(base_kw, "twse.com.tw", 5) or
-            _fetch_google(base_kw, None, 10)
+            await _fetch_many(
+                (base_kw, "federalreserve.gov", 5),
+                (base_kw, "cbc.gov.tw", 5),
+                (base_kw, "twse.com.tw", 5),
+            ) or
+            await _fetch_many((base_kw, None, 10))
         )
         if not hits:
             return await u.message.reply_text("❌ 未能取得任何政策新聞")
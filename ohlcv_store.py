@@ -0,0 +1,144 @@
+"""
+ohlcv_store.py
+--------------
+本地日 K 線倉庫（每檔一個目錄，append-only、壓縮欄式儲存）
+1. 每次寫入產生一個 npz 區段，Date/Open/High/Low/Close/Volume 各自一欄
+2. 讀取時依序合併區段，同一天以後寫入者為準（盤中 K 棒會被覆蓋）
+3. 區段數過多時自動 compact 成單一區段
+4. meta.json 記錄最後檢查時間與已涵蓋的起始日
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import glob
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils import CACHE_DIR
+
+COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+_MAX_SEGMENTS = 16
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame(columns=list(COLUMNS), index=pd.DatetimeIndex([], name="Date"), dtype=float)
+
+
+def normalize_bars(df: pd.DataFrame) -> pd.DataFrame:
+    """yfinance / TWSE / twstock 的 K 線 → 統一為無時區日期索引 + OHLCV float 欄位"""
+    if df is None or df.empty:
+        return _empty()
+    if isinstance(df.columns, pd.MultiIndex):  # yf.download 單檔也可能回傳 (欄位, 代碼)
+        df = df.copy()
+        df.columns = df.columns.get_level_values(0)
+    out = pd.DataFrame(index=pd.DatetimeIndex(df.index))
+    if out.index.tz is not None:
+        out.index = out.index.tz_localize(None)
+    out.index = out.index.normalize()
+    out.index.name = "Date"
+    for col in COLUMNS:
+        out[col] = df[col].to_numpy(dtype=float) if col in df else np.nan
+    out = out[~out.index.duplicated(keep="last")].sort_index()
+    return out.dropna(subset=["Close"])
+
+
+class OHLCVStore:
+    def __init__(self, root: str | None = None):
+        self.root = root or os.path.join(CACHE_DIR, "ohlcv")
+        self._locks: dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    # ---------- 內部工具 ----------
+    def _dir(self, tk: str) -> str:
+        return os.path.join(self.root, tk.upper().replace("/", "_"))
+
+    def _lock(self, tk: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(tk.upper(), threading.Lock())
+
+    def _segments(self, tk: str) -> list[str]:
+        return sorted(glob.glob(os.path.join(self._dir(tk), "seg-*.npz")))
+
+    def _write_segment(self, tk: str, df: pd.DataFrame) -> None:
+        d = self._dir(tk)
+        os.makedirs(d, exist_ok=True)
+        name = os.path.join(d, f"seg-{time.time_ns():020d}-{os.getpid()}.npz")
+        tmp = name + ".tmp"
+        with open(tmp, "wb") as fh:
+            np.savez_compressed(
+                fh,
+                Date=df.index.values.astype("datetime64[ns]").astype(np.int64),
+                **{c: df[c].to_numpy(dtype=float) for c in COLUMNS},
+            )
+        os.replace(tmp, name)
+
+    def _read_segments(self, paths: list[str]) -> pd.DataFrame:
+        frames = []
+        for p in paths:
+            with np.load(p) as z:
+                idx = pd.DatetimeIndex(z["Date"].astype("datetime64[ns]"), name="Date")
+                frames.append(pd.DataFrame({c: z[c] for c in COLUMNS}, index=idx))
+        if not frames:
+            return _empty()
+        df = pd.concat(frames)
+        return df[~df.index.duplicated(keep="last")].sort_index()
+
+    # ---------- 公開介面 ----------
+    def read(self, tk: str) -> pd.DataFrame:
+        for _ in range(3):  # compact 時區段可能剛被刪除，重試即可
+            try:
+                return self._read_segments(self._segments(tk))
+            except FileNotFoundError:
+                continue
+        return _empty()
+
+    def append(self, tk: str, df: pd.DataFrame) -> None:
+        """新增 K 棒（同日期覆蓋舊值）；區段過多時合併"""
+        df = normalize_bars(df)
+        if df.empty:
+            return
+        with self._lock(tk):
+            self._write_segment(tk, df)
+            segs = self._segments(tk)
+            if len(segs) > _MAX_SEGMENTS:
+                self._write_segment(tk, self._read_segments(segs))
+                for p in segs:
+                    os.remove(p)
+
+    def replace(self, tk: str, df: pd.DataFrame) -> None:
+        """整檔重建（除權息、分割造成還原價位移時使用）"""
+        df = normalize_bars(df)
+        with self._lock(tk):
+            old = self._segments(tk)
+            if not df.empty:
+                self._write_segment(tk, df)
+            for p in old:
+                os.remove(p)
+
+    def meta(self, tk: str) -> dict:
+        try:
+            with open(os.path.join(self._dir(tk), "meta.json"), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def set_meta(self, tk: str, **kw) -> None:
+        d = self._dir(tk)
+        os.makedirs(d, exist_ok=True)
+        meta = {**self.meta(tk), **kw}
+        tmp = os.path.join(d, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, os.path.join(d, "meta.json"))
+
+    def tickers(self) -> list[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(n for n in os.listdir(self.root) if self._segments(n))
+
+
+STORE = OHLCVStore()
@@ -1,113 +1,141 @@
+import asyncio, datetime, logging
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import mplfinance as mpf
 import io
-from history import get_history
+import market_data
+from history import load_panel, warm_store
+from chart import _pattern_buf
+from cache import TTLCache
+from chart_service import render
+from market_clock import TZ_TAIPEI
+from metrics import JOB_SECONDS
+from pivots import Pivots, extract, scan_panel, last_valid
+from universe import load_universe, code_of
 from utils import _norm, _fmt
 from telegram import Update, InputFile
-from telegram.ext import ContextTypes
+from telegram.ext import Application, ContextTypes
 
-__all__ = ["pattern_cmd"]
+__all__ = ["pattern_cmd", "patternscan_cmd"]
 
 
-def detect_double_bottom(df: pd.DataFrame) -> dict:
-    lows = df['Low']
-    troughs = lows[(lows.shift(1) > lows) & (lows.shift(-1) > lows)]
-    if len(troughs) >= 2:
-        t1, t2 = troughs.index[-2], troughs.index[-1]
-        v1, v2 = troughs.iloc[-2], troughs.iloc[-1]
-        if abs(v1 - v2) / v1 < 0.03:
-            neckline = df.loc[t1:t2, 'High'].max()
-            return {"type": "W 底（雙重底）", "points": (t1, t2), "neckline": neckline}
+def _piv(df: pd.DataFrame, piv: Pivots | None) -> Pivots:
+    return piv if piv is not None else extract(df)
+
+
+def _score(x: float) -> float:
+    return float(min(max(x, 0.0), 1.0))
+
+
+def detect_double_bottom(df: pd.DataFrame, piv: Pivots | None = None) -> dict:
+    p = _piv(df, piv)
+    if len(p.troughs) >= 2:
+        i1, i2 = p.troughs[-2], p.troughs[-1]
+        v1, v2 = p.low[i1], p.low[i2]
+        diff = abs(v1 - v2) / v1
+        if diff < 0.03:
+            neckline = p.high[i1:i2 + 1].max()
+            return {"type": "W 底（雙重底）", "points": (p.index[i1], p.index[i2]),
+                    "neckline": neckline, "score": _score(1 - diff / 0.03)}
     return {}
 
-def detect_double_top(df: pd.DataFrame) -> dict:
-    highs = df['High']
-    peaks = highs[(highs.shift(1) < highs) & (highs.shift(-1) < highs)]
-    if len(peaks) >= 2:
-        p1, p2 = peaks.index[-2], peaks.index[-1]
-        v1, v2 = peaks.iloc[-2], peaks.iloc[-1]
-        if abs(v1 - v2) / v1 < 0.03:
-            neckline = df.loc[p1:p2, 'Low'].min()
-            return {"type": "M 頭（雙重頂）", "points": (p1, p2), "neckline": neckline}
+def detect_double_top(df: pd.DataFrame, piv: Pivots | None = None) -> dict:
+    p = _piv(df, piv)
+    if len(p.peaks) >= 2:
+        i1, i2 = p.peaks[-2], p.peaks[-1]
+        v1, v2 = p.high[i1], p.high[i2]
+        diff = abs(v1 - v2) / v1
+        if diff < 0.03:
+            neckline = p.low[i1:i2 + 1].min()
+            return {"type": "M 頭（雙重頂）", "points": (p.index[i1], p.index[i2]),
+                    "neckline": neckline, "score": _score(1 - diff / 0.03)}
     return {}
 
-def detect_head_shoulders(df: pd.DataFrame) -> dict:
-    highs = df['High']
-    if len(highs) < 20:
+def detect_head_shoulders(df: pd.DataFrame, piv: Pivots | None = None) -> dict:
+    """最近三個峰：中間最高（頭），兩側較低（肩）；頸線取兩段回檔低點較低者"""
+    p = _piv(df, piv)
+    if len(p) < 20 or len(p.peaks) < 3:
         return {}
-    l, h, r = highs[-15:-10].max(), highs[-10:-5].max(), highs[-5:].max()
+    i1, i2, i3 = p.peaks[-3:]
+    l, h, r = p.high[i1], p.high[i2], p.high[i3]
     if h > l and h > r:
-        neckline = min(df['Low'][-10], df['Low'][-5])
-        return {"type": "頭肩頂（Head and Shoulders）", "points": (h, l, r), "neckline": neckline}
+        neckline = min(p.low[i1:i2 + 1].min(), p.low[i2:i3 + 1].min())
+        sym = 1 - abs(l - r) / h
+        return {"type": "頭肩頂（Head and Shoulders）", "points": (p.index[i1], p.index[i2], p.index[i3]),
+                "neckline": neckline, "score": _score(sym)}
     return {}
 
-def detect_inverse_head_shoulders(df: pd.DataFrame) -> dict:
-    lows = df['Low']
-    if len(lows) < 20:
+def detect_inverse_head_shoulders(df: pd.DataFrame, piv: Pivots | None = None) -> dict:
+    """最近三個谷：中間最低（頭），兩側較高（肩）；頸線取兩段反彈高點較高者"""
+    p = _piv(df, piv)
+    if len(p) < 20 or len(p.troughs) < 3:
         return {}
-    l, h, r = lows[-15:-10].min(), lows[-10:-5].min(), lows[-5:].min()
+    i1, i2, i3 = p.troughs[-3:]
+    l, h, r = p.low[i1], p.low[i2], p.low[i3]
     if h < l and h < r:
-        neckline = max(df['High'][-10], df['High'][-5])
-        return {"type": "頭肩底（Inverse H&S）", "points": (h, l, r), "neckline": neckline}
+        neckline = max(p.high[i1:i2 + 1].max(), p.high[i2:i3 + 1].max())
+        sym = 1 - abs(l - r) / max(l, r)
+        return {"type": "頭肩底（Inverse H&S）", "points": (p.index[i1], p.index[i2], p.index[i3]),
+                "neckline": neckline, "score": _score(sym)}
     return {}
 
-def detect_triangle(df: pd.DataFrame) -> dict:
-    recent = df[-20:]
-    high_trend = recent['High'].rolling(5).max()
-    low_trend = recent['Low'].rolling(5).min()
-    if (high_trend.max() - high_trend.min()) < (df['High'].max() - df['Low'].min()) * 0.3:
-        return {"type": "三角收斂（Triangle）", "points": (), "neckline": df['Close'].iloc[-1]}
+def detect_triangle(df: pd.DataFrame, piv: Pivots | None = None) -> dict:
+    p = _piv(df, piv)
+    high_trend = pd.Series(p.high[-20:]).rolling(5).max()
+    full = p.high.max() - p.low.min()
+    ratio = (high_trend.max() - high_trend.min()) / full if full else 1.0
+    if ratio < 0.3:
+        return {"type": "三角收斂（Triangle）", "points": (), "neckline": p.close[-1],
+                "score": _score(1 - ratio / 0.3)}
     return {}
 
-def detect_flag(df: pd.DataFrame) -> dict:
-    recent = df[-20:]
-    up = recent['Close'].iloc[0] < recent['Close'].iloc[-1]
-    body = recent['High'].max() - recent['Low'].min()
-    if body < df['High'].max() * 0.1:
-        return {"type": "旗型整理（Flag）", "points": (), "neckline": df['Close'].iloc[-1]}
+def detect_flag(df: pd.DataFrame, piv: Pivots | None = None) -> dict:
+    p = _piv(df, piv)
+    body = p.high[-20:].max() - p.low[-20:].min()
+    ratio = body / p.high.max()
+    if ratio < 0.1:
+        return {"type": "旗型整理（Flag）", "points": (), "neckline": p.close[-1],
+                "score": _score(1 - ratio / 0.1)}
     return {}
 
-def detect_box(df: pd.DataFrame) -> dict:
-    recent = df[-20:]
-    box_range = recent['High'].max() - recent['Low'].min()
-    if box_range < df['High'].max() * 0.15:
-        return {"type": "箱型整理（Rectangle）", "points": (), "neckline": df['Close'].iloc[-1]}
+def detect_box(df: pd.DataFrame, piv: Pivots | None = None) -> dict:
+    p = _piv(df, piv)
+    box_range = p.high[-20:].max() - p.low[-20:].min()
+    ratio = box_range / p.high.max()
+    if ratio < 0.15:
+        return {"type": "箱型整理（Rectangle）", "points": (), "neckline": p.close[-1],
+                "score": _score(1 - ratio / 0.15)}
     return {}
 
+DETECTORS = {
+    "wbottom": detect_double_bottom,
+    "mtop": detect_double_top,
+    "hs": detect_head_shoulders,
+    "ihs": detect_inverse_head_shoulders,
+    "triangle": detect_triangle,
+    "flag": detect_flag,
+    "box": detect_box,
+}
+
+def detect_all(df: pd.DataFrame, window: int = 1, prominence: float = 0.0) -> list[dict]:
+    """轉折點只算一次，回傳所有符合的型態（依 score 由高到低）"""
+    piv = extract(df, window, prominence)
+    hits = [p for p in (fn(df, piv) for fn in DETECTORS.values()) if p]
+    return sorted(hits, key=lambda p: p["score"], reverse=True)
+
 def plot_pattern(df: pd.DataFrame, pattern: dict, is_top=False) -> io.BytesIO:
-    ap = []
-    if pattern:
-        neck = pattern['neckline']
-        ap.append(mpf.make_addplot([neck] * len(df), color='b'))
-    mc = mpf.make_marketcolors(up='r', down='g')
-    s = mpf.make_mpf_style(base_mpf_style='yahoo', marketcolors=mc)
-    fig, _ = mpf.plot(df, type='candle', style=s, addplot=ap, returnfig=True)
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', bbox_inches='tight')
-    plt.close(fig)
-    buf.seek(0)
-    return buf
+    return _pattern_buf(df, pattern['neckline'] if pattern else None)
 
 async def pattern_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
     if not c.args:
         return await u.message.reply_text("用法：/pattern <代碼>")
     raw = c.args[0]
     try:
-        df = get_history(raw, 6)
-        patterns = [
-            detect_double_bottom(df),
-            detect_double_top(df),
-            detect_head_shoulders(df),
-            detect_inverse_head_shoulders(df),
-            detect_triangle(df),
-            detect_flag(df),
-            detect_box(df),
-        ]
-        pattern = next((p for p in patterns if p), None)
+        df = await market_data.history(raw, 6)
+        patterns = detect_all(df)
+        pattern = patterns[0] if patterns else None
 
         if pattern:
-            chart = plot_pattern(df, pattern)
+            chart = await render("pattern", raw, df, neckline=float(pattern['neckline']))
             msg = f"""📈 發現 {pattern['type']} 型態\n
 📌 `型態解釋`：
 {pattern['type']} 是技術分析中常見的重要趨勢結構，常預示市場方向轉變或整理階段。
@@ -117,6 +145,9 @@ async def pattern_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
 - 可根據頸線與高低點距離，推估目標價。
 
 📘 若搭配 RSI/MACD/均線同時轉強，可信度更高。"""
+            if len(patterns) > 1:
+                others = "、".join(f"{p['type']}({p['score']:.0%})" for p in patterns[1:])
+                msg += f"\n\n🧩 其他符合型態：{others}"
             return await u.message.reply_photo(InputFile(chart, "pattern.png"), caption=msg, parse_mode="Markdown")
 
         return await u.message.reply_text("未偵測到型態 🙏\n支援：W底、M頭、頭肩頂、頭肩底、三角收斂、旗型、箱型整理")
@@ -130,6 +161,101 @@ async def pattern_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
 
 ...
 
+# ----------------- /patternscan 全市場型態掃描 -----------------
+
+SCAN_NAMES = {
+    "wbottom": "W 底（雙重底）", "mtop": "M 頭（雙重頂）",
+    "hs": "頭肩頂", "ihs": "頭肩底",
+    "triangle": "三角收斂", "flag": "旗型整理", "box": "箱型整理",
+}
+SCAN_ALIASES = {
+    "w": "wbottom", "w底": "wbottom", "wbottom": "wbottom",
+    "m": "mtop", "m頭": "mtop", "mtop": "mtop",
+    "hs": "hs", "頭肩頂": "hs",
+    "ihs": "ihs", "頭肩底": "ihs",
+    "triangle": "triangle", "三角": "triangle", "三角收斂": "triangle",
+    "flag": "flag", "旗型": "flag",
+    "box": "box", "箱型": "box",
+}
+WARM_AT = datetime.time(14, 10, tzinfo=TZ_TAIPEI)
+_PANELS = TTLCache(maxsize=2, ttl=300, name="patternscan_panels")  # 面板讀一次約數秒，5 分鐘內重複掃描直接用記憶體
+_warming: "asyncio.Task | None" = None
+
+def scan_market(pattern: str, months: int = 6, top: int = 15) -> tuple[pd.DataFrame, int, int]:
+    """讀本地面板做向量化偵測 → (排行, 已快取檔數, 母體檔數)"""
+    universe = load_universe()
+    cached = _PANELS.get(months)
+    if cached is None:
+        cached = load_panel(universe, months)
+        _PANELS.set(months, cached)
+    _, tickers, panel = cached
+    if not tickers:
+        return pd.DataFrame(), 0, len(universe)
+    hit, score, neck = scan_panel(pattern, panel["High"], panel["Low"], panel["Close"])
+    close = last_valid(panel["Close"])  # 各股最後一筆有效收盤（面板尾端可能參差）
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dist = (close - neck) / neck
+    idx = hit.nonzero()[0]
+    df = pd.DataFrame({
+        "code": [code_of(tickers[i]) for i in idx],
+        "score": score[idx],
+        "neckline": neck[idx],
+        "close": close[idx],
+        "dist": dist[idx],
+    })
+    if not df.empty:
+        df["_abs"] = df["dist"].abs()
+        df = df.sort_values(["score", "_abs"], ascending=[False, True]).drop(columns="_abs")
+    return df.head(top).reset_index(drop=True), len(tickers), len(universe)
+
+async def _warm_store() -> int:
+    n = await asyncio.to_thread(warm_store, load_universe())
+    _PANELS.clear()  # 本地日 K 已更新，下次掃描重讀面板
+    return n
+
+def _warm() -> "asyncio.Task":
+    """背景批次下載全市場日 K（完成後清掉面板快取）；同時間只跑一次"""
+    global _warming
+    if _warming is None or _warming.done():
+        _warming = asyncio.ensure_future(_warm_store())
+    return _warming
+
+async def _warm_job(c: ContextTypes.DEFAULT_TYPE):
+    with JOB_SECONDS.time(job="patternscan_warm"):
+        n = await _warm()
+    logging.info("patternscan: warmed %d tickers", n)
+
+def schedule_patternscan(app: Application) -> None:
+    """每個交易日收盤後更新本地全市場日 K"""
+    if app.job_queue is None:
+        return
+    app.job_queue.run_daily(_warm_job, time=WARM_AT, days=(1, 2, 3, 4, 5), name="patternscan-warm")
+
+async def patternscan_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
+    names = " / ".join(SCAN_NAMES)
+    if not c.args:
+        return await u.message.reply_text(f"用法：/patternscan <型態>\n支援：{names}")
+    pattern = SCAN_ALIASES.get(c.args[0].lower())
+    if pattern is None:
+        return await u.message.reply_text(f"不支援的型態 🙏\n支援：{names}")
+    try:
+        df, cached, total = await asyncio.to_thread(scan_market, pattern)
+    except Exception as e:
+        logging.error(e)
+        return await u.message.reply_text("❌ 掃描失敗，請稍後再試。")
+
+    note = ""
+    if cached < total * 0.5:
+        _warm()
+        note = f"\n\n⏳ 本地資料僅 {cached}/{total} 檔，已在背景更新，稍後再試可得完整結果"
+    if df.empty:
+        return await u.message.reply_text(f"目前無股票符合 {SCAN_NAMES[pattern]} 🙏{note}")
+
+    lines = [f"*全市場 {SCAN_NAMES[pattern]} 掃描*（{cached} 檔）", "代碼 | 分數 | 頸線 | 收盤 | 距頸線", "--- | --- | --- | --- | ---"]
+    for r in df.itertuples():
+        lines.append(f"{r.code} | {r.score:.0%} | {_fmt(r.neckline)} | {_fmt(r.close)} | {r.dist:+.1%}")
+    await u.message.reply_text("\n".join(lines) + note, parse_mode="Markdown")
+
 async def pattern_help_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
     text = (
         "📚 *K 線型態教學指令（/patternhelp）*\n\n"
@@ -143,6 +269,8 @@ async def pattern_help_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
         "• ✅ 箱型整理（Rectangle）\n\n"
         "📈 使用方式： `/pattern <股票代碼>`\n"
         "範例： `/pattern 2330`\n\n"
+        "🔭 全市場掃描： `/patternscan <型態>`\n"
+        "範例： `/patternscan w`、`/patternscan box`、`/patternscan ihs`\n\n"
         "分析結果將附圖並回傳趨勢解讀與操作建議 🧠"
     )
     await u.message.reply_text(text, parse_mode="Markdown")
@@ -0,0 +1,180 @@
+"""
+pivots.py
+---------
+轉折點（swing high / swing low）引擎：每條序列只算一次，供所有型態偵測共用
+- window：左右各 window 根 K 棒內為嚴格極值才算轉折（window=1 即與相鄰兩根比較）
+- prominence：轉折相對左右兩側的最小突出幅度（比例，0 = 不限制）
+"""
+from __future__ import annotations
+
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from indicators import rolling_max
+
+
+def find_pivots(x, kind: str = "high", window: int = 1, prominence: float = 0.0) -> np.ndarray:
+    """回傳轉折點位置（由舊到新）；kind = 'high' 找峰、'low' 找谷"""
+    a = np.asarray(x, dtype=float)
+    if kind == "low":
+        a = -a
+    if len(a) < 2 * window + 1:
+        return np.empty(0, dtype=int)
+    win = sliding_window_view(a, 2 * window + 1)
+    center = win[:, window]
+    left, right = win[:, :window], win[:, window + 1:]
+    with np.errstate(invalid="ignore"):
+        ok = (center > left.max(axis=1)) & (center > right.max(axis=1))
+        if prominence > 0:
+            base = np.maximum(left.min(axis=1), right.min(axis=1))
+            ok &= (center - base) >= np.abs(center) * prominence
+    return ok.nonzero()[0] + window
+
+
+@dataclass
+class Pivots:
+    """一檔股票的價格陣列 + 峰／谷位置"""
+    index: pd.Index
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    peaks: np.ndarray
+    troughs: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+
+def extract(df: pd.DataFrame, window: int = 1, prominence: float = 0.0) -> Pivots:
+    high = df["High"].to_numpy(float)
+    low = df["Low"].to_numpy(float)
+    return Pivots(
+        index=df.index,
+        high=high,
+        low=low,
+        close=df["Close"].to_numpy(float),
+        peaks=find_pivots(high, "high", window, prominence),
+        troughs=find_pivots(low, "low", window, prominence),
+    )
+
+
+# ─────────────────── 全市場面板（日期 × 股票） ────────────────────
+def panel_pivots(x: np.ndarray, kind: str = "high") -> np.ndarray:
+    """window=1 的轉折遮罩；NaN 比較一律為 False"""
+    a = -x if kind == "low" else x
+    mask = np.zeros(a.shape, dtype=bool)
+    with np.errstate(invalid="ignore"):
+        mask[1:-1] = (a[1:-1] > a[:-2]) & (a[1:-1] > a[2:])
+    return mask
+
+
+def _last_k(mask: np.ndarray, k: int) -> np.ndarray:
+    """每欄最後 k 個 True 的列號（k × 股票，舊 → 新），不足為 -1"""
+    rows = np.arange(mask.shape[0])[:, None]
+    out = np.full((k, mask.shape[1]), -1)
+    m = mask.copy()
+    for j in range(k - 1, -1, -1):
+        last = np.where(m, rows, -1).max(axis=0)
+        out[j] = last
+        m &= rows < last
+    return out
+
+
+def _span(x: np.ndarray, start: np.ndarray, end: np.ndarray, how: str) -> np.ndarray:
+    """每欄 x[start:end+1] 的最大／最小值"""
+    rows = np.arange(x.shape[0])[:, None]
+    inside = (rows >= start) & (rows <= end)
+    if how == "max":
+        return np.where(inside, x, -np.inf).max(axis=0)
+    return np.where(inside, x, np.inf).min(axis=0)
+
+
+def _take(x: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    return x[np.clip(idx, 0, None), np.arange(x.shape[1])]
+
+
+def _lag(close: np.ndarray) -> np.ndarray:
+    """每欄最後一筆有效收盤之後還有幾列（尚未更新／停牌的股票 > 0；全 NaN 為 0）"""
+    return np.argmax(~np.isnan(close[::-1]), axis=0)
+
+
+def _align_right(x: np.ndarray, lag: np.ndarray) -> np.ndarray:
+    """把每欄往下平移 lag 列，讓各股最後一筆有效資料都落在最後一列（上方補 NaN）"""
+    src = np.arange(x.shape[0])[:, None] - lag
+    out = x[np.clip(src, 0, None), np.arange(x.shape[1])]
+    return np.where(src >= 0, out, np.nan)
+
+
+def last_valid(close: np.ndarray) -> np.ndarray:
+    """每欄最後一筆有效收盤；全 NaN 為 NaN"""
+    return _take(close, close.shape[0] - 1 - _lag(close))
+
+
+def _double(ext: np.ndarray, opp: np.ndarray, kind: str):
+    i1, i2 = _last_k(panel_pivots(ext, kind), 2)
+    v1, v2 = _take(ext, i1), _take(ext, i2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        diff = np.abs(v1 - v2) / v1
+    hit = (i1 >= 0) & (diff < 0.03)
+    neck = _span(opp, i1, i2, "max" if kind == "low" else "min")
+    return hit, 1 - diff / 0.03, neck
+
+
+def _hs(ext: np.ndarray, opp: np.ndarray, kind: str):
+    i1, i2, i3 = _last_k(panel_pivots(ext, kind), 3)
+    l, h, r = _take(ext, i1), _take(ext, i2), _take(ext, i3)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if kind == "high":
+            hit = (h > l) & (h > r)
+            neck = np.minimum(_span(opp, i1, i2, "min"), _span(opp, i2, i3, "min"))
+            score = 1 - np.abs(l - r) / h
+        else:
+            hit = (h < l) & (h < r)
+            neck = np.maximum(_span(opp, i1, i2, "max"), _span(opp, i2, i3, "max"))
+            score = 1 - np.abs(l - r) / np.maximum(l, r)
+    enough = np.count_nonzero(~np.isnan(ext), axis=0) >= 20
+    return hit & (i1 >= 0) & enough, score, neck
+
+
+def scan_panel(pattern: str, high: np.ndarray, low: np.ndarray, close: np.ndarray):
+    """對整個面板做單一型態偵測 → (是否符合, score, 頸線)，規則與 pattern_detector 相同
+
+    面板最後幾天可能參差（部分股票尚未更新或停牌）：各欄先對齊到自己最後一筆有效 K 棒，
+    等同對該股自己的日 K 做偵測
+    """
+    lag = _lag(close)
+    if lag.any():
+        high, low, close = (_align_right(a, lag) for a in (high, low, close))
+    last_close = close[-1]
+    if pattern == "wbottom":
+        hit, score, neck = _double(low, high, "low")
+    elif pattern == "mtop":
+        hit, score, neck = _double(high, low, "high")
+    elif pattern == "hs":
+        hit, score, neck = _hs(high, low, "high")
+    elif pattern == "ihs":
+        hit, score, neck = _hs(low, high, "low")
+    else:
+        rh, rl = high[-20:], low[-20:]
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)  # 近 20 日全停牌的欄位
+            hmax, lmin = np.nanmax(high, axis=0), np.nanmin(low, axis=0)
+            if pattern == "triangle":
+                trend = rolling_max(rh, 5)
+                ratio = (np.nanmax(trend, axis=0) - np.nanmin(trend, axis=0)) / (hmax - lmin)
+                limit = 0.3
+            elif pattern == "flag":
+                ratio = (np.nanmax(rh, axis=0) - np.nanmin(rl, axis=0)) / hmax
+                limit = 0.1
+            elif pattern == "box":
+                ratio = (np.nanmax(rh, axis=0) - np.nanmin(rl, axis=0)) / hmax
+                limit = 0.15
+            else:
+                raise ValueError(f"unknown pattern: {pattern}")
+        hit, score, neck = ratio < limit, 1 - ratio / limit, last_close
+    hit = hit & ~np.isnan(last_close)
+    return hit, np.clip(np.nan_to_num(score), 0.0, 1.0), neck
@@ -0,0 +1,109 @@
+"""
+quote_service.py
+----------------
+/price 報價服務
+1. 微批次：短時間窗（預設 50 ms）內的報價請求合併成一次多檔 yf.download
+2. 快取 TTL 依市場時段：盤中數秒、休市則到下次開盤（market_clock.quote_ttl）
+
+報價語意：現價 = 日 K 最後一根的收盤，昨收 = 前一根的收盤。
+盤中 Yahoo 的當日 K 棒收盤即最新成交價；yfinance 的 fast_info.lastPrice 本身
+也是取日 K 最後收盤，語意不變。開盤前最後一根仍是前一交易日，顯示前一日漲跌。
+批次缺漏的代碼才改以 market_data._quote_sync（fast_info.lastPrice）補。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+
+import yfinance as yf
+
+import market_data
+from cache import TTLCache
+from history import _split_wide
+from market_clock import quote_ttl
+from metrics import timed_fetch
+
+BATCH_WINDOW = 0.05
+MAX_BATCH = 50
+
+
+def _batch_quotes(tickers: list[str]) -> dict[str, tuple[float, float]]:
+    """多檔一次下載近 5 日日 K → {代碼: (現價, 昨收)}；缺漏者逐檔以 fast_info 補"""
+    out: dict[str, tuple[float, float]] = {}
+    try:
+        with timed_fetch("yfinance"):
+            wide = yf.download(
+                tickers, period="5d", interval="1d", group_by="ticker",
+                auto_adjust=False, threads=True, progress=False,
+            )
+        for tk, df in _split_wide(wide, tickers).items():
+            closes = df["Close"].dropna()
+            if len(closes) >= 2:
+                out[tk] = (float(closes.iloc[-1]), float(closes.iloc[-2]))
+    except Exception as e:
+        logging.warning("batch quote failed: %r", e)
+    for tk in tickers:
+        if tk not in out:
+            try:
+                out[tk] = market_data._quote_sync(tk)
+            except Exception as e:
+                logging.warning("quote %s failed: %r", tk, e)
+    return out
+
+
+class QuoteService:
+    def __init__(self, window: float = BATCH_WINDOW, max_batch: int = MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self._cache = TTLCache(maxsize=2048, name="quotes")
+        self._pending: dict[str, asyncio.Future] = {}
+        self._timer: asyncio.TimerHandle | None = None
+
+    async def get(self, tk: str) -> tuple[float, float]:
+        """(現價, 昨收)；取不到時拋出 LookupError"""
+        tk = tk.upper()
+        hit = self._cache.get(tk)
+        if hit is not None:
+            return hit
+        fut = self._pending.get(tk)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = self._pending[tk] = loop.create_future()
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(fut)
+
+    async def get_many(self, tickers: list[str]) -> dict[str, tuple[float, float] | Exception]:
+        res = await asyncio.gather(*(self.get(tk) for tk in tickers), return_exceptions=True)
+        return dict(zip((t.upper() for t in tickers), res))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.ensure_future(self._fetch(batch))
+
+    async def _fetch(self, batch: dict[str, asyncio.Future]) -> None:
+        tickers = sorted(batch)
+        try:
+            quotes = await market_data.run(("quotes", tuple(tickers)), _batch_quotes, tickers)
+        except Exception as e:
+            quotes, err = {}, e
+        else:
+            err = None
+        for tk, fut in batch.items():
+            if fut.done():
+                continue
+            q = quotes.get(tk)
+            if q is None:
+                fut.set_exception(err or LookupError(tk))
+                continue
+            self._cache.set(tk, q, ttl=quote_ttl(tk))
+            fut.set_result(q)
+
+
+QUOTES = QuoteService()
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# 測試一律使用獨立快取目錄，且可直接 import 專案頂層模組
+os.environ.setdefault("STOCKRADAR_CACHE", tempfile.mkdtemp(prefix="stockradar-test-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
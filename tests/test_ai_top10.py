@@ -0,0 +1,34 @@
+import numpy as np
+
+import ai_top10
+from feature_store import FeatureView
+from model_registry import ModelRegistry
+
+COLS = ("Close", "sma5", "sma20", "Volume", "rsi14", "target")
+
+
+def _view(n: int, seed: int) -> FeatureView:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(scale=0.02, size=n)))
+    sma5 = np.convolve(close, np.ones(5) / 5)[:n]
+    sma20 = np.convolve(close, np.ones(20) / 20)[:n]
+    volume = rng.integers(1_000, 10_000, n).astype(float)
+    rsi = rng.uniform(10, 90, n)
+    target = (rng.random(n) > 0.5).astype(float)
+    days = np.arange(18_000, 18_000 + n, dtype=float)
+    return FeatureView(COLS, np.column_stack([days, close, sma5, sma20, volume, rsi, target]))
+
+
+def test_pooled_row_values_come_from_scored_row(tmp_path):
+    """最後一列特徵不完整時，prob 用倒數第二列打分，rsi/close 也要取同一列"""
+    datasets = {"1101.TW": _view(200, 0), "1102.TW": _view(200, 1)}
+    datasets["1101.TW"]["Volume"][-1] = np.nan
+    stacked = ai_top10._stack(datasets)
+    assert stacked[-1] == [198, 199]
+
+    rows = ai_top10._score_pooled(datasets, 1, ModelRegistry(str(tmp_path)))
+    ds = datasets["1101.TW"]
+    assert rows[0]["close"] == float(ds["Close"][-2])
+    assert rows[0]["rsi"] == float(ds["rsi14"][-2])
+    assert rows[1]["close"] == float(datasets["1102.TW"]["Close"][-1])
+    assert list(tmp_path.iterdir())  # 模型寫到指定的登錄檔，不是全域 REGISTRY
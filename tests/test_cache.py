@@ -0,0 +1,51 @@
+import cache
+from cache import CACHES, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _cache(monkeypatch, **kw) -> tuple[TTLCache, Clock]:
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return TTLCache(**kw), clock
+
+
+def test_expiry_and_per_item_ttl(monkeypatch):
+    c, clock = _cache(monkeypatch, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2, ttl=30)
+    clock.now += 9
+    assert c.get("a") == 1
+    clock.now += 1
+    assert c.get("a") is None and "a" not in c
+    assert c.get("b") == 2
+    clock.now += 20
+    assert c.get("b", "gone") == "gone"
+
+
+def test_lru_eviction(monkeypatch):
+    c, _ = _cache(monkeypatch, maxsize=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")  # a 變成最近使用，下一次淘汰 b
+    c.set("c", 3)
+    assert "a" in c and "b" not in c and len(c) == 2
+
+
+def test_hits_misses_and_registry(monkeypatch):
+    c, _ = _cache(monkeypatch, name="test-cache")
+    assert CACHES["test-cache"] is c
+    c.set("a", None)  # 快取 None 也算命中
+    assert c.get("a", "x") is None and c.get("b") is None
+    assert (c.hits, c.misses) == (1, 1)
+    assert c.pop("a") is None and c.pop("a", "x") == "x"
+    c.set("b", 1)
+    c.clear()
+    assert len(c) == 0
+    CACHES.pop("test-cache")
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_store import FeatureStore, SPECS
+
+
+def _bars(n: int, seed: int = 0, start: str = "2020-01-01") -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(scale=0.02, size=n)))
+    high = close * (1 + rng.uniform(0, 0.02, n))
+    low = close * (1 - rng.uniform(0, 0.02, n))
+    index = pd.bdate_range(start, periods=n, name="Date")
+    return pd.DataFrame({"Open": close, "High": high, "Low": low, "Close": close,
+                         "Volume": rng.integers(1_000, 10_000, n).astype(float)}, index=index)
+
+
+def _scratch(ns: str, bars: pd.DataFrame) -> pd.DataFrame:
+    """只用 bars 從頭計算（不經倉庫）"""
+    spec = SPECS[ns]
+    feats = spec.compute(bars)
+    df = pd.DataFrame({c: np.asarray(feats[c], float) for c in spec.columns}, index=bars.index)
+    return df.iloc[spec.warmup:].dropna()
+
+
+def _check(store: FeatureStore, bars: pd.DataFrame) -> pd.DataFrame:
+    got = store.window("ml", "T", bars).frame()
+    want = _scratch("ml", bars)
+    assert list(got.index) == list(want.index)
+    np.testing.assert_allclose(got.to_numpy(), want.to_numpy(), rtol=1e-12)
+    return got
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FeatureStore(str(tmp_path))
+
+
+def test_earlier_start_same_end_rebuilds(store):
+    full = _bars(800)
+    _check(store, full.iloc[400:])
+    assert len(_check(store, full)) == 800 - SPECS["ml"].warmup
+
+
+def test_longer(store):
+    full = _bars(800)
+    _check(store, full.iloc[:600])
+    for n in (601, 602, 610, 800):
+        _check(store, full.iloc[:n])
+
+
+def test_shorter(store):
+    full = _bars(800)
+    _check(store, full)
+    _check(store, full.iloc[300:])   # 起點較晚
+    _check(store, full.iloc[:700])   # 終點較早（資料回溯）
+
+
+def test_shifted(store):
+    full = _bars(900)
+    _check(store, full.iloc[:700])
+    _check(store, full.iloc[100:800])
+    _check(store, full.iloc[200:900])
+
+
+def test_intraday_bar_replaced(store):
+    full = _bars(600)
+    _check(store, full)
+    bars = full.copy()
+    bars.iloc[-1, bars.columns.get_loc("Close")] *= 1.03
+    _check(store, bars)
+    # 還原價位移：整段收盤價改變 → 重建
+    _check(store, full * 0.9)
+
+
+def test_rewrite_does_not_touch_handed_out_views(store):
+    full = _bars(600)
+    old = store.window("ml", "T", full.iloc[:599])
+    before = old.frame().copy()
+    bars = full.copy()
+    bars.iloc[-2, bars.columns.get_loc("Close")] *= 1.05  # 變動落在會被重算的尾端
+    store.window("ml", "T", bars)
+    pd.testing.assert_frame_equal(old.frame(), before)
+
+
+def test_ta_matches_after_ema_burn_in(store):
+    full = _bars(800)
+    store.window("ta", "T", full)
+    bars = full.iloc[300:]
+    got = store.window("ta", "T", bars).frame(dropna=False)
+    want = pd.DataFrame(SPECS["ta"].compute(bars), index=bars.index)
+    lb = SPECS["ta"].lookback
+    assert list(got.index) == list(bars.index)
+    np.testing.assert_allclose(got.iloc[lb:].to_numpy(), want.iloc[lb:].to_numpy(), rtol=1e-8)
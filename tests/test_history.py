@@ -0,0 +1,113 @@
+import pandas as pd
+
+import history
+from ohlcv_store import OHLCVStore
+
+
+def test_download_bulk_no_sleep_after_last_attempt(monkeypatch):
+    sleeps = []
+
+    def fail(*args, **kwargs):
+        raise ConnectionError("rate limited")
+
+    monkeypatch.setattr(history.yf, "download", fail)
+    monkeypatch.setattr(history.time, "sleep", sleeps.append)
+    frames, reports = history.download_bulk(["1101.TW", "1102.TW"], "2024-01-01", retries=2)
+    assert frames == {}
+    assert reports[0].attempts == 3
+    assert reports[0].failed == ["1101.TW", "1102.TW"]
+    assert sleeps == [2, 4]  # 兩次重試前各等一次，最後一次失敗後不再等
+
+
+def _bars(start: str, n: int, scale: float = 1.0) -> pd.DataFrame:
+    index = pd.bdate_range(start, periods=n, name="Date")
+    close = [100.0 + i for i in range(n)]
+    return pd.DataFrame({"Open": close, "High": close, "Low": close, "Close": close,
+                         "Volume": 1000.0}, index=index) * [scale, scale, scale, scale, 1.0]
+
+
+def _setup(monkeypatch, tmp_path, remote: pd.DataFrame, cached_rows: int):
+    """本地倉庫先放（未還原的）前 cached_rows 根；_fetch 回傳 remote 在 start 之後的部分"""
+    store = OHLCVStore(str(tmp_path))
+    monkeypatch.setattr(history, "STORE", store)
+    calls = []
+
+    def fetch(tk, start):
+        calls.append(pd.Timestamp(start))
+        return remote[remote.index >= pd.Timestamp(start)]
+
+    monkeypatch.setattr(history, "_fetch", fetch)
+    store.replace("2330.TW", _bars("2024-01-01", cached_rows))
+    return store, calls
+
+
+def test_top_up_appends_without_drift(monkeypatch, tmp_path):
+    remote = _bars("2024-01-01", 60)
+    store, calls = _setup(monkeypatch, tmp_path, remote, 50)
+    df = history._top_up("2330.TW", store.read("2330.TW"), remote.index[0].date())
+    assert len(calls) == 1  # 只補抓尾端
+    pd.testing.assert_frame_equal(df, remote, check_freq=False, check_index_type=False)
+
+
+def test_top_up_rebuilds_on_adjusted_prices(monkeypatch, tmp_path):
+    remote = _bars("2024-01-01", 60, scale=0.9)  # 除權息：整段還原價下修 10%
+    store, calls = _setup(monkeypatch, tmp_path, remote, 50)
+    df = history._top_up("2330.TW", store.read("2330.TW"), remote.index[0].date())
+    assert len(calls) == 2 and calls[1] == remote.index[0]  # 偵測到位移 → 從 since 整檔重抓
+    pd.testing.assert_frame_equal(df, remote, check_freq=False, check_index_type=False)
+    pd.testing.assert_frame_equal(store.read("2330.TW"), remote, check_freq=False, check_index_type=False)
+
+
+def test_top_up_ignores_changed_last_bar(monkeypatch, tmp_path):
+    remote = _bars("2024-01-01", 60)
+    remote.iloc[49, remote.columns.get_loc("Close")] += 5  # 本地最後一根是盤中 K 棒
+    store, calls = _setup(monkeypatch, tmp_path, remote, 50)
+    df = history._top_up("2330.TW", store.read("2330.TW"), remote.index[0].date())
+    assert len(calls) == 1
+    assert df["Close"].iloc[49] == remote["Close"].iloc[49]
+
+
+def test_top_up_keeps_cached_when_rebuild_fails(monkeypatch, tmp_path):
+    remote = _bars("2024-01-01", 60, scale=0.9)
+    store, calls = _setup(monkeypatch, tmp_path, remote, 50)
+    cached = store.read("2330.TW")
+
+    def fetch(tk, start):
+        calls.append(pd.Timestamp(start))
+        return remote[remote.index >= pd.Timestamp(start)] if len(calls) == 1 else remote.iloc[:0]
+
+    monkeypatch.setattr(history, "_fetch", fetch)
+    df = history._top_up("2330.TW", cached, remote.index[0].date())
+    assert len(calls) == 2
+    # 不可把還原後的新 K 棒接在未還原的舊資料上，也不記 checked（下次再試）
+    pd.testing.assert_frame_equal(df, cached)
+    pd.testing.assert_frame_equal(store.read("2330.TW"), cached)
+    assert "checked" not in store.meta("2330.TW")
+
+
+def _warm(monkeypatch, remote: pd.DataFrame):
+    monkeypatch.setattr(history, "download_bulk", lambda tickers, since, **kw: ({"2330.TW": remote}, []))
+    return history.warm_store(["2330.TW"], months=6)
+
+
+def test_warm_store_appends_when_prices_match(monkeypatch, tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    monkeypatch.setattr(history, "STORE", store)
+    store.replace("2330.TW", _bars("2024-01-01", 50))
+    store.set_meta("2330.TW", since="2000-01-01")
+    _warm(monkeypatch, _bars("2024-01-01", 60).iloc[40:])
+    pd.testing.assert_frame_equal(store.read("2330.TW"), _bars("2024-01-01", 60),
+                                  check_freq=False, check_index_type=False)
+    assert store.meta("2330.TW")["since"] == "2000-01-01"
+
+
+def test_warm_store_rebuilds_on_adjusted_prices(monkeypatch, tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    monkeypatch.setattr(history, "STORE", store)
+    store.replace("2330.TW", _bars("2024-01-01", 50))
+    store.set_meta("2330.TW", since="2000-01-01")
+    remote = _bars("2024-01-01", 60, scale=0.9).iloc[40:]  # 除權息後的還原價
+    _warm(monkeypatch, remote)
+    # 不混用兩種價位：整檔改為這次下載的區間，涵蓋起點也跟著縮短
+    pd.testing.assert_frame_equal(store.read("2330.TW"), remote, check_freq=False, check_index_type=False)
+    assert store.meta("2330.TW")["since"] > "2000-01-01"
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from job_scheduler import JobScheduler, RateLimited
+
+
+def _job(log: list, name: str, gate: asyncio.Event):
+    async def make():
+        log.append(f"start {name}")
+        await gate.wait()
+        log.append(f"end {name}")
+        return name
+    return make
+
+
+def test_weighted_jobs_start_in_arrival_order():
+    """排頭的 weight 2 等名額時，後到的 weight 1 即使有空名額也不插隊"""
+    async def go():
+        s, log = JobScheduler(workers=2), []
+        gates = {n: asyncio.Event() for n in "abc"}
+        positions = []
+
+        async def queued(pos):
+            positions.append(pos)
+
+        a = asyncio.ensure_future(s.submit("a", _job(log, "a", gates["a"])))
+        b = asyncio.ensure_future(s.submit("b", _job(log, "b", gates["b"]), weight=2, on_queued=queued))
+        c = asyncio.ensure_future(s.submit("c", _job(log, "c", gates["c"]), on_queued=queued))
+        await asyncio.sleep(0.01)
+        assert log == ["start a"] and s.queue_depth() == 2 and positions == [1, 2]
+        gates["c"].set()
+        gates["a"].set()
+        await asyncio.sleep(0.01)
+        assert log == ["start a", "end a", "start b"]
+        gates["b"].set()
+        assert await asyncio.gather(a, b, c) == ["a", "b", "c"]
+        assert log[-2:] == ["start c", "end c"] and s._running == 0
+
+    asyncio.run(go())
+
+
+def test_weight_is_capped_at_budget():
+    async def go():
+        s = JobScheduler(workers=2)
+        assert await asyncio.wait_for(s.submit("big", lambda: asyncio.sleep(0, "ok"), weight=8), 1) == "ok"
+
+    asyncio.run(go())
+
+
+def test_same_key_runs_once():
+    async def go():
+        s, calls = JobScheduler(), []
+
+        async def make():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        got = await asyncio.gather(s.submit("k", make), s.submit("k", make))
+        assert got == [1, 1] and len(calls) == 1 and not s.inflight("k")
+
+    asyncio.run(go())
+
+
+def test_rate_limit_per_window():
+    s = JobScheduler(rate=2, window=60)
+    s.admit(1)
+    s.admit(1)
+    with pytest.raises(RateLimited) as e:
+        s.admit(1)
+    assert 0 < e.value.retry_after <= 60
+    s.admit(2)  # 其他使用者不受影響
+
+
+def test_per_user_concurrency_and_charge():
+    async def go():
+        s, gate = JobScheduler(per_user=1, rate=1), asyncio.Event()
+        first = asyncio.ensure_future(s.submit("a", _job([], "a", gate), user=7))
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimited) as e:
+            await s.submit("b", _job([], "b", gate), user=7)
+        assert e.value.retry_after is None
+        gate.set()
+        await first
+        # 已准入指令的後續工作不再限流（視窗內已用掉 1 次）
+        assert await s.submit("c", _job([], "c", gate), user=7, charge=False) == "c"
+        with pytest.raises(RateLimited):
+            await s.submit("d", _job([], "d", gate), user=7)
+
+    asyncio.run(go())
+
+
+def test_timeout_cancels_job_and_frees_slot():
+    async def go():
+        s, cancelled = JobScheduler(workers=1), []
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with pytest.raises(asyncio.TimeoutError):
+            await s.submit("slow", slow, user=1, timeout=0.02)
+        assert cancelled and s._running == 0 and not s._active
+        assert await s.submit("next", lambda: asyncio.sleep(0, "ok")) == "ok"
+
+    asyncio.run(go())
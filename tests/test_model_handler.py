@@ -0,0 +1,32 @@
+import pytest
+
+from model_handler import DEFAULT_PROB, DEFAULT_RSI, _parse
+
+
+def test_defaults_and_dedup():
+    assert _parse(["2330", "0050", "2330"]) == (["2330", "0050"], DEFAULT_PROB, DEFAULT_RSI)
+
+
+def test_thresholds_in_order():
+    assert _parse(["2330", "0.6", "40"]) == (["2330"], 0.6, 40)
+
+
+def test_percent_probability():
+    codes, prob, _ = _parse(["2330", "65"])
+    assert codes == ["2330"] and prob == pytest.approx(0.65)
+
+
+@pytest.mark.parametrize("none", ["none", "None", "-", "無"])
+def test_no_rsi_limit(none):
+    assert _parse(["00878", "0.55", none]) == (["00878"], 0.55, None)
+    assert _parse(["00632r", none]) == (["00632R"], DEFAULT_PROB, None)
+
+
+@pytest.mark.parametrize("tokens", [
+    ["2330", "0.6", "40", "1"],  # 門檻太多
+    ["2330", "none", "0.6", "40"],  # none 已取代 RSI 門檻
+    ["2330", "abc"],  # 無法辨識
+])
+def test_rejects_bad_input(tokens):
+    with pytest.raises(ValueError):
+        _parse(tokens)
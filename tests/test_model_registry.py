@@ -0,0 +1,80 @@
+import numpy as np
+import lightgbm as lgb
+from sklearn.metrics import accuracy_score
+
+from model_registry import ModelRegistry, INCR_ROUNDS, N_ROUNDS, feature_key
+
+FEATS = ["a", "b", "c"]
+HORIZON = 5
+
+
+def _data(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, len(FEATS)))
+    y = (X[:, 0] + rng.normal(scale=1.0, size=n) > 0).astype(int)
+    dates = np.datetime64("2024-01-01") + np.arange(n).astype("timedelta64[D]")
+    return dates, X, y
+
+
+def _held_out_acc(reg: ModelRegistry, code: str, dates, X, y) -> float:
+    booster, meta = reg._load(code, feature_key(FEATS, HORIZON))
+    held = (dates > np.datetime64(meta["train_end"])) & (dates <= np.datetime64(meta["full_date"]))
+    return accuracy_score(y[held], booster.predict(X[held]) > 0.5)
+
+
+def test_same_day_reuses_model(tmp_path):
+    reg = ModelRegistry(str(tmp_path))
+    dates, X, y = _data(400)
+    first = reg.predict("T", FEATS, dates, X, y, horizon=HORIZON)
+    again = reg.predict("T", FEATS, dates, X, y, horizon=HORIZON)
+    assert first == again
+
+
+def test_incremental_days_keep_held_out_unseen(tmp_path):
+    reg = ModelRegistry(str(tmp_path))
+    dates, X, y = _data(406)
+    n0 = 400
+    reg.predict("T", FEATS, dates[:n0], X[:n0], y[:n0], horizon=HORIZON)
+    booster, meta = reg._load("T", feature_key(FEATS, HORIZON))
+    assert booster.num_trees() == N_ROUNDS
+    held_end = meta["full_date"]
+
+    probs = []
+    for n in range(n0 + 1, len(dates) + 1):
+        acc, prob = reg.predict("T", FEATS, dates[:n], X[:n], y[:n], horizon=HORIZON)
+        probs.append(prob)
+        booster, meta = reg._load("T", feature_key(FEATS, HORIZON))
+        # held-out 段固定不動，準確率以續訓後模型重算且不會因偷看答案而衝高
+        assert meta["full_date"] == held_end
+        assert acc == _held_out_acc(reg, "T", dates[:n], X[:n], y[:n])
+        assert acc < 0.95
+    # 標籤越過 held-out 之後，每個新交易日續訓一次
+    assert booster.num_trees() == N_ROUNDS + INCR_ROUNDS * (len(dates) - n0 - HORIZON)
+    assert all(0.0 <= p <= 1.0 for p in probs)
+
+
+def test_incremental_rows_exclude_held_out(tmp_path, monkeypatch):
+    reg = ModelRegistry(str(tmp_path))
+    dates, X, y = _data(406)
+    reg.predict("T", FEATS, dates[:400], X[:400], y[:400], horizon=HORIZON)
+    _, meta = reg._load("T", feature_key(FEATS, HORIZON))
+    train_end, full_date = np.datetime64(meta["train_end"]), np.datetime64(meta["full_date"])
+
+    seen = []
+    real_dataset = lgb.Dataset
+
+    def spy(data, label=None, **kw):
+        seen.append(np.asarray(data))
+        return real_dataset(data, label, **kw)
+
+    monkeypatch.setattr(lgb, "Dataset", spy)
+    # 400 → 405：最後一個已揭曉標籤日仍在 held-out 內 → 不續訓
+    reg.predict("T", FEATS, dates[:405], X[:405], y[:405], horizon=HORIZON)
+    assert not seen
+    # 400 → 406：已揭曉標籤越過 held-out → 續訓，但 held-out 列不可進訓練
+    reg.predict("T", FEATS, dates, X, y, horizon=HORIZON)
+    assert len(seen) == 1
+    rows = {tuple(r) for r in seen[0]}
+    held = (dates > train_end) & (dates <= full_date)
+    assert not any(tuple(r) in rows for r in X[held])
+    assert tuple(X[0]) in rows and tuple(X[len(dates) - HORIZON - 1]) in rows
@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import news_handler as nh
+
+RSS = b"""<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>
+<item><title>A</title><link>https://example.com/a</link></item>
+<item><title>B</title><link>https://example.com/b</link></item>
+</channel></rss>"""
+
+
+@pytest.fixture
+def feeds(monkeypatch):
+    """假 session：記錄每次請求的 headers；ETag 不變時回 304"""
+    calls = []
+
+    def get(url, headers, timeout):
+        calls.append(headers)
+        if "fail" in url:
+            raise ConnectionError(url)
+        if headers.get("If-None-Match") == '"v1"':
+            return SimpleNamespace(status_code=304, content=b"", headers={}, raise_for_status=lambda: None)
+        return SimpleNamespace(status_code=200, content=RSS, headers={"ETag": '"v1"'},
+                               raise_for_status=lambda: None)
+
+    monkeypatch.setattr(nh._session, "get", get)
+    nh._NEWS.clear()
+    nh._VALIDATORS.clear()
+    yield calls
+    nh._NEWS.clear()
+    nh._VALIDATORS.clear()
+
+
+def test_result_cache_and_conditional_get(feeds):
+    items = [("A", "https://example.com/a"), ("B", "https://example.com/b")]
+    assert nh._fetch_google("台積電") == items
+    assert nh._fetch_google("台積電") == items  # 結果快取命中，不再請求
+    assert len(feeds) == 1
+
+    assert nh._fetch_google("台積電", max_items=1) == items[:1]  # 不同筆數另算，但 feed 未變 → 304
+    assert feeds[1] == {"If-None-Match": '"v1"'}
+
+
+def test_failed_feed_yields_nothing(feeds):
+    got = asyncio.run(nh._fetch_many(("台積電", None, 10), ("fail", None, 10)))
+    assert [t for t, _ in got] == ["A", "B"]
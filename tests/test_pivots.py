@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from pivots import scan_panel, last_valid
+
+PATTERNS = ["wbottom", "mtop", "hs", "ihs", "triangle", "flag", "box"]
+
+
+def _panel(n: int = 120, m: int = 8, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vol = np.where(np.arange(m) % 2, 0.002, 0.03)  # 奇數欄幾乎不動 → 箱型／旗型
+    close = 100 * np.exp(np.cumsum(rng.normal(size=(n, m)) * vol, axis=0))
+    high = close * (1 + rng.uniform(0, 0.005, (n, m)))
+    low = close * (1 - rng.uniform(0, 0.005, (n, m)))
+    return high, low, close
+
+
+def _ragged(lags):
+    high, low, close = _panel(m=len(lags))
+    for j, lag in enumerate(lags):
+        if lag:
+            for a in (high, low, close):
+                a[-lag:, j] = np.nan
+    return high, low, close
+
+
+def test_last_valid():
+    close = np.array([[1.0, 1.0, np.nan], [2.0, np.nan, np.nan], [3.0, np.nan, np.nan]])
+    np.testing.assert_array_equal(last_valid(close), [3.0, 1.0, np.nan])
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_ragged_last_date_matches_own_series(pattern):
+    lags = [0, 1, 0, 2, 0, 3, 1, 0]
+    high, low, close = _ragged(lags)
+    hit, score, neck = scan_panel(pattern, high, low, close)
+    n = len(close)
+    for j, lag in enumerate(lags):
+        cols = slice(j, j + 1)
+        h, s, k = scan_panel(pattern, high[:n - lag, cols], low[:n - lag, cols], close[:n - lag, cols])
+        assert hit[j] == h[0], (pattern, j)
+        assert score[j] == pytest.approx(s[0], nan_ok=True)
+        assert neck[j] == pytest.approx(k[0], nan_ok=True)
+
+
+def test_lagging_column_can_still_hit():
+    high, low, close = _ragged([0, 1, 0, 2])
+    hit, _, neck = scan_panel("box", high, low, close)
+    assert hit[1] and hit[3]
+    np.testing.assert_allclose(neck[[1, 3]], last_valid(close)[[1, 3]])
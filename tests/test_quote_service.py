@@ -0,0 +1,76 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import quote_service
+import stock_info_handler
+from quote_service import QuoteService
+
+
+def _fake_batch(monkeypatch, quotes: dict):
+    """假 _batch_quotes：記錄每次批次的代碼，只回傳 quotes 裡有的"""
+    batches = []
+
+    def batch(tickers):
+        batches.append(list(tickers))
+        return {tk: quotes[tk] for tk in tickers if tk in quotes}
+
+    monkeypatch.setattr(quote_service, "_batch_quotes", batch)
+    return batches
+
+
+def test_requests_in_window_share_one_batch(monkeypatch):
+    batches = _fake_batch(monkeypatch, {"2330.TW": (1000.0, 990.0), "AAPL": (200.0, 198.0)})
+    svc = QuoteService(window=0.02)
+
+    async def go():
+        return await asyncio.gather(svc.get("2330.TW"), svc.get("aapl"), svc.get("2330.TW"))
+
+    assert asyncio.run(go()) == [(1000.0, 990.0), (200.0, 198.0), (1000.0, 990.0)]
+    assert batches == [["2330.TW", "AAPL"]]
+
+
+def test_cached_quote_skips_batch(monkeypatch):
+    batches = _fake_batch(monkeypatch, {"2330.TW": (1000.0, 990.0)})
+    svc = QuoteService(window=0.01)
+
+    async def go():
+        await svc.get("2330.TW")
+        return await svc.get("2330.TW")
+
+    assert asyncio.run(go()) == (1000.0, 990.0)
+    assert len(batches) == 1
+
+
+def test_max_batch_flushes_early(monkeypatch):
+    batches = _fake_batch(monkeypatch, {tk: (1.0, 1.0) for tk in "ABCDE"})
+    svc = QuoteService(window=10, max_batch=2)
+
+    async def go():
+        return await asyncio.wait_for(svc.get_many(list("ABCD")), 1)
+
+    assert len(asyncio.run(go())) == 4
+    assert batches == [["A", "B"], ["C", "D"]]
+
+
+def test_missing_quote_is_per_ticker_error(monkeypatch):
+    _fake_batch(monkeypatch, {"AAPL": (200.0, 198.0)})
+    svc = QuoteService(window=0.01)
+    res = asyncio.run(svc.get_many(["AAPL", "NOPE"]))
+    assert res["AAPL"] == (200.0, 198.0)
+    assert isinstance(res["NOPE"], LookupError)
+
+
+def test_price_cmd_guards_each_row(monkeypatch):
+    quotes = {"A": (10.0, 8.0), "B": (10.0, 0.0), "C": (10.0, float("nan")),
+              "D": (float("nan"), 8.0), "E": LookupError("E")}
+    monkeypatch.setattr(stock_info_handler, "_norm", str.upper)
+    monkeypatch.setattr(stock_info_handler.QUOTES, "get_many",
+                        AsyncMock(side_effect=lambda tks: {tk: quotes[tk] for tk in tks}))
+    u, c = MagicMock(), MagicMock()
+    u.message.reply_text = AsyncMock()
+    c.args = list("ABCDE")
+    asyncio.run(stock_info_handler.price_cmd(u, c))
+    lines = u.message.reply_text.call_args.args[0].split("\n")
+    assert lines[0] == "\U0001f4b9 A 現價 10.00 (+2.00, +25.00%)"
+    assert lines[1] == lines[2].replace("C", "B") == "\U0001f4b9 B 現價 10.00（無昨收）"
+    assert lines[3].startswith("❌ D") and lines[4].startswith("❌ E")
@@ -0,0 +1,101 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from telegram import Update
+
+import top10_handler as th
+from update_processor import ChatOrderedProcessor
+
+
+@pytest.fixture
+def scan(monkeypatch):
+    """假掃描：約 2 秒，每 10ms 檢查一次取消"""
+    state = {"cancelled": False}
+
+    async def fake_scan(progress):
+        for _ in range(200):
+            if progress.cancel.is_set():
+                state["cancelled"] = True
+                return None
+            await asyncio.sleep(0.01)
+        return {"ts": "2026-10-16T14:00:00", "rows": []}
+
+    monkeypatch.setattr(th, "_scan", fake_scan)
+    monkeypatch.setattr(th, "_load_snapshot", lambda: None)
+    monkeypatch.setattr(th, "PROGRESS_EVERY", 0.02)
+    monkeypatch.setattr(th, "_running", None)
+    monkeypatch.setattr(th, "_progress", None)
+    return state
+
+
+def _context(sent: list):
+    c = MagicMock()
+    c.args = []
+    c.application.create_task = lambda coro, update=None: asyncio.ensure_future(coro)
+
+    async def send_message(chat, text, **kw):
+        m = MagicMock()
+        m.chat_id, m.message_id = chat, len(sent) + 1
+        m.edit_text = AsyncMock()
+        sent.append((m, kw))
+        return m
+    c.bot.send_message = send_message
+    return c
+
+
+def _command(user: int, chat: int):
+    u = MagicMock(spec=Update)
+    u.effective_user.id, u.effective_chat.id = user, chat
+    u.callback_query = None
+    u.message.text = "/top10"
+    return u
+
+
+def _button(user: int, chat: int, message_id: int):
+    u = MagicMock(spec=Update)
+    u.effective_user.id, u.effective_chat.id = user, chat
+    u.message = None
+    q = u.callback_query
+    q.from_user.id, q.message.chat.id, q.message.message_id = user, chat, message_id
+    q.answer = AsyncMock()
+    return u, q
+
+
+def test_starter_can_cancel_while_scan_runs_in_same_chat(scan):
+    async def main():
+        sent = []
+        c = _context(sent)
+        p = ChatOrderedProcessor(4, exempt=())  # /top10 也排序：取消仍須立即生效
+        await asyncio.wait_for(p.process_update(_command(1, 100), th.top10_cmd(_command(1, 100), c)), 1)
+        assert not th._running.done()
+        u, q = _button(1, 100, sent[0][0].message_id)
+        await asyncio.wait_for(p.process_update(u, th.top10_cancel_cb(u, c)), 1)
+        q.answer.assert_awaited_with("已送出取消")
+        assert await asyncio.wait_for(th._running, 1) is None
+        await asyncio.sleep(0.05)
+        return sent
+    sent = asyncio.run(main())
+    assert scan["cancelled"]
+    assert sent[0][1]["reply_markup"] is th._CANCEL_KB
+    sent[0][0].edit_text.assert_awaited_with("🛑 掃描已取消")
+
+
+def test_other_user_only_stops_waiting(scan):
+    async def main():
+        sent = []
+        c = _context(sent)
+        await th.top10_cmd(_command(1, 100), c)
+        await th.top10_cmd(_command(2, 200), c)
+        u, q = _button(2, 200, sent[1][0].message_id)
+        await th.top10_cancel_cb(u, c)
+        q.answer.assert_awaited_with("已停止等待，掃描仍會繼續")
+        await asyncio.sleep(0.1)
+        assert not th._running.done()
+        th._progress.cancel.set()
+        await th._running
+        await asyncio.sleep(0.05)
+        return sent
+    sent = asyncio.run(main())
+    assert sent[1][1]["reply_markup"] is th._LEAVE_KB
+    assert sent[1][0].edit_text.await_args.args[0].startswith("🔕")
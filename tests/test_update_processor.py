@@ -0,0 +1,92 @@
+import asyncio
+import datetime as dt
+
+import pytest
+from telegram import CallbackQuery, Chat, Message, Update, User
+
+from update_processor import ChatOrderedProcessor, _command
+
+_USER = User(1, "u", False)
+
+
+def _msg(chat: int, text: str, uid: int = 1) -> Update:
+    m = Message(uid, dt.datetime.now(dt.timezone.utc), Chat(chat, "private"), from_user=_USER, text=text)
+    return Update(uid, message=m)
+
+
+def _cb(chat: int, uid: int = 99) -> Update:
+    m = Message(uid, dt.datetime.now(dt.timezone.utc), Chat(chat, "private"), from_user=_USER, text="x")
+    return Update(uid, callback_query=CallbackQuery(str(uid), _USER, "ci", message=m, data="top10_cancel"))
+
+
+async def _job(log: list, tag: str, delay: float):
+    log.append(("start", tag))
+    await asyncio.sleep(delay)
+    log.append(("end", tag))
+
+
+def test_command_name():
+    assert _command("/price 2330") == "price"
+    assert _command("/Top10@radar_bot refresh") == "top10"
+    assert _command("/") is None and _command("/ ") is None
+    assert _command("2330") is None and _command(None) is None
+
+
+def test_same_chat_in_order_other_chats_not_blocked():
+    async def main():
+        p, log = ChatOrderedProcessor(4), []
+        tasks = [asyncio.create_task(p.process_update(_msg(1, f"/price {i}", i), _job(log, f"a{i}", 0.03)))
+                 for i in range(3)]
+        await asyncio.sleep(0.005)
+        tasks.append(asyncio.create_task(p.process_update(_msg(2, "/fund"), _job(log, "b", 0.0))))
+        await asyncio.gather(*tasks)
+        return log, p
+    log, p = asyncio.run(main())
+    starts = [tag for ev, tag in log if ev == "start"]
+    assert [t for t in starts if t.startswith("a")] == ["a0", "a1", "a2"]
+    assert log.index(("end", "b")) < log.index(("end", "a0"))  # 其他聊天室不受影響
+    for i in range(2):  # 同一聊天室不重疊
+        assert log.index(("end", f"a{i}")) < log.index(("start", f"a{i + 1}"))
+    assert not p._locks and not p._waiting
+
+
+@pytest.mark.parametrize("update", [_cb(1), _msg(1, "/top10", 7)])
+def test_callbacks_and_long_commands_skip_chat_order(update):
+    async def main():
+        p, log = ChatOrderedProcessor(4), []
+        slow = asyncio.create_task(p.process_update(_msg(1, "/price 2330"), _job(log, "slow", 0.1)))
+        await asyncio.sleep(0.005)
+        await p.process_update(update, _job(log, "fast", 0.0))
+        assert not slow.done()
+        await slow
+        return log
+    log = asyncio.run(main())
+    assert log.index(("end", "fast")) < log.index(("end", "slow"))
+
+
+def test_long_command_does_not_hold_chat():
+    async def main():
+        p, log = ChatOrderedProcessor(4), []
+        long = asyncio.create_task(p.process_update(_msg(1, "/model 2330"), _job(log, "model", 0.1)))
+        await asyncio.sleep(0.005)
+        await p.process_update(_msg(1, "/price 2330", 2), _job(log, "price", 0.0))
+        await long
+        return log
+    log = asyncio.run(main())
+    assert log.index(("end", "price")) < log.index(("end", "model"))
+
+
+def test_concurrency_limit():
+    async def main():
+        p, running, peak = ChatOrderedProcessor(2), [0], [0]
+
+        async def job():
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+
+        await asyncio.gather(*(p.process_update(_msg(c, "/price"), job()) for c in range(6)),
+                             *(p.process_update(_cb(c, 100 + c), job()) for c in range(3)))
+        return peak[0]
+    assert asyncio.run(main()) == 2
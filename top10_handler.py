@@ -3,14 +3,37 @@ top10_handler.py
 ----------------
 Telegram 指令 /top10
 執行 AI 模型 → 回傳勝率前十名股票的表格
+
+- 每個交易日收盤後由 JobQueue 排程掃描一次並存成快照
+- /top10 直接回傳快照（附更新時間）；快照過期時背景重算
+- /top10 refresh 可手動重算；同一時間只會有一個掃描在跑
+- 等待掃描時定期更新訊息：進度 + 目前暫列前 10 名；發起掃描的人可按鈕取消，
+  其他一起等待的人按鈕只會停止等待（掃描照常進行）
 """
-import asyncio, pandas as pd
-from telegram import Update
-from telegram.ext import ContextTypes
+import asyncio, json, logging, os, threading
+import datetime as dt
+import pandas as pd
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+from telegram.ext import Application, ContextTypes
 from TG_notifier import send_text
-from ai_top10 import analyze_market
+from ai_top10 import Leaderboard, ScanEvent, default_workers, iter_market, passes
+from market_clock import TZ_TAIPEI, now_tw
+from job_scheduler import JOBS, RateLimited
+from metrics import JOB_SECONDS
+from utils import CACHE_DIR
 
 _TABLE_HDR = ("代碼", "準確率", "機率", "RSI14", "收盤")
+SNAPSHOT = os.path.join(CACHE_DIR, "top10.json")
+RUN_AT = dt.time(14, 0, tzinfo=TZ_TAIPEI)  # TWSE 13:30 收盤，預留盤後資料更新時間
+
+PROGRESS_EVERY = 3.0  # 進度訊息更新間隔（秒）
+TOP10_DEADLINE = float(os.environ.get("TOP10_DEADLINE", 1800))  # 全市場掃描上限（秒），逾時中止
+_CANCEL_KB = InlineKeyboardMarkup([[InlineKeyboardButton("🛑 取消掃描", callback_data="top10_cancel")]])
+_LEAVE_KB = InlineKeyboardMarkup([[InlineKeyboardButton("🔕 停止等待", callback_data="top10_cancel")]])
+
+_running: "asyncio.Task | None" = None
+_progress: "ScanProgress | None" = None
 
 def _fmt_pct(x: float) -> str:
     return f"{x * 100:.1f}%"
@@ -27,10 +50,201 @@ def _df_to_markdown(df: pd.DataFrame) -> str:
             f"{r.code} | {_fmt_pct(r.acc)} | {_fmt_pct(r.prob)} | {r.rsi:.1f} | {r.close:,.2f}")
     return "\n".join(lines)
 
+# ---------- 快照 ----------
+def _save_snapshot(df: pd.DataFrame) -> dict:
+    snap = {"ts": now_tw().isoformat(timespec="seconds"), "rows": df.to_dict("records")}
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = SNAPSHOT + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(snap, fh, ensure_ascii=False, default=float)
+    os.replace(tmp, SNAPSHOT)
+    return snap
+
+def _load_snapshot() -> dict | None:
+    try:
+        with open(SNAPSHOT, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def _last_due() -> dt.datetime:
+    """最近一次應該已完成排程掃描的時間"""
+    now = now_tw()
+    d = now.date() if now.timetz() >= RUN_AT else now.date() - dt.timedelta(days=1)
+    while d.weekday() >= 5:
+        d -= dt.timedelta(days=1)
+    return dt.datetime.combine(d, RUN_AT)
+
+def _is_stale(snap: dict) -> bool:
+    return dt.datetime.fromisoformat(snap["ts"]) < _last_due()
+
+def _snapshot_text(snap: dict) -> str:
+    text = _df_to_markdown(pd.DataFrame(snap["rows"]))
+    return f"{text}\n\n🕒 更新時間：{snap['ts'][:16].replace('T', ' ')}"
+
+# ---------- 掃描（合併重複請求、可取消） ----------
+class ScanProgress:
+    """進行中掃描的共享狀態：由掃描執行緒寫入、handler 讀取"""
+
+    def __init__(self, starter: int | None = None):
+        self.starter = starter   # 發起掃描的使用者；排程／背景更新為 None（無人可取消）
+        self.detached: set[tuple[int, int]] = set()  # 已停止等待的（chat, 訊息）
+        self.stage = "download"
+        self.done = 0
+        self.total = 0
+        self.board = Leaderboard(10)
+        self.cancel = threading.Event()
+        self.queued = 0          # 排隊位置（0 = 已開始）
+        self.timed_out = False
+
+    def update(self, ev: ScanEvent) -> None:
+        self.stage, self.done, self.total = ev.stage, ev.done, ev.total
+        if ev.row is not None and passes(ev.row):
+            self.board.push(ev.row)
+
+    def text(self) -> str:
+        if self.queued:
+            return f"⏳ 全市場掃描排隊中，前面還有 {self.queued - 1} 個工作…"
+        label = "下載日 K" if self.stage == "download" else "模型預測"
+        lines = [f"⏳ 正在分析全市場…（{label} {self.done}/{self.total or '?'}）"]
+        rows = self.board.rows()
+        if rows:
+            lines += ["", f"*目前暫列前 {len(rows)} 名*", " | ".join(_TABLE_HDR), " | ".join(["---"] * len(_TABLE_HDR))]
+            lines += [f"{r['code']} | {_fmt_pct(r['acc'])} | {_fmt_pct(r['prob'])} | {r['rsi']:.1f} | {r['close']:,.2f}"
+                      for r in rows]
+        return "\n".join(lines)
+
+def _workers() -> int:
+    """訓練 process pool 的行程數：計入 HEAVY_WORKERS 預算，不超過總預算"""
+    return max(1, min(default_workers(), JOBS.workers))
+
+def _run_scan(progress: ScanProgress, workers: int) -> pd.DataFrame | None:
+    """執行緒內消費串流；取消時關閉 generator（停止下載、終止訓練子行程）"""
+    events = iter_market(workers=workers, threads=workers)  # 子行程數與 LightGBM 執行緒都不超過佔用的名額
+    try:
+        for ev in events:
+            progress.update(ev)
+            if progress.cancel.is_set():
+                return None
+    finally:
+        events.close()
+    return progress.board.frame()
+
+async def _scan(progress: ScanProgress) -> dict | None:
+    workers = _workers()
+
+    async def work():
+        progress.queued = 0
+        fut = asyncio.get_running_loop().run_in_executor(None, _run_scan, progress, workers)
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            progress.cancel.set()  # 逾時：通知掃描執行緒收尾（停止下載、終止訓練子行程）
+            raise
+
+    async def queued(pos: int):
+        progress.queued = pos
+
+    with JOB_SECONDS.time(job="top10"):
+        try:
+            df = await JOBS.submit("top10", work, timeout=TOP10_DEADLINE, weight=workers, on_queued=queued)
+        except asyncio.TimeoutError:
+            logging.warning("top10 scan exceeded %.0fs, cancelled", TOP10_DEADLINE)
+            progress.timed_out = True
+            df = None
+    if df is None:
+        logging.info("top10 scan cancelled at %s %d/%d", progress.stage, progress.done, progress.total)
+        return None
+    return _save_snapshot(df)
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("top10 scan failed: %r", task.exception())
+
+def refresh(starter: int | None = None) -> "asyncio.Task[dict | None]":
+    """啟動掃描；若已有掃描在跑則回傳同一個 task（取消時結果為 None）
+
+    starter：發起的使用者，只有他能取消；已有掃描在跑時沿用原本的發起者
+    """
+    global _running, _progress
+    if _running is None or _running.done():
+        _progress = ScanProgress(starter)
+        _running = asyncio.ensure_future(_scan(_progress))
+        _running.add_done_callback(_log_failure)
+    return _running
+
+async def _scheduled_job(c: ContextTypes.DEFAULT_TYPE):
+    logging.info("top10: scheduled scan started")
+    await refresh()
+
+def schedule_top10(app: Application) -> None:
+    """註冊每個交易日收盤後的掃描；需安裝 python-telegram-bot[job-queue]"""
+    if app.job_queue is None:
+        logging.warning("JobQueue 未啟用，/top10 將改為按需掃描")
+        return
+    app.job_queue.run_daily(_scheduled_job, time=RUN_AT, days=(1, 2, 3, 4, 5), name="top10")
+
 async def top10_cmd(u: Update, c: ContextTypes.DEFAULT_TYPE):
     chat_id = u.effective_chat.id
-    waiting = await c.bot.send_message(chat_id, "⏳ 正在分析全市場，請稍候…")
-    loop = asyncio.get_event_loop()
-    df = await loop.run_in_executor(None, analyze_market)
-    text = _df_to_markdown(df)
-    await waiting.edit_text(text, parse_mode="Markdown", disable_web_page_preview=True)
+    force = bool(c.args) and c.args[0].lower() == "refresh"
+    snap = None if force else _load_snapshot()
+
+    if snap is not None:
+        if _is_stale(snap):
+            refresh()  # stale-while-revalidate：先回舊快照，背景更新
+        await send_text(c, chat_id, _snapshot_text(snap), parse_mode="Markdown")
+        return
+
+    user = u.effective_user.id
+    if _running is None or _running.done():
+        try:
+            JOBS.admit(user)
+        except RateLimited as e:
+            wait = "稍後" if e.retry_after is None else f"{e.retry_after:.0f} 秒後"
+            await c.bot.send_message(chat_id, f"⏳ 請求太頻繁，請{wait}再試")
+            return
+    task = refresh(user)
+    progress = _progress
+    kb = _CANCEL_KB if progress.starter == user else _LEAVE_KB
+    waiting = await c.bot.send_message(chat_id, progress.text(), parse_mode="Markdown", reply_markup=kb)
+    # 進度輪詢可能長達 TOP10_DEADLINE：放到背景 task，handler 立即返回，
+    # 同一聊天室的取消按鈕與其他指令不必等掃描結束
+    c.application.create_task(_follow(task, progress, waiting, kb), update=u)
+
+async def _follow(task: asyncio.Task, progress: ScanProgress, waiting, kb) -> None:
+    """定期把進度寫回等待訊息，掃描結束後換成結果；該訊息按了停止等待就收手"""
+    me = (waiting.chat_id, waiting.message_id)
+    last = progress.text()
+    while not task.done():
+        await asyncio.wait({task}, timeout=PROGRESS_EVERY)
+        if me in progress.detached:
+            progress.detached.discard(me)
+            await waiting.edit_text("🔕 已停止等待，掃描仍在背景進行；完成後再輸入 /top10 查看結果")
+            return
+        text = progress.text()
+        if task.done() or text == last:
+            continue
+        try:
+            await waiting.edit_text(text, parse_mode="Markdown", reply_markup=kb)
+            last = text
+        except BadRequest as e:  # 訊息未變動等
+            logging.debug("top10 progress edit: %s", e)
+
+    snap = task.result()
+    if snap is None:
+        await waiting.edit_text("⚠️ 掃描逾時已中止，請稍後再試" if progress.timed_out else "🛑 掃描已取消")
+        return
+    await waiting.edit_text(_snapshot_text(snap), parse_mode="Markdown", disable_web_page_preview=True)
+
+async def top10_cancel_cb(u: Update, c: ContextTypes.DEFAULT_TYPE):
+    """進度訊息上的按鈕：發起者 → 中止掃描（所有等待中的使用者都會收到取消）；
+    其他人 → 只停止自己這則訊息的等待，掃描照常進行"""
+    q = u.callback_query
+    if _running is None or _running.done() or _progress is None:
+        await q.answer("目前沒有進行中的掃描")
+    elif q.from_user.id == _progress.starter:
+        _progress.cancel.set()
+        await q.answer("已送出取消")
+    else:
+        _progress.detached.add((q.message.chat.id, q.message.message_id))
+        await q.answer("已停止等待，掃描仍會繼續")
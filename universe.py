@@ -0,0 +1,43 @@
+"""
+universe.py
+-----------
+台股掃描母體：由 twstock.codes 取出上市（.TW）與上櫃（.TWO）代碼
+可依市場別、證券類別篩選，例如只取上市股票或一併納入 ETF
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Iterable, List
+
+import twstock
+
+# twstock 市場別 → Yahoo Finance 後綴
+MARKET_SUFFIX = {
+    "上市": ".TW",
+    "上市臺灣創新板": ".TW",
+    "上櫃": ".TWO",
+}
+
+
+@lru_cache(maxsize=32)
+def _load(markets: tuple[str, ...], types: tuple[str, ...]) -> tuple[str, ...]:
+    out = []
+    for code, info in twstock.codes.items():
+        suffix = MARKET_SUFFIX.get(info.market)
+        if suffix is None or info.market not in markets or info.type not in types:
+            continue
+        out.append(f"{code}{suffix}")
+    return tuple(sorted(out))
+
+
+def load_universe(
+    markets: Iterable[str] = ("上市", "上櫃"),
+    types: Iterable[str] = ("股票",),
+) -> List[str]:
+    """回傳 Yahoo 代碼清單，例如 ['1101.TW', …, '6488.TWO']"""
+    return list(_load(tuple(markets), tuple(types)))
+
+
+def code_of(ticker: str) -> str:
+    """'2330.TW' / '6488.TWO' → '2330' / '6488'"""
+    return ticker.split(".")[0]
@@ -0,0 +1,78 @@
+"""
+update_processor.py
+-------------------
+concurrent_updates 用的 update 處理器：不同聊天室並行，同一聊天室的一般訊息依到達順序處理
+（例如連續輸入 /price 與 /fund，回覆不會顛倒）
+
+不排序（直接並行）的 update：
+- callback query（inline 按鈕，如 /top10 的取消、/help 分頁）：需在該聊天室其他指令
+  進行中也能立即回應
+- exempt 中的長時間指令（預設 LONG_COMMANDS：/top10、/model、/backtest、/patternscan）：
+  可能等上數十秒到數十分鐘，排進聊天室佇列會卡住後面的 /price 等便宜指令
+- 其他非訊息 update（編輯訊息等）
+註：順序保證只在單一行程內；多個 replica 時同一聊天室的 update 可能落在不同行程
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Iterable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+LONG_COMMANDS = frozenset({"top10", "model", "backtest", "patternscan"})
+# 基底類別的 semaphore 只限制「已收到、尚未處理完」的 update 數（含排隊等聊天室鎖者），
+# 實際同時執行數由 ChatOrderedProcessor 自己的 semaphore 限制
+_BACKLOG = 4096
+
+
+def _command(text: str | None) -> str | None:
+    """'/price@bot 2330' → 'price'；非指令為 None"""
+    if not text or not text.startswith("/"):
+        return None
+    parts = text[1:].split(maxsplit=1)
+    return parts[0].split("@", 1)[0].lower() if parts else None
+
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    """同時最多執行 max_concurrent 則；同一 chat 的一般訊息同時只處理一則（見模組說明的例外）"""
+
+    def __init__(self, max_concurrent: int, exempt: Iterable[str] = LONG_COMMANDS):
+        super().__init__(max(_BACKLOG, max_concurrent))
+        self.max_concurrent = max_concurrent
+        self.exempt = frozenset(exempt)
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._waiting: dict[int, int] = {}
+
+    def _order_key(self, update: object) -> int | None:
+        """需依序處理時回傳 chat id；不需排序時 None"""
+        if not isinstance(update, Update) or update.message is None or update.effective_chat is None:
+            return None
+        if _command(update.message.text) in self.exempt:
+            return None
+        return update.effective_chat.id
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._order_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+        # 先排聊天室的鎖、輪到了才佔執行名額：排隊中的 update 不佔名額、不卡其他聊天室
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+        try:
+            async with lock:
+                async with self._slots:
+                    await coroutine
+        finally:
+            self._waiting[key] -= 1
+            if not self._waiting[key]:
+                del self._waiting[key], self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -1,3 +1,8 @@
+import os, tempfile
+
+# 本地快取根目錄（K 線、模型、圖表…），可用環境變數覆寫
+CACHE_DIR = os.environ.get("STOCKRADAR_CACHE", os.path.join(tempfile.gettempdir(), "stockradar"))
+
 def _norm(code: str) -> str:
     """將股票代碼標準化（台股加上 .TW）"""
     c = code.upper()
@@ -3,14 +3,18 @@ web_stub.py
 -----------
 1. 啟動一個極簡 HTTP 伺服器，對 GET / 與 HEAD / 皆回 200 OK
    → 滿足 Render Web Service 健康檢查
-2. 同時匯入並執行 main.run_bot()（你的 long-polling Telegram Bot）
+2. GET /metrics 回傳 Prometheus 文字格式指標（見 metrics.py）
+3. webhook 模式（設定 WEBHOOK_URL）：POST $WEBHOOK_PATH 交給 main.feed_webhook()
+4. 同時匯入並執行 main.run_bot()（你的 long-polling Telegram Bot）
 """
 
 import os
+import json
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import main  # ⬅️ main.py 內要有 run_bot() 函式，見下節
+import metrics
 
 # ---------- Tiny HTTP server ----------
 class Ping(BaseHTTPRequestHandler):
@@ -19,20 +23,47 @@ class Ping(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = metrics.render()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
         self._ok()
         self.wfile.write(b"OK")
 
     def do_HEAD(self):
         self._ok()
 
+    def do_POST(self):
+        if self.path.split("?")[0] != main.WEBHOOK_PATH:
+            return self._reply(404)
+        if main.WEBHOOK_SECRET and self.headers.get("X-Telegram-Bot-Api-Secret-Token") != main.WEBHOOK_SECRET:
+            return self._reply(403)
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            return self._reply(400)
+        # 立即回 200，實際處理在 bot 的 event loop；尚未啟動完成則請 Telegram 稍後重送
+        self._reply(200 if main.feed_webhook(payload) else 503)
+
+    def _reply(self, code: int):
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
 
 def run_http():
     port = int(os.environ.get("PORT", 10000))  # Render 會注入 $PORT
-    HTTPServer(("", port), Ping).serve_forever()
+    ThreadingHTTPServer(("", port), Ping).serve_forever()
 
 
-threading.Thread(target=run_http, daemon=True).start()
+# 以 spawn 啟動的子行程（ai_top10 訓練池）會重新匯入本檔，需避免重複啟動
+if __name__ == "__main__":
+    threading.Thread(target=run_http, daemon=True).start()
 
-# ---------- Start Telegram Bot ----------
-# main.py 中新增 run_bot()，專責 run_polling()
-main.run_bot()
+    # ---------- Start Telegram Bot ----------
+    # main.py 中的 run_bot()：long polling，或設定 WEBHOOK_URL 時改為 webhook
+    main.run_bot()